@@ -0,0 +1,102 @@
+"""Micro-benchmark of PDFAssistant's per-request setup cost.
+
+Usage, from the api directory:
+
+    python -m benchmarks.assistant_overhead [--mongo-uri mongodb://localhost:27017/] [--iterations 200]
+
+Compares rebuilding the RAG chain and a MongoDBChatMessageHistory with its own
+client on every request (the old behaviour) against reusing the compiled chain
+and a shared pooled client. When MongoDB is reachable the per-request history
+read is included, so connection set-up and index creation are part of the
+"rebuild" numbers; otherwise only the in-process construction is measured.
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_mongodb import MongoDBChatMessageHistory
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from src.assistant import PDFAssistant
+
+DB_NAME = "benchmark_assistant_overhead"
+COLLECTION_NAME = "message_history"
+
+
+def measure(operation: Callable[[], None], iterations: int) -> List[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: List[float]) -> None:
+    ordered = sorted(timings)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    print(f"{name:<34} p50 {1000 * statistics.median(timings):>9.3f} ms   p99 {1000 * p99:>9.3f} ms")
+
+
+def mongo_available(mongo_uri: str) -> bool:
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with_mongo = mongo_available(args.mongo_uri)
+    if not with_mongo:
+        print(f"MongoDB not reachable at {args.mongo_uri}: measuring construction only.\n")
+
+    # Build the assistant without running PDFAssistant.__init__, so the
+    # benchmark does not need Chroma or Ollama.
+    assistant = PDFAssistant.__new__(PDFAssistant)
+    assistant.model = FakeListChatModel(responses=["ok"])
+    assistant.mongo_db_name = DB_NAME
+    assistant.mongo_message_history_collection = COLLECTION_NAME
+    assistant.history_client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=1000)
+    assistant.chain = assistant._create_rag_chain()
+
+    def rebuild_per_request():
+        assistant._create_rag_chain()
+        history = MongoDBChatMessageHistory(
+            session_id="benchmark",
+            connection_string=args.mongo_uri,
+            database_name=DB_NAME,
+            collection_name=COLLECTION_NAME,
+            create_index=with_mongo
+        )
+        if with_mongo:
+            history.messages
+        history.close()
+
+    def reuse_shared():
+        assistant.chain
+        history = assistant._get_message_history_store("benchmark")
+        if with_mongo:
+            history.messages
+
+    report("rebuild chain + new client", measure(rebuild_per_request, args.iterations))
+    report("shared chain + pooled client", measure(reuse_shared, args.iterations))
+
+    if with_mongo:
+        assistant.history_client.drop_database(DB_NAME)
+    assistant.close()
+
+
+if __name__ == "__main__":
+    main()
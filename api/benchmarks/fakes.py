@@ -0,0 +1,444 @@
+"""Local stand-ins for Ollama and MongoDB, so benchmarks run without any server.
+
+FakeEmbeddings and FakeChatModel are deterministic and add a configurable
+latency, bounded to a number of parallel requests like a real model server.
+InMemoryMongoClient and AsyncInMemoryMongoClient implement the part of the
+pymongo API that DocumentStore, MessageHistoryStore and
+ConversationSummaryStore use. The stand-ins are passed to ComponentFactory,
+which builds everything else as the API does.
+"""
+import asyncio
+import copy
+import math
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+from pymongo.errors import DuplicateKeyError
+
+from src.keyword_index import tokenize
+
+
+class LatencyModel:
+    """Simulated server: each request waits its latency once one of parallel slots is free."""
+
+    def __init__(self, parallel: int = 1):
+        self.parallel = max(1, parallel)
+        self._thread_slots = threading.BoundedSemaphore(self.parallel)
+        self._async_slots: Dict[int, asyncio.Semaphore] = {}
+
+    def wait(self, seconds: float) -> None:
+        if seconds > 0:
+            with self._thread_slots:
+                time.sleep(seconds)
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop_id = id(asyncio.get_running_loop())
+        if loop_id not in self._async_slots:
+            self._async_slots[loop_id] = asyncio.Semaphore(self.parallel)
+        return self._async_slots[loop_id]
+
+    async def await_slot(self) -> asyncio.Semaphore:
+        slots = self._slots()
+        await slots.acquire()
+        return slots
+
+    async def async_wait(self, seconds: float) -> None:
+        if seconds > 0:
+            async with self._slots():
+                await asyncio.sleep(seconds)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: texts sharing terms are close, like with a real model.
+
+    Each call takes call_seconds plus text_seconds per text.
+    """
+
+    def __init__(self, dimensions: int = 256, call_seconds: float = 0.0, text_seconds: float = 0.0,
+                 parallel: int = 1):
+        self.dimensions = dimensions
+        self.call_seconds = call_seconds
+        self.text_seconds = text_seconds
+        self.latency = LatencyModel(parallel)
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for term in tokenize(text):
+            code = zlib.crc32(term.encode("utf-8"))
+            vector[code % self.dimensions] += 1.0 if code & 0x80000000 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else [1.0 / math.sqrt(self.dimensions)] * self.dimensions
+
+    def _seconds(self, count: int) -> float:
+        self.calls += 1
+        self.texts += count
+        return self.call_seconds + self.text_seconds * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.latency.wait(self._seconds(len(texts)))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await self.latency.async_wait(self._seconds(len(texts)))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers with answer_tokens words taken from the prompt, after first_token_seconds,
+    then one word every token_seconds. Streaming yields the words as they are "generated"."""
+
+    first_token_seconds: float = 0.0
+    token_seconds: float = 0.0
+    answer_tokens: int = 40
+    parallel: int = 1
+    _latency: Optional[LatencyModel] = PrivateAttr(default=None)
+
+    @property
+    def latency(self) -> LatencyModel:
+        if self._latency is None:
+            self._latency = LatencyModel(self.parallel)
+        return self._latency
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> List[str]:
+        words = str(messages[-1].content).split() or ["answer"]
+        start = zlib.crc32(str(messages[-1].content).encode("utf-8")) % len(words)
+        return [f"{words[(start + i) % len(words)]} " for i in range(self.answer_tokens)]
+
+    def _generation_seconds(self) -> float:
+        return self.first_token_seconds + self.token_seconds * max(0, self.answer_tokens - 1)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.latency.wait(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._answer(messages))))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await self.latency.async_wait(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._answer(messages))))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # The slot is held for the whole answer, as a model server generates one answer per slot.
+        slots = await self.latency.await_slot()
+        try:
+            for position, word in enumerate(self._answer(messages)):
+                await asyncio.sleep(self.first_token_seconds if position == 0 else self.token_seconds)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+        finally:
+            slots.release()
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+
+
+_MISSING = object()
+
+
+def _compare(value: Any, other: Any, operator: str) -> bool:
+    try:
+        if operator == "$gt":
+            return value > other
+        if operator == "$gte":
+            return value >= other
+        if operator == "$lt":
+            return value < other
+        return value <= other
+    except TypeError:
+        return False
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$ne":
+                if _matches_condition(value, operand):
+                    return False
+            elif operator == "$in":
+                if not any(_matches_condition(value, option) for option in operand):
+                    return False
+            elif operator == "$nin":
+                if any(_matches_condition(value, option) for option in operand):
+                    return False
+            elif operator == "$exists":
+                if (value is not _MISSING) != bool(operand):
+                    return False
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is _MISSING or not _compare(value, operand, operator):
+                    return False
+            else:
+                raise NotImplementedError(f"Unsupported query operator: {operator}")
+        return True
+    if condition is None:
+        return value is _MISSING or value is None
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    return all(_matches_condition(document.get(field, _MISSING), condition) for field, condition in query.items())
+
+
+def _project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    if any(value for field, value in projection.items() if field != "_id"):
+        projected = {field: document[field] for field, value in projection.items() if value and field in document}
+        if projection.get("_id", True) and "_id" in document:
+            projected["_id"] = document["_id"]
+        return projected
+    return {field: value for field, value in document.items() if projection.get(field, True)}
+
+
+def _apply_update(document: Dict[str, Any], update: Any) -> None:
+    if isinstance(update, list):
+        # Aggregation pipeline update: "$field" values refer to the document's own fields.
+        for stage in update:
+            for operator, fields in stage.items():
+                if operator == "$set":
+                    original = dict(document)
+                    for field, value in fields.items():
+                        if isinstance(value, str) and value.startswith("$"):
+                            if value[1:] in original:
+                                document[field] = copy.deepcopy(original[value[1:]])
+                        else:
+                            document[field] = copy.deepcopy(value)
+                elif operator == "$unset":
+                    for field in [fields] if isinstance(fields, str) else fields:
+                        document.pop(field, None)
+                else:
+                    raise NotImplementedError(f"Unsupported pipeline stage: {operator}")
+        return
+    for operator, fields in update.items():
+        if operator == "$set":
+            for field, value in fields.items():
+                document[field] = copy.deepcopy(value)
+        elif operator == "$unset":
+            for field in fields:
+                document.pop(field, None)
+        else:
+            raise NotImplementedError(f"Unsupported update operator: {operator}")
+
+
+class InMemoryCursor:
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self._documents = documents
+
+    def sort(self, key: str, direction: int = 1) -> "InMemoryCursor":
+        self._documents.sort(key=lambda document: document.get(key), reverse=direction < 0)
+        return self
+
+    def limit(self, count: int) -> "InMemoryCursor":
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._documents)
+
+
+class InMemoryCollection:
+    """Thread-safe list of documents answering the pymongo collection calls used by the stores."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def create_index(self, keys: Any, **kwargs: Any) -> str:
+        return str(keys)
+
+    def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        return InsertOneResult(self.insert_many([document]).inserted_ids[0])
+
+    def insert_many(self, documents: List[Dict[str, Any]]) -> InsertManyResult:
+        with self._lock:
+            existing = {document["_id"] for document in self._documents}
+            for document in documents:
+                document.setdefault("_id", ObjectId())
+                if document["_id"] in existing:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+                existing.add(document["_id"])
+                self._documents.append(copy.deepcopy(document))
+        return InsertManyResult([document["_id"] for document in documents])
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None,
+             **kwargs: Any) -> InMemoryCursor:
+        with self._lock:
+            return InMemoryCursor([
+                _project(document, projection) for document in self._documents if matches(document, query or {})
+            ])
+
+    def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for document in self._documents:
+                if matches(document, query or {}):
+                    return _project(document, projection)
+        return None
+
+    def count_documents(self, query: Dict[str, Any]) -> int:
+        with self._lock:
+            return sum(1 for document in self._documents if matches(document, query))
+
+    def _update(self, query: Dict[str, Any], update: Any, many: bool, upsert: bool) -> UpdateResult:
+        with self._lock:
+            matched = [document for document in self._documents if matches(document, query)]
+            if not many:
+                matched = matched[:1]
+            for document in matched:
+                _apply_update(document, update)
+            if matched or not upsert:
+                return UpdateResult(len(matched), len(matched))
+            document = {field: value for field, value in query.items() if not isinstance(value, dict)}
+            _apply_update(document, update)
+            document.setdefault("_id", ObjectId())
+            self._documents.append(document)
+            return UpdateResult(0, 0, document["_id"])
+
+    def update_one(self, query: Dict[str, Any], update: Any, upsert: bool = False) -> UpdateResult:
+        return self._update(query, update, many=False, upsert=upsert)
+
+    def update_many(self, query: Dict[str, Any], update: Any, upsert: bool = False) -> UpdateResult:
+        return self._update(query, update, many=True, upsert=upsert)
+
+    def _delete(self, query: Dict[str, Any], many: bool) -> DeleteResult:
+        with self._lock:
+            deleted = [document for document in self._documents if matches(document, query)]
+            if not many:
+                deleted = deleted[:1]
+            ids = {id(document) for document in deleted}
+            self._documents = [document for document in self._documents if id(document) not in ids]
+            return DeleteResult(len(deleted))
+
+    def delete_one(self, query: Dict[str, Any]) -> DeleteResult:
+        return self._delete(query, many=False)
+
+    def delete_many(self, query: Dict[str, Any]) -> DeleteResult:
+        return self._delete(query, many=True)
+
+
+class InMemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name)
+        return self._collections[name]
+
+
+class InMemoryMongoClient:
+    """Stand-in for pymongo's MongoClient, keeping every database in memory."""
+
+    def __init__(self):
+        self._databases: Dict[str, InMemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name)
+        return self._databases[name]
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncInMemoryCursor:
+    def __init__(self, cursor: InMemoryCursor):
+        self._cursor = cursor
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        documents = list(self._cursor)
+        return documents[:length] if length else documents
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        for document in self._cursor:
+            yield document
+
+
+class AsyncInMemoryCollection:
+    """AsyncMongoClient-style collection over an InMemoryCollection."""
+
+    def __init__(self, collection: InMemoryCollection):
+        self._collection = collection
+
+    def find(self, *args: Any, **kwargs: Any) -> AsyncInMemoryCursor:
+        return AsyncInMemoryCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        method = getattr(self._collection, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncInMemoryDatabase:
+    def __init__(self, database: InMemoryDatabase):
+        self._database = database
+
+    def __getitem__(self, name: str) -> AsyncInMemoryCollection:
+        return AsyncInMemoryCollection(self._database[name])
+
+
+class AsyncInMemoryMongoClient:
+    """Stand-in for pymongo's AsyncMongoClient; shares its data with client when one is given."""
+
+    def __init__(self, client: Optional[InMemoryMongoClient] = None):
+        self.sync_client = client or InMemoryMongoClient()
+
+    def __getitem__(self, name: str) -> AsyncInMemoryDatabase:
+        return AsyncInMemoryDatabase(self.sync_client[name])
+
+    async def close(self) -> None:
+        pass
+
+
+def fake_clients() -> Tuple[InMemoryMongoClient, AsyncInMemoryMongoClient]:
+    """A sync and an async client over the same in-memory databases."""
+    client = InMemoryMongoClient()
+    return client, AsyncInMemoryMongoClient(client)
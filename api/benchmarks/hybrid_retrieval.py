@@ -0,0 +1,121 @@
+"""Retrieval latency and recall of the BM25 keyword index on a synthetic corpus.
+
+Usage, from the api directory:
+
+    python -m benchmarks.hybrid_retrieval [--sizes 1000 10000 50000] [--queries 200] [--k 2]
+                                          [--dense-size 500]
+
+Every synthetic chunk mentions one unique error code (e.g. "ERR-04217") among
+generic manual text, and each query asks about one code, so the chunk holding
+it is the only relevant answer. For every corpus size the script reports index
+build throughput, BM25 search p50/p99 latency and recall@k.
+
+With --dense-size N (needs a running Ollama with the embedding model) a corpus
+of N chunks is also loaded into a temporary VectorStore and recall@k is
+compared for dense-only and hybrid (BM25 + dense fused with RRF) retrieval.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+from benchmarks.synthetic import random_paragraphs
+from src.keyword_index import KeywordIndex
+
+SESSION_ID = "benchmark"
+
+
+def build_corpus(size: int, seed: int = 0) -> Tuple[List[str], List[Document]]:
+    rng = random.Random(seed)
+    codes = [f"ERR-{code:05d}" for code in rng.sample(range(100_000), size)]
+    documents = []
+    for code, paragraph in zip(codes, random_paragraphs(rng, size, sentences=4)):
+        documents.append(Document(
+            page_content=f"{paragraph} If the display shows {code}, reset the controller.",
+            metadata={"session_id": SESSION_ID}
+        ))
+    return codes, documents
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark_keyword_index(size: int, queries: int, k: int, tmp_dir: Path) -> None:
+    codes, documents = build_corpus(size)
+    ids = [str(i) for i in range(size)]
+    index = KeywordIndex(tmp_dir / f"bm25_{size}.sqlite3")
+
+    start = time.perf_counter()
+    for position in range(0, size, 500):
+        batch = slice(position, position + 500)
+        index.add(ids[batch], documents[batch], [{SESSION_ID}] * len(ids[batch]))
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(1)
+    latencies, hits = [], 0
+    for target in rng.sample(range(size), min(queries, size)):
+        start = time.perf_counter()
+        results = index.search(f"What does {codes[target]} mean on the pump?", SESSION_ID, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(doc.id == ids[target] for doc, _ in results)
+
+    print(f"{size:>8} {size / build_seconds:>12.0f} {1000 * statistics.median(latencies):>9.2f} "
+          f"{1000 * percentile(latencies, 0.99):>9.2f} {hits / len(latencies):>9.3f}")
+    index.close()
+
+
+async def benchmark_dense_vs_hybrid(size: int, queries: int, k: int, tmp_dir: Path) -> None:
+    from src.factories import ComponentFactory
+
+    codes, documents = build_corpus(size, seed=2)
+    vector_store = ComponentFactory.create_vector_store(
+        persist_directory=str(tmp_dir / "chroma"),
+        collection_name="benchmark_hybrid",
+        chroma_client_type="persistent",
+        embedding_cache_path=None,
+        keyword_index_path=str(tmp_dir / "hybrid.sqlite3")
+    )
+    ids = await vector_store.add_document(documents)
+    keyword_index = vector_store.keyword_index
+
+    rng = random.Random(3)
+    targets = rng.sample(range(size), min(queries, size))
+    for name, index in (("dense", None), ("hybrid", keyword_index)):
+        vector_store.keyword_index = index
+        latencies, hits = [], 0
+        for target in targets:
+            start = time.perf_counter()
+            results = await vector_store.search_documents(f"What does {codes[target]} mean?", SESSION_ID, k=k)
+            latencies.append(time.perf_counter() - start)
+            hits += any(doc.id == ids[target] for doc in results)
+        print(f"{name:>8} recall@{k} {hits / len(targets):.3f}  p50 {1000 * statistics.median(latencies):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--dense-size", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'chunks':>8} {'indexed/sec':>12} {'p50 ms':>9} {'p99 ms':>9} {'recall@' + str(args.k):>9}")
+        for size in args.sizes:
+            benchmark_keyword_index(size, args.queries, args.k, Path(tmp_dir))
+
+        if args.dense_size:
+            print(f"\nDense vs hybrid on {args.dense_size} chunks:")
+            asyncio.run(benchmark_dense_vs_hybrid(args.dense_size, args.queries, args.k, Path(tmp_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Concurrent-request load test against a running API.
+
+Usage, from the api directory:
+
+    python -m benchmarks.load_test [--url http://localhost:8000] [--concurrency 1 8 32]
+                                   [--requests 200] [--endpoint documents messages chat]
+
+Each endpoint is hammered by --concurrency clients sharing --requests requests,
+and throughput plus p50/p99 latency are printed per level. Run it against the
+server before and after a change to compare. Every client uses its own
+session-id header so requests do not contend on one session's data.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+ENDPOINTS = {
+    "documents": ("GET", "/documents", None),
+    "messages": ("GET", "/messages", None),
+    "chat": ("POST", "/chat", {"message": "What is this document about?"}),
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_level(base_url: str, endpoint: str, concurrency: int, total_requests: int,
+                    timeout: float) -> Dict[str, float]:
+    method, path, payload = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors = 0
+    remaining = total_requests
+
+    async def client_loop(client: httpx.AsyncClient):
+        nonlocal remaining, errors
+        headers = {"session-id": uuid.uuid4().hex}
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=payload, headers=headers)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(1000 * statistics.median(latencies), 2),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--endpoint", nargs="+", choices=sorted(ENDPOINTS), default=["documents", "messages"])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'endpoint':>10} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint in args.endpoint:
+        for concurrency in args.concurrency:
+            result = await run_level(args.url, endpoint, concurrency, args.requests, args.timeout)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{endpoint:>10} {concurrency:>8} {result['requests_per_second']:>9} "
+                      f"{result['p50_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
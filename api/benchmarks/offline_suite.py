@@ -0,0 +1,409 @@
+"""Ingestion, retrieval and chat benchmarks that run without Ollama or MongoDB.
+
+Usage, from the api directory:
+
+    python -m benchmarks.offline_suite [--suites ingest retrieval chat] [--output results.json]
+                                       [--compare baseline.json [--max-regression 0.2]]
+                                       [--documents 20] [--pages 4] [--sizes 1000 5000 20000]
+                                       [--concurrency 1 4 16] [--chat-requests 64]
+                                       [--embed-call-ms 5] [--llm-first-token-ms 100] [--llm-token-ms 5]
+
+The components are built with ComponentFactory as the API builds them,
+except that the Ollama models are replaced by the deterministic fakes of
+benchmarks.fakes, with the configured latencies, Mongo by an in-memory
+client and the index directories by a temporary one. Everything else,
+including the vector index backend, hybrid retrieval and partitioning,
+follows the settings.
+
+- ingest: synthetic PDFs are ingested one job per document, as POST
+  /documents does, then in batches, as POST /documents/batch does.
+- retrieval: a corpus of synthetic chunks is grown to each of --sizes and
+  questions go through the assistant's retrieval (query embedding, search,
+  reranking and context packing).
+- chat: at the largest corpus, --concurrency clients share --chat-requests
+  questions through PDFAssistant.ask, which is all POST /chat does.
+
+Each run reports the mean duration of the stages it went through, from the
+stage histograms served on /metrics. Results are printed and, with
+--output, written as JSON. With --compare, the throughput and latency
+figures are compared with an earlier result file; --max-regression makes
+the script exit with status 1 when one is worse by more than that fraction.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Chroma's anonymous usage telemetry needs the network.
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import aiofiles
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, fake_clients
+from benchmarks.synthetic import random_paragraphs, random_sentence, write_synthetic_pdf
+from config.settings import settings
+from src.factories import ComponentFactory
+from src.ingestion_queue import IngestionJob, JobStage
+from src.metrics import STAGE_SECONDS
+
+SESSION_ID = "benchmark"
+FILL_BATCH_SIZE = 1000
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(1000 * statistics.median(latencies), 3),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 3),
+        "mean_ms": round(1000 * statistics.fmean(latencies), 3),
+    }
+
+
+def stage_totals() -> Dict[str, Tuple[int, float]]:
+    return {labels[0]: (sum(counts), total) for labels, (counts, total) in STAGE_SECONDS.snapshot().items()}
+
+
+def stage_summary(before: Dict[str, Tuple[int, float]]) -> Dict[str, Dict[str, float]]:
+    """Count and mean duration of every stage observed since before was taken."""
+    summary = {}
+    for stage, (count, total) in sorted(stage_totals().items()):
+        count -= before.get(stage, (0, 0.0))[0]
+        total -= before.get(stage, (0, 0.0))[1]
+        if count > 0:
+            summary[stage] = {"count": count, "mean_ms": round(1000 * total / count, 3)}
+    return summary
+
+
+class Stack:
+    """The API's components, built by ComponentFactory over fakes in a working directory."""
+
+    def __init__(self, work_dir: Path, args: argparse.Namespace):
+        self.embeddings = FakeEmbeddings(
+            dimensions=args.dimensions,
+            call_seconds=args.embed_call_ms / 1000,
+            text_seconds=args.embed_text_ms / 1000,
+            parallel=args.model_parallel
+        )
+        self.chat_model = FakeChatModel(
+            first_token_seconds=args.llm_first_token_ms / 1000,
+            token_seconds=args.llm_token_ms / 1000,
+            answer_tokens=args.answer_tokens,
+            parallel=args.model_parallel
+        )
+        mongo_client, async_mongo_client = fake_clients()
+        self.scheduler = ComponentFactory.create_model_scheduler() if args.scheduler else None
+        self.vector_store = ComponentFactory.create_vector_store(
+            persist_directory=str(work_dir / "chroma"),
+            chroma_client_type="persistent",
+            embedding_cache_path=None,
+            keyword_index_path=str(work_dir / "keyword_index" / "bm25.sqlite3") if settings.hybrid_search_enabled else None,
+            index_backend=args.backend,
+            numpy_index_dir=str(work_dir / "numpy_index"),
+            generation_path=str(work_dir / "index_generation.json"),
+            embeddings=self.embeddings,
+            scheduler=self.scheduler
+        )
+        self.document_store = ComponentFactory.create_document_store(client=async_mongo_client)
+        self.file_handler = ComponentFactory.create_file_handler(documents_dir=work_dir / "documents")
+        self.document_processor = ComponentFactory.create_document_processor()
+        self.ingestion_queue = ComponentFactory.create_ingestion_queue(
+            file_handler=self.file_handler,
+            document_processor=self.document_processor,
+            vector_store=self.vector_store,
+            document_store=self.document_store
+        )
+        self.assistant = ComponentFactory.create_assistant(
+            persist_directory=str(work_dir / "chroma"),
+            answer_cache_enabled=args.answer_cache,
+            reranker=args.reranker,
+            vector_store=self.vector_store,
+            model=self.chat_model,
+            history_client=mongo_client,
+            scheduler=self.scheduler
+        )
+
+    def close(self) -> None:
+        self.document_processor.close()
+        self.assistant.close()
+
+
+async def wait_for_jobs(jobs: List[IngestionJob]) -> None:
+    while not all(job.finished for job in jobs):
+        await asyncio.sleep(0.01)
+
+
+def ingest_result(jobs: List[IngestionJob], seconds: float, before: Dict[str, Tuple[int, float]]) -> Dict[str, Any]:
+    completed = [job for job in jobs if job.stage == JobStage.COMPLETED]
+    chunks = sum(job.progress.chunks_total for job in completed)
+    return {
+        "documents": len(jobs),
+        "failed": len(jobs) - len(completed),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(len(completed) / seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 3),
+        "stages": stage_summary(before),
+    }
+
+
+async def bench_ingest(stack: Stack, source_dir: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    await stack.ingestion_queue.start()
+    try:
+        for mode in ("single", "batch"):
+            # Each mode gets its own documents, so the second one does not just link the first one's chunks.
+            paths = [
+                write_synthetic_pdf(source_dir / f"{mode}-{position}.pdf", args.pages,
+                                    seed=args.seed * 100_000 + (0 if mode == "single" else 50_000) + position)
+                for position in range(args.documents)
+            ]
+            files = []
+            for path in paths:
+                async with aiofiles.open(path, "rb") as f:
+                    file_path, file_hash = await stack.file_handler.save_stream(f)
+                files.append((file_path, path.name, file_hash))
+
+            before = stage_totals()
+            start = time.perf_counter()
+            if mode == "single":
+                jobs = [stack.ingestion_queue.submit(file_path, filename, f"{SESSION_ID}-{mode}", file_hash=file_hash)
+                        for file_path, filename, file_hash in files]
+                await wait_for_jobs(jobs)
+            else:
+                jobs = []
+                for position in range(0, len(files), args.batch_size):
+                    batch = stack.ingestion_queue.submit_batch(files[position:position + args.batch_size],
+                                                               f"{SESSION_ID}-{mode}")
+                    jobs.extend(batch.jobs)
+                await wait_for_jobs(jobs)
+            results[mode] = ingest_result(jobs, time.perf_counter() - start, before)
+    finally:
+        await stack.ingestion_queue.stop()
+    return results
+
+
+async def fill_corpus(stack: Stack, rng: random.Random, start: int, end: int) -> None:
+    """Add chunks start..end of the synthetic corpus, without the embedding latency."""
+    call_seconds, text_seconds = stack.embeddings.call_seconds, stack.embeddings.text_seconds
+    stack.embeddings.call_seconds = stack.embeddings.text_seconds = 0.0
+    try:
+        for position in range(start, end, FILL_BATCH_SIZE):
+            count = min(FILL_BATCH_SIZE, end - position)
+            documents = [
+                Document(page_content=text, metadata={"session_id": SESSION_ID, "source": "synthetic",
+                                                      "page": (position + offset) // 10,
+                                                      "start_index": 0})
+                for offset, text in enumerate(random_paragraphs(rng, count, sentences=8))
+            ]
+            ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark/{position + offset}")) for offset in range(count)]
+            await stack.vector_store.add_document(documents, ids=ids)
+    finally:
+        stack.embeddings.call_seconds, stack.embeddings.text_seconds = call_seconds, text_seconds
+
+
+async def bench_retrieval(stack: Stack, args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    rng = random.Random(args.seed)
+    query_rng = random.Random(args.seed + 1)
+    filled = 0
+    for size in sorted(args.sizes):
+        start = time.perf_counter()
+        await fill_corpus(stack, rng, filled, size)
+        fill_seconds = time.perf_counter() - start
+        added, filled = size - filled, size
+
+        latencies = []
+        before = stage_totals()
+        for _ in range(args.queries):
+            question = random_sentence(query_rng, 8)
+            start = time.perf_counter()
+            await stack.assistant._retrieve(question, SESSION_ID)
+            latencies.append(time.perf_counter() - start)
+        results[str(size)] = {
+            "chunks": size,
+            "fill_chunks_per_second": round(added / fill_seconds, 3) if added else 0.0,
+            "queries": args.queries,
+            "queries_per_second": round(len(latencies) / sum(latencies), 3),
+            **latency_summary(latencies),
+            "stages": stage_summary(before),
+        }
+    return results
+
+
+async def bench_chat(stack: Stack, args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    rng = random.Random(args.seed + 2)
+    for concurrency in args.concurrency:
+        questions = [random_sentence(rng, 8) for _ in range(args.chat_requests)]
+        latencies: List[float] = []
+        errors = 0
+
+        async def client_loop() -> None:
+            nonlocal errors
+            while questions:
+                question = questions.pop()
+                start = time.perf_counter()
+                try:
+                    await stack.assistant.ask(question, SESSION_ID)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        before = stage_totals()
+        start = time.perf_counter()
+        await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        results[str(concurrency)] = {
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "errors": errors,
+            "requests_per_second": round(len(latencies) / elapsed, 3),
+            **latency_summary(latencies),
+            "stages": stage_summary(before),
+        }
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Throughput and latency figures by dotted path, leaving out stage details and settings."""
+    flat = {}
+    for key, value in results.items():
+        if key in ("meta", "stages"):
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and (key.endswith("_per_second") or key.endswith("_ms")):
+            flat[path] = float(value)
+    return flat
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """Print the change of every figure present in both results; False if one regressed past max_regression."""
+    old, new = flatten(previous), flatten(current)
+    ok = True
+    print(f"\n{'metric':<48} {'before':>12} {'after':>12} {'change':>9}")
+    for path in sorted(set(old) & set(new)):
+        if old[path] == 0:
+            continue
+        change = (new[path] - old[path]) / old[path]
+        # Throughput should go up, latency down.
+        regression = -change if path.endswith("_per_second") else change
+        flag = ""
+        if max_regression is not None and regression > max_regression:
+            flag = "  REGRESSED"
+            ok = False
+        print(f"{path:<48} {old[path]:>12.3f} {new[path]:>12.3f} {100 * change:>8.1f}%{flag}")
+    return ok
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    for mode, result in results.get("ingest", {}).items():
+        print(f"ingest {mode:<7} {result['documents']} docs, {result['chunks']} chunks in {result['seconds']}s: "
+              f"{result['documents_per_second']} docs/s, {result['chunks_per_second']} chunks/s, "
+              f"{result['failed']} failed")
+    for size, result in results.get("retrieval", {}).items():
+        print(f"retrieval {size:>8} chunks: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+              f"{result['queries_per_second']} queries/s")
+    for concurrency, result in results.get("chat", {}).items():
+        print(f"chat {concurrency:>4} clients: {result['requests_per_second']} req/s, p50 {result['p50_ms']} ms, "
+              f"p99 {result['p99_ms']} ms, {result['errors']} errors")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "hybrid_search": settings.hybrid_search_enabled,
+            "scheduler": args.scheduler,
+            "partitioning": settings.vector_partitioning,
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        }
+    }
+    work_dir = Path(tempfile.mkdtemp(prefix="rag-benchmark-"))
+    try:
+        if "ingest" in args.suites:
+            source_dir = work_dir / "source"
+            source_dir.mkdir()
+            stack = Stack(work_dir / "ingest", args)
+            try:
+                results["ingest"] = await bench_ingest(stack, source_dir, args)
+            finally:
+                stack.close()
+        if "retrieval" in args.suites or "chat" in args.suites:
+            stack = Stack(work_dir / "retrieval", args)
+            try:
+                if "retrieval" in args.suites:
+                    results["retrieval"] = await bench_retrieval(stack, args)
+                else:
+                    await fill_corpus(stack, random.Random(args.seed), 0, max(args.sizes))
+                if "chat" in args.suites:
+                    results["chat"] = await bench_chat(stack, args)
+            finally:
+                stack.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", choices=["ingest", "retrieval", "chat"],
+                        default=["ingest", "retrieval", "chat"])
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare with")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="with --compare, fail when a figure is worse by more than this fraction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=settings.vector_index_backend)
+    parser.add_argument("--documents", type=int, default=20, help="documents ingested per mode")
+    parser.add_argument("--pages", type=int, default=4, help="pages per synthetic document")
+    parser.add_argument("--batch-size", type=int, default=16, help="documents per ingestion batch")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="retrieval corpus sizes")
+    parser.add_argument("--queries", type=int, default=100, help="retrieval queries per corpus size")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrent chat clients")
+    parser.add_argument("--chat-requests", type=int, default=64, help="chat requests per concurrency level")
+    parser.add_argument("--reranker", choices=["lexical", "cross-encoder", "none"], default="lexical")
+    parser.add_argument("--answer-cache", action="store_true", help="enable the semantic answer cache")
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--embed-call-ms", type=float, default=5.0, help="fake embedding latency per request")
+    parser.add_argument("--embed-text-ms", type=float, default=0.5, help="fake embedding latency per text")
+    parser.add_argument("--llm-first-token-ms", type=float, default=100.0, help="fake chat model time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0, help="fake chat model time per further token")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="fake chat model answer length")
+    parser.add_argument("--model-parallel", type=int, default=4,
+                        help="requests each fake model serves at once, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--no-scheduler", dest="scheduler", action="store_false",
+                        help="call the fake models directly instead of through the model scheduler")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+    if args.compare:
+        if not compare(json.loads(args.compare.read_text()), results, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Measure PDF parsing throughput (pages/sec) for different process pool sizes.
+
+Usage, from the api directory:
+
+    python -m benchmarks.pdf_parsing [--pdf path/to/file.pdf] [--pages 300] [--workers 1 2 4 8]
+
+Without --pdf a synthetic text-only PDF with --pages pages is generated.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_synthetic_pdf
+from src.document_processors import DocumentProcessor
+
+
+async def measure(file_path: Path, workers: int, pages_per_task: int, repeat: int) -> float:
+    processor = DocumentProcessor(parse_workers=workers, pages_per_task=pages_per_task)
+    try:
+        # Warm up the pool so process start-up is not counted as parsing time.
+        if workers > 1:
+            await processor._load_pages_parallel(file_path)
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if workers > 1:
+                pages = await processor._load_pages_parallel(file_path)
+            else:
+                pages = await processor._load_pages(file_path)
+            best = min(best, time.perf_counter() - start)
+        return len(pages) / best
+    finally:
+        processor.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=Path)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = args.pdf or write_synthetic_pdf(Path(tmp_dir) / "synthetic.pdf", args.pages)
+
+        baseline = None
+        print(f"{'workers':>8} {'pages/sec':>10} {'speedup':>8}")
+        for workers in sorted(set(args.workers)):
+            pages_per_sec = await measure(file_path, workers, args.pages_per_task, args.repeat)
+            baseline = baseline or pages_per_sec
+            print(f"{workers:>8} {pages_per_sec:>10.1f} {pages_per_sec / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
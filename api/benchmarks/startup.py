@@ -0,0 +1,132 @@
+"""API import and startup time, to catch regressions in how fast the server comes up.
+
+Usage, from the api directory:
+
+    python -m benchmarks.startup [--runs 5] [--output results.json]
+                                 [--compare baseline.json [--max-regression 0.2]]
+                                 [--model-load-ms 0]
+
+Each run starts a fresh interpreter, as a server process starts, and times:
+
+- import: importing src.server, which uvicorn does before serving anything.
+- build: importing the component modules and constructing the components,
+  in the background after the server is up.
+- prepare: index creation, keyword index backfill and ingestion workers.
+- warm_up: loading the models.
+- ready: the lifespan start until /readyz reports ready.
+
+Ollama and Mongo are replaced by the fakes of benchmarks.fakes, and the
+index directories by a temporary one, so warm_up only takes --model-load-ms
+and the figures track the API's own startup cost. The median of --runs is
+reported; --output, --compare and --max-regression work as in
+benchmarks.offline_suite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+PHASES = ("import", "build", "prepare", "warm_up", "ready")
+
+
+def run_single(model_load_seconds: float) -> Dict[str, float]:
+    """Start the API in this process, with fakes, and return the phase durations in seconds."""
+    start = time.perf_counter()
+    from src import server
+    import_seconds = time.perf_counter() - start
+
+    def build_with_fakes():
+        from benchmarks.fakes import FakeChatModel, FakeEmbeddings, fake_clients
+        from src.factories import ComponentFactory
+        mongo_client, async_mongo_client = fake_clients()
+        return ComponentFactory.create_components(
+            embeddings=FakeEmbeddings(call_seconds=model_load_seconds),
+            model=FakeChatModel(first_token_seconds=model_load_seconds, token_seconds=0.0, answer_tokens=1),
+            document_client=async_mongo_client,
+            history_client=mongo_client
+        )
+
+    server.startup.build = build_with_fakes
+
+    async def start_and_stop() -> None:
+        async with server.lifespan(server.app):
+            await server.startup.wait_ready()
+
+    asyncio.run(start_and_stop())
+    return {**server.startup.timings, "import": import_seconds}
+
+
+def run_once(args: argparse.Namespace) -> Dict[str, float]:
+    work_dir = Path(tempfile.mkdtemp(prefix="rag-startup-"))
+    env = {
+        **os.environ,
+        # Chroma's anonymous usage telemetry needs the network.
+        "ANONYMIZED_TELEMETRY": "False",
+        "LOG_LEVEL": "WARNING",
+        "DOCUMENTS_DIR": str(work_dir / "documents"),
+        "VECTOR_STORE_DIR": str(work_dir / "chroma"),
+        "EMBEDDING_CACHE_PATH": str(work_dir / "embedding_cache" / "embeddings.sqlite3"),
+        "KEYWORD_INDEX_PATH": str(work_dir / "keyword_index" / "bm25.sqlite3"),
+        "NUMPY_INDEX_DIR": str(work_dir / "numpy_index"),
+        "INDEX_GENERATION_PATH": str(work_dir / "index_generation.json"),
+        "WARM_UP_ENABLED": "True",
+    }
+    try:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--single", "--model-load-ms", str(args.model_load_ms)],
+            capture_output=True, text=True, check=True, env=env
+        ).stdout
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare with")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="exit with status 1 if a figure is worse than in --compare by more than this fraction")
+    parser.add_argument("--model-load-ms", type=float, default=0.0, help="fake model latency of the warm-up requests")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.model_load_ms / 1000)))
+        return
+
+    runs: List[Dict[str, float]] = [run_once(args) for _ in range(args.runs)]
+    startup: Dict[str, Any] = {
+        f"{phase}_ms": round(1000 * statistics.median(run.get(phase, 0.0) for run in runs), 1) for phase in PHASES
+    }
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "single")},
+        },
+        "startup": startup,
+    }
+    print(", ".join(f"{phase} {startup[f'{phase}_ms']} ms" for phase in PHASES) + f" (median of {args.runs})")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+    if args.compare:
+        from benchmarks.offline_suite import compare
+        if not compare(json.loads(args.compare.read_text()), results, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
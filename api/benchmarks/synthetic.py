@@ -0,0 +1,51 @@
+import random
+from pathlib import Path
+from typing import List, Optional
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+WORDS = (
+    "pump valve pressure sensor manual voltage install reset error controller "
+    "firmware module calibrate torque bearing assembly warranty service filter "
+    "cooling circuit breaker panel relay signal output input threshold alarm"
+).split()
+
+
+def random_sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def random_paragraphs(rng: random.Random, count: int, sentences: int = 6) -> List[str]:
+    return [" ".join(random_sentence(rng) for _ in range(sentences)) for _ in range(count)]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_pdf(path: Path, pages: int, lines_per_page: int = 45,
+                        seed: Optional[int] = 0) -> Path:
+    """Write a text-only PDF with random sentences, for benchmarks that need real parsing work."""
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+
+    for _ in range(pages):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        lines = [f"({_escape(random_sentence(rng, 10))}) Tj T*" for _ in range(lines_per_page)]
+        content = DecodedStreamObject()
+        content.set_data(("BT /F1 10 Tf 14 TL 40 750 Td " + " ".join(lines) + " ET").encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+    path = Path(path)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
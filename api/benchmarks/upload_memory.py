@@ -0,0 +1,112 @@
+"""Peak memory of streaming an upload to disk.
+
+Usage, from the api directory:
+
+    python -m benchmarks.upload_memory [--size-mb 1024] [--max-mb 100] [--chunk-kb 1024]
+
+Writes a --size-mb file of random bytes, then feeds it through
+FileHandler.save_stream wrapped in the same UploadFile the /documents endpoint
+receives, twice: once with no size limit, so the whole file is copied and
+hashed, and once with a --max-mb limit, so it is rejected part way through.
+For each run it reports the peak Python allocations (tracemalloc) and the
+growth of the process's peak resident memory (VmHWM). Both should stay within
+a few chunks regardless of the file size; the script exits with status 1 if
+the traced peak goes over BOUND_CHUNKS chunks plus a fixed BOUND_OVERHEAD.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.datastructures import UploadFile
+
+from src.file_handler import FileHandler, FileTooLargeError
+
+# The chunk being written plus the one being read, with room for a couple more in flight.
+BOUND_CHUNKS = 4
+# Allocations unrelated to the file size: aiofiles' thread pool, the event loop, imports.
+BOUND_OVERHEAD = 1024 * 1024
+
+
+def hwm_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def write_source(path: Path, size: int, chunk_size: int) -> None:
+    block = os.urandom(chunk_size)
+    with open(path, "wb") as f:
+        for position in range(0, size, chunk_size):
+            # Vary each block so the content is not trivially compressible or repeated.
+            f.write(position.to_bytes(8, "little") + block[8:min(chunk_size, size - position)])
+
+
+async def run_one(handler: FileHandler, source: Path, max_bytes: Optional[int]) -> Dict[str, object]:
+    hwm_before = hwm_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    outcome = "saved"
+    with open(source, "rb") as f:
+        try:
+            saved_path, _ = await handler.save_stream(UploadFile(file=f, filename=source.name), max_bytes=max_bytes)
+            saved_path.unlink()
+        except FileTooLargeError:
+            outcome = "rejected"
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "outcome": outcome,
+        "seconds": round(seconds, 2),
+        "traced_peak_mb": round(peak / 1024 / 1024, 2),
+        "hwm_growth_mb": round(hwm_mb() - hwm_before, 2),
+        "peak_bytes": peak,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024, help="size of the uploaded file")
+    parser.add_argument("--max-mb", type=int, default=100, help="upload limit for the rejected run")
+    parser.add_argument("--chunk-kb", type=int, default=1024, help="save_stream chunk size")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    chunk_size = args.chunk_kb * 1024
+    bound = BOUND_CHUNKS * chunk_size + BOUND_OVERHEAD
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / "upload.pdf"
+        write_source(source, size, chunk_size)
+        handler = FileHandler(Path(tmp_dir) / "documents", chunk_size=chunk_size)
+
+        print(f"file {args.size_mb} MB, chunk {args.chunk_kb} KB, bound {bound / 1024 / 1024:.1f} MB")
+        print(f"{'limit':>10} {'outcome':>9} {'seconds':>8} {'traced peak MB':>15} {'VmHWM growth MB':>16}")
+        failed = False
+        for max_bytes in (None, args.max_mb * 1024 * 1024):
+            result = await run_one(handler, source, max_bytes)
+            limit = "none" if max_bytes is None else f"{args.max_mb} MB"
+            print(f"{limit:>10} {result['outcome']:>9} {result['seconds']:>8} "
+                  f"{result['traced_peak_mb']:>15} {result['hwm_growth_mb']:>16}")
+            failed |= result["peak_bytes"] > bound
+            if max_bytes is not None and result["outcome"] != "rejected":
+                failed = True
+        leftovers = list((Path(tmp_dir) / "documents").iterdir())
+        if leftovers:
+            print(f"left behind: {[path.name for path in leftovers]}")
+            failed = True
+
+    print("FAIL" if failed else "OK: peak memory stays within the bound")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""Search latency and memory of the vector index backends.
+
+Usage, from the api directory:
+
+    python -m benchmarks.vector_index [--sizes 10000 100000 1000000] [--backends numpy chroma]
+                                      [--dim 768] [--sessions 10] [--queries 200] [--k 20]
+                                      [--partitioning none|session|bucket]
+
+Each run fills a fresh index with random unit vectors spread over --sessions
+sessions, then times session-scoped searches. It reports insert throughput,
+search p50/p99 latency and the process's resident memory (VmRSS) once the index
+is loaded. Each backend and size runs in its own subprocess, so the RSS
+figures do not include memory left over from earlier runs. At 1M chunks and
+768 dimensions the vectors alone take about 3 GB on disk.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+BATCH_SIZE = 5000
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def create_index(backend: str, tmp_dir: Path, partitioning: str):
+    from src.index_backends import ChromaIndex, NumpyIndex
+
+    if backend == "numpy":
+        return NumpyIndex(tmp_dir / "numpy_index")
+    from chromadb import PersistentClient
+    return ChromaIndex(PersistentClient(path=str(tmp_dir / "chroma")), "benchmark_index", partitioning=partitioning)
+
+
+def run_one(backend: str, size: int, dim: int, sessions: int, queries: int, k: int,
+            partitioning: str) -> Dict[str, float]:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = create_index(backend, Path(tmp_dir), partitioning)
+
+        start = time.perf_counter()
+        for position in range(0, size, BATCH_SIZE):
+            count = min(BATCH_SIZE, size - position)
+            vectors = rng.standard_normal((count, dim), dtype=np.float32)
+            documents = [
+                Document(page_content=f"chunk {position + i}", metadata={"session_id": f"s{(position + i) % sessions}"})
+                for i in range(count)
+            ]
+            index.upsert([uuid.uuid4().hex for _ in range(count)], vectors.tolist(), documents)
+        insert_seconds = time.perf_counter() - start
+
+        latencies = []
+        for query in range(queries):
+            embedding = rng.standard_normal(dim, dtype=np.float32).tolist()
+            start = time.perf_counter()
+            index.search(embedding, k, f"s{query % sessions}")
+            latencies.append(time.perf_counter() - start)
+
+        return {
+            "backend": backend,
+            "chunks": size,
+            "inserted_per_second": round(size / insert_seconds),
+            "p50_ms": round(1000 * statistics.median(latencies), 2),
+            "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+            "rss_mb": round(rss_mb()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", choices=["numpy", "chroma"], default=["numpy", "chroma"])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--partitioning", choices=["none", "session", "bucket"], default="session",
+                        help="Chroma collection partitioning")
+    parser.add_argument("--single", nargs=2, metavar=("BACKEND", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        backend, size = args.single[0], int(args.single[1])
+        print(json.dumps(run_one(backend, size, args.dim, args.sessions, args.queries, args.k, args.partitioning)))
+        return
+
+    print(f"{'backend':>8} {'chunks':>9} {'inserted/sec':>13} {'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for size in args.sizes:
+        for backend in args.backends:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.vector_index", "--single", backend, str(size),
+                 "--dim", str(args.dim), "--sessions", str(args.sessions),
+                 "--queries", str(args.queries), "--k", str(args.k), "--partitioning", args.partitioning],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{backend:>8} {size:>9} {result['inserted_per_second']:>13} {result['p50_ms']:>9} "
+                  f"{result['p99_ms']:>9} {result['rss_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
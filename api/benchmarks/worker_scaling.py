@@ -0,0 +1,268 @@
+"""Upload and chat throughput of the API with 1 to N worker processes on this machine.
+
+Usage, from the api directory, with MongoDB and the Chroma server running
+(docker-compose up mongodb chroma):
+
+    python -m benchmarks.worker_scaling [--workers 1 2 4] [--concurrency 16]
+                                        [--uploads 32] [--pages 8] [--chat-requests 200]
+                                        [--output results.json]
+                                        [--compare baseline.json [--max-regression 0.2]]
+
+For each worker count the API is started with uvicorn --workers, Ollama
+replaced by the fake models of benchmarks.fakes, and measured in two steps:
+
+- upload: --concurrency clients, each with its own session, upload --uploads
+  synthetic PDFs of --pages pages and poll their jobs until every one is
+  done. Job polls land on any worker, as the job status is shared in Mongo.
+- chat: the same clients ask --chat-requests questions about their documents.
+
+The fake models answer after --llm-ms and embed after --embed-ms, so with the
+defaults the figures are the API's own work: parsing, retrieval, Mongo and
+request handling. Every run uses a new Mongo database and Chroma collection,
+removed afterwards. --output, --compare and --max-regression work as in
+benchmarks.offline_suite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.offline_suite import compare, latency_summary
+from benchmarks.synthetic import write_synthetic_pdf
+
+
+def __getattr__(name: str):
+    # "benchmarks.worker_scaling:app" is what each uvicorn worker imports.
+    if name == "app":
+        return fake_model_app()
+    raise AttributeError(name)
+
+
+def fake_model_app():
+    """The API app, building its components with fake models; the latencies come from the environment."""
+    from src import server
+
+    def build_with_fakes():
+        from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+        from src.factories import ComponentFactory
+        return ComponentFactory.create_components(
+            embeddings=FakeEmbeddings(call_seconds=float(os.environ.get("SCALING_EMBED_MS", 0)) / 1000),
+            model=FakeChatModel(first_token_seconds=float(os.environ.get("SCALING_LLM_MS", 0)) / 1000)
+        )
+
+    server.startup.build = build_with_fakes
+    return server.app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient, workers: int, timeout: float) -> None:
+    """Wait until /readyz answers ready several times in a row, so every worker is likely up."""
+    deadline = time.monotonic() + timeout
+    in_a_row = 0
+    while in_a_row < 4 * workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"The API with {workers} workers was not ready after {timeout}s")
+        try:
+            ready = (await client.get("/readyz")).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        in_a_row = in_a_row + 1 if ready else 0
+        await asyncio.sleep(0.05 if ready else 0.5)
+
+
+async def bench_upload(client: httpx.AsyncClient, sessions: List[str], pdfs: List[Path]) -> Dict[str, Any]:
+    queue = list(pdfs)
+    failed = 0
+
+    async def client_loop(session_id: str) -> None:
+        nonlocal failed
+        headers = {"session-id": session_id}
+        while queue:
+            pdf = queue.pop()
+            response = await client.post("/documents", headers=headers,
+                                         files={"file": (pdf.name, pdf.read_bytes(), "application/pdf")})
+            if response.status_code != 202:
+                failed += 1
+                continue
+            job_id = response.json()["job_id"]
+            while True:
+                job = (await client.get(f"/jobs/{job_id}", headers=headers)).json()
+                if job.get("stage") in ("completed", "failed", None):
+                    failed += job.get("stage") != "completed"
+                    break
+                await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop(session_id) for session_id in sessions])
+    seconds = time.perf_counter() - start
+    return {
+        "documents": len(pdfs),
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round((len(pdfs) - failed) / seconds, 3),
+    }
+
+
+async def bench_chat(client: httpx.AsyncClient, sessions: List[str], requests: int) -> Dict[str, Any]:
+    remaining = requests
+    latencies: List[float] = []
+    errors = 0
+
+    async def client_loop(session_id: str) -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.post("/chat", headers={"session-id": session_id},
+                                         json={"message": f"What does the manual say about item {remaining}?"})
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop(session_id) for session_id in sessions])
+    seconds = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / seconds, 3),
+        **latency_summary(latencies),
+    }
+
+
+def drop_run_data(db_name: str, collection_name: str) -> None:
+    from pymongo import MongoClient
+    from config.settings import settings
+    with MongoClient(settings.mongo_uri) as client:
+        client.drop_database(db_name)
+    try:
+        from chromadb import HttpClient
+        chroma = HttpClient(host=settings.chroma_host, port=settings.chroma_port)
+        for collection in chroma.list_collections():
+            name = getattr(collection, "name", collection)
+            if name.startswith(collection_name):
+                chroma.delete_collection(name)
+    except Exception as e:
+        print(f"could not remove the Chroma collections {collection_name}*: {e}", file=sys.stderr)
+
+
+async def run_level(workers: int, pdfs: List[Path], args: argparse.Namespace) -> Dict[str, Any]:
+    run_id = uuid.uuid4().hex[:8]
+    work_dir = Path(tempfile.mkdtemp(prefix="rag-scaling-"))
+    port = free_port()
+    db_name, collection_name = f"rag_scaling_{run_id}", f"scaling-{run_id}"
+    env = {
+        **os.environ,
+        "ANONYMIZED_TELEMETRY": "False",
+        "LOG_LEVEL": "WARNING",
+        "API_WORKERS": str(workers),
+        "MONGO_DB_NAME": db_name,
+        "VECTOR_COLLECTION_NAME": collection_name,
+        "VECTOR_INDEX_BACKEND": "chroma",
+        "CHROMA_CLIENT_TYPE": "http",
+        "DOCUMENTS_DIR": str(work_dir / "documents"),
+        "EMBEDDING_CACHE_PATH": str(work_dir / "embedding_cache" / "embeddings.sqlite3"),
+        "KEYWORD_INDEX_PATH": str(work_dir / "keyword_index" / "bm25.sqlite3"),
+        "INDEX_GENERATION_PATH": str(work_dir / "index_generation.json"),
+        "ANSWER_CACHE_ENABLED": "False",
+        "WARM_UP_ENABLED": "False",
+        "SCALING_LLM_MS": str(args.llm_ms),
+        "SCALING_EMBED_MS": str(args.embed_ms),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.worker_scaling:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env
+    )
+    sessions = [f"scaling-{run_id}-{i}" for i in range(args.concurrency)]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout,
+                                     limits=limits) as client:
+            await wait_ready(client, workers, args.timeout)
+            upload = await bench_upload(client, sessions, pdfs)
+            chat = await bench_chat(client, sessions, args.chat_requests)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        drop_run_data(db_name, collection_name)
+    return {"upload": upload, "chat": chat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="fake chat model latency per answer")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="fake embedding latency per request")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare with")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="exit with status 1 if a figure is worse than in --compare by more than this fraction")
+    args = parser.parse_args()
+
+    pdf_dir = Path(tempfile.mkdtemp(prefix="rag-scaling-pdfs-"))
+    # Different seeds, so no upload is deduplicated against another.
+    pdfs = [write_synthetic_pdf(pdf_dir / f"manual-{i}.pdf", args.pages, seed=i) for i in range(args.uploads)]
+    results: Dict[str, Any] = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+    }
+    print(f"{'workers':>7} {'upload docs/s':>14} {'chat req/s':>11} {'chat p50 ms':>12} {'chat p99 ms':>12} "
+          f"{'errors':>7}")
+    try:
+        for workers in args.workers:
+            result = results[f"workers_{workers}"] = asyncio.run(run_level(workers, pdfs, args))
+            upload, chat = result["upload"], result["chat"]
+            print(f"{workers:>7} {upload['documents_per_second']:>14} {chat['requests_per_second']:>11} "
+                  f"{chat['p50_ms']:>12} {chat['p99_ms']:>12} {upload['failed'] + chat['errors']:>7}")
+    finally:
+        shutil.rmtree(pdf_dir, ignore_errors=True)
+
+    levels = [f"workers_{workers}" for workers in args.workers]
+    if len(levels) > 1:
+        first = results[levels[0]]
+        for level in levels[1:]:
+            results[level]["speedup"] = {
+                "upload": round(results[level]["upload"]["documents_per_second"]
+                                / max(first["upload"]["documents_per_second"], 1e-9), 2),
+                "chat": round(results[level]["chat"]["requests_per_second"]
+                              / max(first["chat"]["requests_per_second"], 1e-9), 2),
+            }
+            print(f"{level}: upload x{results[level]['speedup']['upload']}, chat x{results[level]['speedup']['chat']}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+    if args.compare:
+        if not compare(json.loads(args.compare.read_text()), results, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
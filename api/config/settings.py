@@ -9,6 +9,11 @@ class Settings(BaseSettings):
     mongo_db_name: str = Field(default="pdf_assistant")
     mongo_documents_collection: str = Field(default="documents")
     mongo_message_history_collection: str = Field(default="message_history")
+    mongo_summary_collection: str = Field(default="conversation_summaries")
+    mongo_answer_cache_collection: str = Field(default="answer_cache")
+    mongo_jobs_collection: str = Field(default="ingestion_jobs")
+    mongo_leases_collection: str = Field(default="leases")
+    mongo_max_pool_size: int = Field(default=100)
 
     # ChromaDB Settings
     chroma_client_type: str = Field(default="persistent")
@@ -17,24 +22,125 @@ class Settings(BaseSettings):
     
     # File Storage Settings
     documents_dir: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "documents")
+    upload_max_bytes: int = Field(default=100 * 1024 * 1024)
+    # Total size of the files of one POST /documents/batch request.
+    upload_batch_max_bytes: int = Field(default=1024 * 1024 * 1024)
+    upload_chunk_size: int = Field(default=1024 * 1024)
+    file_delete_concurrency: int = Field(default=16)
     
     # Vector Store Settings
     vector_store_dir: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "chroma_langchain_db")
     vector_collection_name: str = Field(default="pdfs")
+    vector_partitioning: str = Field(default="session")  # "none", "session" or "bucket"
+    vector_partition_buckets: int = Field(default=64)
+    vector_index_backend: str = Field(default="chroma")  # "chroma" or "numpy"
+    numpy_index_dir: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "numpy_index")
+    numpy_index_compact_ratio: float = Field(default=0.3)
+    # Records the live index generation (model and chunk settings the stored vectors were built with).
+    index_generation_path: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "chroma_langchain_db" / "index_generation.json")
+
+    # Hybrid Retrieval Settings
+    hybrid_search_enabled: bool = Field(default=True)
+    keyword_index_path: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "keyword_index" / "bm25.sqlite3")
+    retrieval_fetch_k: int = Field(default=20)
+    rrf_k: int = Field(default=60)
+
+    # Reranking Settings
+    reranker: str = Field(default="lexical")  # "lexical", "cross-encoder" (needs sentence-transformers) or "none"
+    reranker_model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    retrieval_candidates: int = Field(default=20)
+    retrieval_final_k: int = Field(default=4)
+    context_token_budget: int = Field(default=1500)
+    context_dedup_threshold: float = Field(default=0.9)
+
+    # Embedding Cache Settings
+    embedding_cache_enabled: bool = Field(default=True)
+    embedding_cache_path: Path = Field(default=Path(os.path.dirname(os.path.dirname(__file__))) / "embedding_cache" / "embeddings.sqlite3")
+    embedding_cache_max_entries: int = Field(default=200_000)
+
+    # Embedding Pipeline Settings
+    embedding_batch_size: int = Field(default=32)
+    embedding_min_batch_size: int = Field(default=8)
+    embedding_max_batch_size: int = Field(default=256)
+    embedding_max_in_flight: int = Field(default=4)
+    embedding_target_batch_seconds: float = Field(default=2.0)
+
+    # Model Scheduler Settings
+    scheduler_generation_max_in_flight: int = Field(default=2)
+    scheduler_generation_max_queue: int = Field(default=16)  # waiting chat requests before 429
+    scheduler_embedding_max_in_flight: int = Field(default=4)
+    scheduler_embedding_max_queue: int = Field(default=64)
+    scheduler_query_batch_window_ms: float = Field(default=2.0)
+    scheduler_query_max_batch: int = Field(default=32)
     
     # LLM Settings
     embedding_model: str = Field(default="nomic-embed-text")
     llm_model: str = Field(default="llama3.2")
     ollama_host: str = Field(default="localhost")
     ollama_port: str = Field(default="11434")
+    ollama_keep_alive_seconds: int = Field(default=1800)  # how long Ollama keeps the models loaded after a request
+
+    # Conversation History Settings
+    history_page_size: int = Field(default=50)
+    history_max_page_size: int = Field(default=500)
+    history_window_messages: int = Field(default=0)  # recent messages added to the prompt, 0 disables
+    history_summary_enabled: bool = Field(default=False)
+
+    # Answer Cache Settings
+    answer_cache_enabled: bool = Field(default=True)
+    answer_cache_similarity_threshold: float = Field(default=0.95)
+    answer_cache_max_entries_per_session: int = Field(default=256)
     
     # API Settings
     api_host: str = Field(default="0.0.0.0")
     api_port: int = Field(default=8001)
 
+    # Multi-worker Settings
+    api_workers: int = Field(default=1)
+    # Keep ingestion job status, the answer cache and locks in Mongo; implied by api_workers > 1,
+    # set it for several single-worker replicas. Needs the Chroma server and shared local paths.
+    shared_state_enabled: bool = Field(default=False)
+    lease_ttl_seconds: float = Field(default=30.0)  # locks of a worker that died are taken over after this
+    job_sync_interval_seconds: float = Field(default=1.0)
+    job_retention_seconds: float = Field(default=86400.0)
+
+    # Startup Settings
+    warm_up_enabled: bool = Field(default=True)  # load the chat and embedding models before reporting ready
+    startup_retry_seconds: float = Field(default=5.0)  # delay before retrying a failed startup, e.g. Mongo not up yet
+
+    # Observability Settings
+    log_level: str = Field(default="INFO")
+    log_format: str = Field(default="json")  # "json" or "text"
+    log_sample_rate: float = Field(default=0.01)  # share of per-request events that are logged
+    server_timing_enabled: bool = Field(default=False)  # per-stage durations in a Server-Timing response header
+
     # Document Processing Settings
     chunk_size: int = Field(default=1000)
     chunk_overlap: int = Field(default=200)
+    pdf_parse_workers: int = Field(default=1)  # above 1, pages are parsed in a pool of spawned processes
+    pdf_parse_pages_per_task: int = Field(default=8)
+
+    # Ingestion Queue Settings
+    ingestion_workers: int = Field(default=2)
+    ingestion_queue_size: int = Field(default=100)
+    ingestion_max_finished_jobs: int = Field(default=1000)
+    ingestion_batch_max_files: int = Field(default=100)
+    ingestion_parse_concurrency: int = Field(default=4)
+    ingestion_chunk_batch_size: int = Field(default=512)
+
+    # Re-index Settings
+    reindex_max_chunks_per_second: float = Field(default=50.0)
+    reindex_embedding_max_in_flight: int = Field(default=1)
+
+    # Reconciler Settings
+    reconcile_interval_seconds: float = Field(default=6 * 3600.0)  # 0 disables the periodic pass
+    reconcile_min_age_seconds: float = Field(default=3600.0)
+    reconcile_max_deletes_per_second: float = Field(default=200.0)
+    reconcile_batch_size: int = Field(default=500)
+    
+    @property
+    def shared_state(self) -> bool:
+        return self.shared_state_enabled or self.api_workers > 1
     
     model_config = {
         "env_prefix": "",
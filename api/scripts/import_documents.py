@@ -0,0 +1,132 @@
+"""Import every PDF under a directory, without going through the HTTP API.
+
+Usage, from the api directory:
+
+    python -m scripts.import_documents DIRECTORY [--session-id ID] [--batch-size 32] [--no-recursive]
+
+Files are copied into documents_dir and handed to the same IngestionQueue the
+API uses, in batches of --batch-size. Each batch is parsed, embedded and
+stored as a pipeline, and while one batch is being ingested the next one is
+already being copied in. Documents are imported under --session-id, or as
+shared documents without one.
+
+The import is resumable: a file whose content is already stored for the
+session is skipped, and chunks left behind by an interrupted run are
+overwritten rather than duplicated, so after a crash the same command can
+simply be run again. Stop the API first if it uses a local keyword index or
+vector index directory, as both processes would write to it.
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import aiofiles
+
+from config.settings import settings
+from src.factories import ComponentFactory
+from src.ingestion_queue import IngestionBatch, JobStage, QueueFullError
+
+
+def find_documents(directory: Path, recursive: bool) -> List[Path]:
+    pattern = "**/*.pdf" if recursive else "*.pdf"
+    return sorted(path for path in directory.glob(pattern) if path.is_file())
+
+
+async def import_documents(paths: List[Path], session_id: Optional[str], batch_size: int) -> int:
+    file_handler = ComponentFactory.create_file_handler()
+    document_processor = ComponentFactory.create_document_processor()
+    vector_store = ComponentFactory.create_vector_store()
+    document_store = ComponentFactory.create_document_store()
+    ingestion_queue = ComponentFactory.create_ingestion_queue(
+        file_handler=file_handler,
+        document_processor=document_processor,
+        vector_store=vector_store,
+        document_store=document_store
+    )
+    await document_store.ensure_indexes()
+    await ingestion_queue.start()
+
+    pending: List[IngestionBatch] = []
+    finished: List[IngestionBatch] = []
+    start = time.perf_counter()
+
+    def report(batch: IngestionBatch) -> None:
+        done = sum(len(finished_batch.jobs) for finished_batch in finished)
+        stats = batch.to_dict()
+        print(f"{done}/{len(paths)} documents in {time.perf_counter() - start:.1f}s; last batch: "
+              f"{stats['chunks_embedded']} chunks, {stats['documents_per_second']} docs/sec, "
+              f"{stats['chunks_per_second']} chunks/sec")
+
+    async def wait_oldest() -> None:
+        batch = pending.pop(0)
+        await batch.done.wait()
+        finished.append(batch)
+        report(batch)
+
+    try:
+        for position in range(0, len(paths), batch_size):
+            files = []
+            for path in paths[position:position + batch_size]:
+                try:
+                    async with aiofiles.open(path, "rb") as f:
+                        file_path, file_hash = await file_handler.save_stream(f, extension="pdf")
+                except Exception as e:
+                    print(f"Skipping {path}: {str(e)}")
+                    continue
+                files.append((file_path, path.name, file_hash))
+            if not files:
+                continue
+
+            # Keep one batch per worker in flight, plus the one being copied in.
+            while len(pending) >= ingestion_queue.workers:
+                await wait_oldest()
+            while True:
+                try:
+                    pending.append(ingestion_queue.submit_batch(files, session_id))
+                    break
+                except QueueFullError:
+                    await wait_oldest()
+        while pending:
+            await wait_oldest()
+    finally:
+        await ingestion_queue.stop()
+        document_processor.close()
+
+    jobs = [job for batch in finished for job in batch.jobs]
+    imported = [job for job in jobs if job.stage == JobStage.COMPLETED and not job.deduplicated]
+    skipped = [job for job in jobs if job.stage == JobStage.COMPLETED and job.deduplicated]
+    failed = [job for job in jobs if job.stage == JobStage.FAILED]
+    chunks = sum(job.progress.chunks_embedded for job in imported)
+    elapsed = time.perf_counter() - start
+
+    for job in failed:
+        print(f"Failed: {job.filename}: {job.error}")
+    print(f"Done in {elapsed:.1f}s: {len(imported)} imported, {len(skipped)} already stored, {len(failed)} failed; "
+          f"{len(imported) / elapsed:.2f} docs/sec, {chunks / elapsed:.1f} chunks/sec")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--session-id", default=None, help="Session that owns the documents; shared if omitted")
+    parser.add_argument("--batch-size", type=int, default=32, help="Documents per ingestion batch")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="Only import PDFs directly inside the directory")
+    args = parser.parse_args()
+
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+    paths = find_documents(args.directory, args.recursive)
+    if not paths:
+        print(f"No PDF files found in {args.directory}")
+        return
+    batch_size = max(1, min(args.batch_size, settings.ingestion_batch_max_files))
+    print(f"Importing {len(paths)} documents in batches of {batch_size}")
+    raise SystemExit(asyncio.run(import_documents(paths, args.session_id, batch_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Move session chunks from the shared Chroma collection into their partitions.
+
+Usage, from the api directory:
+
+    python -m scripts.partition_vector_store [--partitioning session] [--batch-size 500] [--dry-run]
+
+Before vector_partitioning existed, every chunk lived in the
+vector_collection_name collection. This script reads that collection in
+batches. It copies each chunk that belongs to a session, with its embedding,
+into the partition of every session that owns it, then deletes it from the
+shared collection. Chunks without a session stay where they are. Each batch
+is copied before it is deleted, so an interrupted run can simply be started
+again. Stop the API first, or new uploads may land in the shared collection
+while the script runs.
+"""
+import argparse
+import time
+
+from langchain_core.documents import Document
+
+from config.settings import settings
+from src.index_backends import ChromaIndex, metadata_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partitioning", choices=["session", "bucket"], default=settings.vector_partitioning)
+    parser.add_argument("--buckets", type=int, default=settings.vector_partition_buckets)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Count the chunks to move without moving them")
+    args = parser.parse_args()
+
+    if settings.vector_index_backend != "chroma":
+        parser.error("Partitioning applies to the chroma backend only")
+
+    if settings.chroma_client_type == "http":
+        from chromadb import HttpClient
+        client = HttpClient(host=settings.chroma_host, port=settings.chroma_port)
+    else:
+        from chromadb import PersistentClient
+        client = PersistentClient(path=str(settings.vector_store_dir))
+    index = ChromaIndex(client, settings.vector_collection_name, partitioning=args.partitioning,
+                        partition_buckets=args.buckets)
+    shared = index.collection(settings.vector_collection_name)
+    if shared is None:
+        print(f"No collection named {settings.vector_collection_name}: nothing to migrate")
+        return
+
+    moved = kept = offset = 0
+    start = time.perf_counter()
+    while True:
+        # Moved chunks leave the collection, so only kept rows come before the next batch.
+        records = shared.get(include=["embeddings", "documents", "metadatas"], limit=args.batch_size, offset=offset)
+        if not records["ids"]:
+            break
+        ids, embeddings, documents = [], [], []
+        for chunk_id, embedding, content, metadata in zip(
+            records["ids"], records["embeddings"], records["documents"], records["metadatas"]
+        ):
+            metadata = metadata or {}
+            if not metadata_sessions(metadata):
+                kept += 1
+                continue
+            ids.append(chunk_id)
+            embeddings.append(list(embedding))
+            documents.append(Document(page_content=content or "", metadata=metadata))
+
+        offset = kept
+        if args.dry_run:
+            offset += moved + len(ids)
+        elif ids:
+            index.upsert(ids, embeddings, documents)
+            shared.delete(ids=ids)
+        moved += len(ids)
+        print(f"{moved} chunks {'to move' if args.dry_run else 'moved'}, {kept} kept in the shared collection")
+
+    print(f"Done in {time.perf_counter() - start:.1f}s: {moved} chunks "
+          f"{'to move' if args.dry_run else 'moved'} into {args.partitioning} partitions")
+
+
+if __name__ == "__main__":
+    main()
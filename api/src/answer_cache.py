@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class CachedAnswer:
+    def __init__(self, question: str, embedding: List[float], answer: str, generation_seconds: float):
+        self.question = question
+        self.embedding = _normalize(embedding)
+        self.answer = answer
+        self.generation_seconds = generation_seconds
+
+
+class AnswerCache:
+    """Semantic cache of generated answers, scoped per session.
+
+    An answer is reused when a new question retrieves exactly the same set of
+    chunks and its embedding is within similarity_threshold (cosine) of a
+    question answered before.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries_per_session: int = 256):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_session = max_entries_per_session
+        self._entries: Dict[Optional[str], "OrderedDict[Tuple[FrozenSet[str], int], CachedAnswer]"] = {}
+        self._next_entry_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.seconds_saved = 0.0
+        self.lookup_seconds = 0.0
+
+    def ensure_indexes(self) -> None:
+        pass
+
+    def lookup(self, session_id: Optional[str], embedding: List[float],
+               chunk_ids: Iterable[str]) -> Optional[CachedAnswer]:
+        start = time.perf_counter()
+        chunk_set = frozenset(chunk_ids)
+        query = _normalize(embedding)
+        best, best_key, best_similarity = None, None, self.similarity_threshold
+
+        entries = self._entries.get(session_id, {})
+        for key, entry in entries.items():
+            if key[0] != chunk_set:
+                continue
+            similarity = sum(a * b for a, b in zip(query, entry.embedding))
+            if similarity >= best_similarity:
+                best, best_key, best_similarity = entry, key, similarity
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.seconds_saved += best.generation_seconds
+            entries.move_to_end(best_key)
+        self.lookup_seconds += time.perf_counter() - start
+        return best
+
+    def store(self, session_id: Optional[str], question: str, embedding: List[float],
+              chunk_ids: Iterable[str], answer: str, generation_seconds: float) -> None:
+        entries = self._entries.setdefault(session_id, OrderedDict())
+        entries[(frozenset(chunk_ids), self._next_entry_id)] = CachedAnswer(
+            question, embedding, answer, generation_seconds
+        )
+        self._next_entry_id += 1
+        while len(entries) > self.max_entries_per_session:
+            entries.popitem(last=False)
+
+    def invalidate(self, session_ids: Optional[Iterable[Optional[str]]] = None) -> None:
+        """Drop cached answers for the given sessions, or for every session when None."""
+        if session_ids is None:
+            self._entries.clear()
+        else:
+            for session_id in session_ids:
+                self._entries.pop(session_id, None)
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "seconds_saved": round(self.seconds_saved, 3),
+            "avg_lookup_ms": round(1000 * self.lookup_seconds / lookups, 3) if lookups else 0.0,
+        }
+
+
+class MongoAnswerCache(AnswerCache):
+    """AnswerCache kept in a Mongo collection, so every worker process shares the answers and invalidations.
+
+    Entries are looked up by session and a hash of the retrieved chunk ids;
+    the similarity of the few candidates is computed here. Hit and miss
+    counts are this process's own. The methods block on Mongo: call them from
+    a thread, or use ainvalidate and astats on the event loop.
+    """
+
+    def __init__(self, collection, similarity_threshold: float = 0.95, max_entries_per_session: int = 256):
+        super().__init__(similarity_threshold, max_entries_per_session)
+        self.collection = collection
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index([("session_id", 1), ("chunk_key", 1)])
+
+    @staticmethod
+    def _chunk_key(chunk_ids: Iterable[str]) -> str:
+        return hashlib.sha1("\n".join(sorted(set(chunk_ids))).encode("utf-8")).hexdigest()
+
+    def lookup(self, session_id: Optional[str], embedding: List[float],
+               chunk_ids: Iterable[str]) -> Optional[CachedAnswer]:
+        start = time.perf_counter()
+        query = _normalize(embedding)
+        best, best_similarity = None, self.similarity_threshold
+        for entry in self.collection.find({"session_id": session_id, "chunk_key": self._chunk_key(chunk_ids)}):
+            similarity = sum(a * b for a, b in zip(query, entry["embedding"]))
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+
+        cached = None
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.seconds_saved += best["generation_seconds"]
+            cached = CachedAnswer(best["question"], best["embedding"], best["answer"], best["generation_seconds"])
+        self.lookup_seconds += time.perf_counter() - start
+        return cached
+
+    def store(self, session_id: Optional[str], question: str, embedding: List[float],
+              chunk_ids: Iterable[str], answer: str, generation_seconds: float) -> None:
+        self.collection.insert_one({
+            "session_id": session_id,
+            "chunk_key": self._chunk_key(chunk_ids),
+            "question": question,
+            "embedding": _normalize(embedding),
+            "answer": answer,
+            "generation_seconds": generation_seconds,
+            "created_at": datetime.now(timezone.utc),
+        })
+        entries = self.collection.find({"session_id": session_id}, projection={"_id": True}).sort("created_at", -1)
+        expired = [entry["_id"] for entry in list(entries)[self.max_entries_per_session:]]
+        if expired:
+            self.collection.delete_many({"_id": {"$in": expired}})
+
+    def invalidate(self, session_ids: Optional[Iterable[Optional[str]]] = None) -> None:
+        if session_ids is None:
+            self.collection.delete_many({})
+        else:
+            self.collection.delete_many({"session_id": {"$in": list(session_ids)}})
+        self.invalidations += 1
+
+    async def ainvalidate(self, session_ids: Optional[Iterable[Optional[str]]] = None) -> None:
+        await asyncio.to_thread(self.invalidate, None if session_ids is None else list(session_ids))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "sessions": None, "entries": self.collection.count_documents({})}
+
+    async def astats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.stats)
@@ -1,51 +1,217 @@
-from langchain_ollama import ChatOllama
 from langchain.prompts.chat import ChatPromptTemplate
-from langchain.schema.runnable import Runnable, RunnableLambda
-from typing import Optional, List
+from langchain.schema.runnable import Runnable
+from langchain_core.language_models import BaseChatModel
+from typing import Optional, List, AsyncIterator, Tuple, Dict, Any, Set
 from src.vector_store import VectorStore
-from langchain_mongodb import MongoDBChatMessageHistory
+from src.answer_cache import AnswerCache, MongoAnswerCache
+from src.reranker import Reranker
+from src.context_builder import ContextBuilder, BuiltContext, estimate_tokens
+from src.message_history import MessageHistoryStore, ConversationSummaryStore, parse_cursor
+from src.metrics import observe_stage, time_stage
+from src.model_scheduler import BACKGROUND, GENERATION, INTERACTIVE, ModelScheduler
+from src.structured_logging import get_logger
+from pymongo import MongoClient
+from bson import ObjectId
 from langchain.schema import AIMessage, HumanMessage, BaseMessage
 from config.settings import settings
 import os
+import time
+import asyncio
+from contextlib import nullcontext
+
+logger = get_logger(__name__)
 
 class PDFAssistant:
     def __init__(self, persist_directory: str, model_name: str, 
-                 mongo_uri: str, mongo_db_name: str, mongo_message_history_collection: str):
-        """Initialize the PDF Assistant with vector store and model configuration."""
-        self.vector_store = VectorStore(persist_directory=persist_directory)
-        self.model = ChatOllama(
-            model=model_name,
-            base_url=f"http://{settings.ollama_host}:{settings.ollama_port}"
+                 mongo_uri: str, mongo_db_name: str, mongo_message_history_collection: str,
+                 answer_cache: Optional[AnswerCache] = None, mongo_max_pool_size: int = 100,
+                 reranker: Optional[Reranker] = None, retrieval_candidates: int = 20, retrieval_final_k: int = 4,
+                 context_builder: Optional[ContextBuilder] = None, history_window_messages: int = 0,
+                 history_summary_enabled: bool = False, mongo_summary_collection: str = "conversation_summaries",
+                 vector_store: Optional[VectorStore] = None, model: Optional[BaseChatModel] = None,
+                 history_client: Optional[MongoClient] = None, scheduler: Optional[ModelScheduler] = None):
+        """Initialize the PDF Assistant with vector store and model configuration.
+        
+        vector_store, model and history_client replace the store, Ollama chat model and
+        Mongo client the assistant would otherwise create from the settings. With a
+        scheduler, generations and query embeddings wait for its slots.
+        """
+        self.vector_store = vector_store or VectorStore(
+            persist_directory=persist_directory,
+            embedding_cache_path=str(settings.embedding_cache_path) if settings.embedding_cache_enabled else None,
+            embedding_cache_max_entries=settings.embedding_cache_max_entries,
+            keyword_index_path=str(settings.keyword_index_path) if settings.hybrid_search_enabled else None,
+            retrieval_fetch_k=settings.retrieval_fetch_k,
+            rrf_k=settings.rrf_k,
+            index_backend=settings.vector_index_backend,
+            numpy_index_dir=str(settings.numpy_index_dir),
+            numpy_index_compact_ratio=settings.numpy_index_compact_ratio,
+            partitioning=settings.vector_partitioning,
+            partition_buckets=settings.vector_partition_buckets,
+            # Follows the live generation, so retrieval switches over when a re-index swaps it.
+            generation_path=str(settings.index_generation_path),
+            model_name=settings.embedding_model,
+            chunk_size=settings.chunk_size,
+            chunk_overlap=settings.chunk_overlap,
+            scheduler=scheduler
         )
+        self.scheduler = scheduler
+        if model is None:
+            from langchain_ollama import ChatOllama
+            model = ChatOllama(
+                model=model_name,
+                base_url=f"http://{settings.ollama_host}:{settings.ollama_port}",
+                keep_alive=settings.ollama_keep_alive_seconds
+            )
+        self.model = model
         self.mongo_uri = mongo_uri
         self.mongo_db_name = mongo_db_name
         self.mongo_message_history_collection = mongo_message_history_collection
+        self.answer_cache = answer_cache
+        # With a reranker, retrieval over-fetches candidates and keeps the best final_k.
+        self.reranker = reranker
+        self.retrieval_candidates = retrieval_candidates
+        self.retrieval_final_k = retrieval_final_k
+        self.context_builder = context_builder or ContextBuilder()
+        # One pooled client shared by every history store, instead of a new
+        # connection (and index creation) per request.
+        self.history_client = history_client or MongoClient(mongo_uri, maxPoolSize=mongo_max_pool_size)
+        # Follow-up questions see the last history_window_messages messages verbatim and,
+        # with summaries enabled, a rolling summary of everything older.
+        self.history_window_messages = history_window_messages
+        self.summaries = ConversationSummaryStore(
+            self.history_client[mongo_db_name][mongo_summary_collection]
+        ) if history_summary_enabled else None
+        self._summarizing: Set[Optional[str]] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.chain = self._create_rag_chain()
+
+    def ensure_indexes(self) -> None:
+        self._get_message_history_store(None).collection.create_index(MessageHistoryStore.index_keys())
+        if self.summaries is not None:
+            self.summaries.ensure_indexes()
+        if self.answer_cache is not None:
+            self.answer_cache.ensure_indexes()
+
+    async def warm_up(self) -> None:
+        """Load the chat model with a minimal request, so the first question does not wait for it."""
+        async with self._generation_slot(BACKGROUND):
+            await self.model.ainvoke("Reply with OK.")
+
+    def close(self) -> None:
+        self.history_client.close()
+
+    def check_admission(self) -> None:
+        """Raise SchedulerBusyError if a question would be rejected now, before anything is stored."""
+        if self.scheduler is not None:
+            self.scheduler.check_admission(GENERATION, INTERACTIVE)
 
-    def _get_message_history_store(self, session_id: Optional[str] = None) -> MongoDBChatMessageHistory:
-        return MongoDBChatMessageHistory(
+    def _generation_slot(self, priority: int = INTERACTIVE):
+        return self.scheduler.slot(GENERATION, priority) if self.scheduler is not None else nullcontext()
+
+    def _get_message_history_store(self, session_id: Optional[str] = None) -> MessageHistoryStore:
+        return MessageHistoryStore(
             session_id=session_id,
-            connection_string=self.mongo_uri,
+            connection_string=None,
             database_name=self.mongo_db_name,
-            collection_name=self.mongo_message_history_collection
+            collection_name=self.mongo_message_history_collection,
+            create_index=False,
+            client=self.history_client
         )
         
-    async def _get_context(self, inputs):
-        """Retrieve relevant context from vector store based on question."""
-        question = inputs["question"]
-        session_id = inputs.get("session_id")
+    async def _retrieve(self, question: str,
+                        session_id: Optional[str] = None) -> Tuple[List[float], BuiltContext, Dict[str, Any]]:
+        """Embed the question, retrieve and rerank candidate chunks and pack them into the context.
         
-        docs = await self.vector_store.search_documents(question, session_id=session_id)
+        Returns the question embedding, the built context and per-request retrieval info.
+        """
+        embedding = await self.vector_store.embed_query(question)
+        k = self.retrieval_candidates if self.reranker is not None else self.retrieval_final_k
+        docs = await self.vector_store.search_documents(question, session_id=session_id, k=k, embedding=embedding)
+        info: Dict[str, Any] = {"candidates": len(docs)}
+        if self.reranker is not None:
+            start = time.perf_counter()
+            docs = await asyncio.to_thread(self.reranker.rerank, question, docs, self.retrieval_final_k)
+            elapsed = time.perf_counter() - start
+            observe_stage("rerank", elapsed)
+            info["rerank_ms"] = round(1000 * elapsed, 3)
+        # The context is built here so the answer cache keys on the chunks the model actually sees.
+        context = self.context_builder.build(docs)
+        info.update(context.to_dict())
+        return embedding, context, info
         
-        if not docs:
-            context = "No documents found in your current session. Please upload relevant PDF documents first."
-        else:
-            context = "\n\n".join(doc.page_content for doc in docs)
+    def _get_conversation(self, session_id: Optional[str]) -> str:
+        """Rolling summary plus the recent messages, formatted for the prompt; empty when disabled."""
+        if not self.history_window_messages and self.summaries is None:
+            return ""
+        summary, through_id = self.summaries.get(session_id) if self.summaries is not None else ("", None)
+        messages = []
+        if self.history_window_messages:
+            messages, _ = self._get_message_history_store(session_id).page(self.history_window_messages)
+            if through_id is not None:
+                messages = [message for message in messages if message.id > str(through_id)]
+        lines = [f"Summary of earlier conversation: {summary}"] if summary else []
+        lines.extend(
+            f"{'User' if message.type == 'human' else 'Assistant'}: {message.content}" for message in messages
+        )
+        return "\n".join(lines)
+    
+    async def _summarize(self, session_id: Optional[str]) -> None:
+        """Fold messages that left the history window into the session's rolling summary."""
+        if self.summaries is None or session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        try:
+            store = self._get_message_history_store(session_id)
+            summary, through_id = await asyncio.to_thread(self.summaries.get, session_id)
+            pending = await asyncio.to_thread(store.count_after, through_id)
+            # Summarize in batches of at least one window, not after every message.
+            if pending < 2 * max(self.history_window_messages, 1):
+                return
+            # Oldest first: with no summary yet, page() without a cursor would return the newest messages.
+            after = through_id or ObjectId("0" * 24)
+            older, _ = await asyncio.to_thread(store.page, pending - self.history_window_messages, None, after)
+            transcript = "\n".join(
+                f"{'User' if message.type == 'human' else 'Assistant'}: {message.content}" for message in older
+            )
+            async with self._generation_slot(BACKGROUND):
+                response = await self.model.ainvoke(
+                    "Update the summary of a conversation between a user and a document assistant. "
+                    "Keep names, numbers and open questions; use at most 150 words.\n\n"
+                    f"Current summary: {summary or '(none)'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+                )
+            await asyncio.to_thread(self.summaries.set, session_id, response.content.strip(), ObjectId(older[-1].id))
+        except Exception as e:
+            logger.warning("conversation summary failed", session_id=session_id, error=str(e))
+        finally:
+            self._summarizing.discard(session_id)
+    
+    def _schedule_summary(self, session_id: Optional[str]) -> None:
+        if self.summaries is None:
+            return
+        task = asyncio.create_task(self._summarize(session_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
         
-        print(f"\n\n\n\n\nQUESTION: {question}\n\n\n\n\nCONTEXT: {context}\n\n\n\n\n")
-        return {
-            "context": context,
-            "question": question
-        }
+    def _get_context(self, question: str, built: BuiltContext, info: Dict[str, Any],
+                     conversation: str = "") -> dict:
+        """Build the chain inputs from the packed context, recording the prompt size in info."""
+        with time_stage("prompt_build"):
+            if not built.chunk_ids:
+                context = "No documents found in your current session. Please upload relevant PDF documents first."
+            else:
+                context = built.text
+            
+            inputs = {
+                "context": context,
+                "question": question,
+                "conversation": f"Conversation so far:\n{conversation}\n" if conversation else ""
+            }
+            info["prompt_tokens"] = estimate_tokens(self.prompt.format(**inputs))
+        if logger.sampled():
+            logger.debug("prompt built", question_chars=len(question), chunks=len(built.chunk_ids),
+                         prompt_tokens=info["prompt_tokens"], conversation_chars=len(conversation))
+        return inputs
 
     def _create_rag_chain(self) -> Runnable:
         """Create and return the RAG chain for question answering."""
@@ -56,7 +222,7 @@ class PDFAssistant:
             If you can't answer the question based on the context, just say that you don't know. 
             Use three sentences maximum and keep the answer concise 
             <|eot_id|><|start_header_id|>user<|end_header_id|> 
-                                                  
+            {conversation}
             Question: {question} 
                                                   
             Context: {context} 
@@ -64,28 +230,118 @@ class PDFAssistant:
             Answer: <|eot_id|><|start_header_id|>assistant<|end_header_id|>
         """)
         
-        return (
-            RunnableLambda(self._get_context)
-            | prompt
-            | self.model
-        )
+        self.prompt = prompt
+        return prompt | self.model
+    
+    async def _call_answer_cache(self, method, *args):
+        # The Mongo-backed cache does network I/O; the in-process one is quicker than a thread hop.
+        if isinstance(self.answer_cache, MongoAnswerCache):
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+    
+    async def _lookup_answer(self, session_id: Optional[str], embedding: List[float],
+                             context: BuiltContext, conversation: str = "") -> Optional[str]:
+        # A cached answer was given without this conversation, so follow-ups are always generated.
+        if self.answer_cache is None or not context.chunk_ids or conversation:
+            return None
+        cached = await self._call_answer_cache(self.answer_cache.lookup, session_id, embedding, context.chunk_ids)
+        return cached.answer if cached else None
+    
+    async def _store_answer(self, session_id: Optional[str], question: str, embedding: List[float],
+                            context: BuiltContext, answer: str, generation_seconds: float,
+                            conversation: str = "") -> None:
+        if self.answer_cache is not None and context.chunk_ids and answer and not conversation:
+            await self._call_answer_cache(
+                self.answer_cache.store, session_id, question, embedding, context.chunk_ids, answer, generation_seconds
+            )
         
     async def ask(self, question: str, session_id: Optional[str] = None) -> AIMessage:
-        """Process a question and return an answer using the RAG chain."""
+        """Process a question and return an answer using the RAG chain.
+        
+        Raises SchedulerBusyError when the chat model's queue is full.
+        """
+        self.check_admission()
         message_history = self._get_message_history_store(session_id)
-        message_history.add_message(HumanMessage(content=question))
+        conversation = await asyncio.to_thread(self._get_conversation, session_id)
+        await asyncio.to_thread(message_history.add_message, HumanMessage(content=question))
         
-        chain = self._create_rag_chain()
-        response = await chain.ainvoke({"question": question, "session_id": session_id})
-        assistant_message = AIMessage(content=response.content)
-        message_history.add_message(assistant_message)
+        embedding, context, info = await self._retrieve(question, session_id)
+        answer = await self._lookup_answer(session_id, embedding, context, conversation)
+        if answer is None:
+            inputs = self._get_context(question, context, info, conversation)
+            async with self._generation_slot():
+                start = time.perf_counter()
+                response = await self.chain.ainvoke(inputs)
+            generation_seconds = time.perf_counter() - start
+            observe_stage("generation", generation_seconds)
+            answer = response.content
+            if response.response_metadata.get("prompt_eval_count") is not None:
+                info["prompt_eval_count"] = response.response_metadata["prompt_eval_count"]
+            await self._store_answer(session_id, question, embedding, context, answer, generation_seconds, conversation)
+        
+        await asyncio.to_thread(message_history.add_message, AIMessage(content=answer))
+        self._schedule_summary(session_id)
+        
+        return AIMessage(content=answer, response_metadata={"retrieval": info})
+    
+    async def astream(self, question: str, session_id: Optional[str] = None,
+                      retrieval_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Process a question and yield the answer tokens as the model generates them.
+        
+        The answer is persisted to the message history once the stream ends, including
+        the partial answer when the consumer stops iterating early. When given,
+        retrieval_info is filled with the per-request retrieval info. Raises
+        SchedulerBusyError, before anything is stored, when the chat model's queue is full.
+        """
+        self.check_admission()
+        message_history = self._get_message_history_store(session_id)
+        conversation = await asyncio.to_thread(self._get_conversation, session_id)
+        await asyncio.to_thread(message_history.add_message, HumanMessage(content=question))
         
-        return assistant_message
+        tokens = []
+        try:
+            embedding, context, info = await self._retrieve(question, session_id)
+            if retrieval_info is None:
+                retrieval_info = {}
+            retrieval_info.update(info)
+            answer = await self._lookup_answer(session_id, embedding, context, conversation)
+            if answer is not None:
+                tokens.append(answer)
+                yield answer
+                return
+            
+            inputs = self._get_context(question, context, retrieval_info, conversation)
+            # The queue wait counts towards time to first token, as the user waits for it too.
+            start = time.perf_counter()
+            async with self._generation_slot():
+                async for chunk in self.chain.astream(inputs):
+                    if chunk.content:
+                        if not tokens:
+                            observe_stage("time_to_first_token", time.perf_counter() - start)
+                        tokens.append(chunk.content)
+                        yield chunk.content
+                    if chunk.response_metadata.get("prompt_eval_count") is not None:
+                        retrieval_info["prompt_eval_count"] = chunk.response_metadata["prompt_eval_count"]
+            generation_seconds = time.perf_counter() - start
+            observe_stage("generation", generation_seconds)
+            await self._store_answer(session_id, question, embedding, context, "".join(tokens),
+                                     generation_seconds, conversation)
+        finally:
+            if tokens:
+                # Shielded so the answer is still saved when the stream is cancelled by a disconnect.
+                await asyncio.shield(
+                    asyncio.to_thread(message_history.add_message, AIMessage(content="".join(tokens)))
+                )
+                self._schedule_summary(session_id)
     
-    def get_message_history(self, session_id: str) -> List[BaseMessage]:
+    async def get_message_history(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                                  after: Optional[str] = None) -> Tuple[List[BaseMessage], bool]:
+        """One page of the session's messages, see MessageHistoryStore.page. Cursors are message ids."""
         message_history = self._get_message_history_store(session_id)
-        return message_history.messages
+        return await asyncio.to_thread(message_history.page, limit, parse_cursor(before), parse_cursor(after))
     
-    def delete_message_history(self, session_id: str) -> None:
+    async def delete_message_history(self, session_id: str) -> None:
         message_history = self._get_message_history_store(session_id)
-        message_history.clear()
\ No newline at end of file
+        await asyncio.to_thread(message_history.clear)
+        if self.summaries is not None:
+            await asyncio.to_thread(self.summaries.delete, session_id)
\ No newline at end of file
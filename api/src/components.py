@@ -0,0 +1,253 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from src.answer_cache import MongoAnswerCache
+from src.coordination import worker_id
+from src.metrics import Gauge, MetricsRegistry
+from src.model_scheduler import PRIORITY_NAMES
+from src.structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from src.assistant import PDFAssistant
+    from src.coordination import JobStatusStore, LeaseStore
+    from src.document_processors import DocumentProcessor
+    from src.document_store import DocumentStore
+    from src.file_handler import FileHandler
+    from src.ingestion_queue import IngestionQueue
+    from src.model_scheduler import ModelScheduler
+    from src.reconciler import OrphanReconciler
+    from src.reindexer import Reindexer
+    from src.vector_store import VectorStore
+
+logger = get_logger(__name__)
+
+
+class Components:
+    """The API's long-lived components, built once and shared by every endpoint.
+
+    Uploads, deletes, re-indexing and the assistant's retrieval all use the one
+    vector store, so there is a single Chroma client and embedding cache.
+
+    Each API worker process builds its own, at startup. With several workers,
+    leases and job_statuses are the Mongo-backed state they share.
+    """
+
+    def __init__(self, file_handler: "FileHandler", document_processor: "DocumentProcessor",
+                 vector_store: "VectorStore", document_store: "DocumentStore", assistant: "PDFAssistant",
+                 ingestion_queue: "IngestionQueue", reindexer: "Reindexer", reconciler: "OrphanReconciler",
+                 model_scheduler: "ModelScheduler", leases: Optional["LeaseStore"] = None,
+                 job_statuses: Optional["JobStatusStore"] = None):
+        self.file_handler = file_handler
+        self.document_processor = document_processor
+        self.vector_store = vector_store
+        self.document_store = document_store
+        self.assistant = assistant
+        self.ingestion_queue = ingestion_queue
+        self.reindexer = reindexer
+        self.reconciler = reconciler
+        self.model_scheduler = model_scheduler
+        self.leases = leases
+        self.job_statuses = job_statuses
+        self._started = False
+        cache = assistant.answer_cache
+        if cache is not None:
+            # The Mongo-backed cache is invalidated in a background thread, off the event loop.
+            vector_store.add_change_listener(cache.ainvalidate if isinstance(cache, MongoAnswerCache) else cache.invalidate)
+
+    async def start(self) -> None:
+        """Create the Mongo indexes, check the vector index and start the ingestion workers and reconciler."""
+        await self.document_store.ensure_indexes()
+        if self.job_statuses is not None:
+            await self.job_statuses.ensure_indexes()
+        await asyncio.to_thread(self.assistant.ensure_indexes)
+        indexed = await self.vector_store.backfill_keyword_index()
+        if indexed:
+            logger.info("backfilled keyword index", chunks=indexed)
+        if await asyncio.to_thread(self.vector_store.has_unpartitioned_chunks):
+            logger.warning("Session chunks found in the shared vector collection, which is searched as well until "
+                           "`python -m scripts.partition_vector_store` has moved them into their partitions")
+        if self.vector_store.generation.fingerprint != self.reindexer.target.fingerprint:
+            logger.warning("The vector index was built with other embedding or chunk settings; "
+                           "POST /reindex to rebuild it with the current ones")
+        if self.leases is not None:
+            await self.leases.start()
+        await self.ingestion_queue.start()
+        self.reconciler.schedule()
+        self._started = True
+
+    async def warm_up(self) -> Dict[str, float]:
+        """Load the chat and embedding models; returns how long each took, in seconds.
+
+        A model that fails to load is logged and left for the first request to load.
+        """
+        async def timed(name: str, load: Callable[[], Any]) -> None:
+            start = time.perf_counter()
+            try:
+                await load()
+            except Exception as e:
+                logger.warning("model warm-up failed", model=name, error=str(e))
+                return
+            timings[name] = round(time.perf_counter() - start, 3)
+
+        timings: Dict[str, float] = {}
+        await asyncio.gather(
+            timed("embedding", self.vector_store.warm_up),
+            timed("generation", self.assistant.warm_up)
+        )
+        return timings
+
+    async def stop(self) -> None:
+        if self._started:
+            await self.reconciler.stop()
+            await self.reindexer.stop()
+            await self.ingestion_queue.stop()
+            if self.leases is not None:
+                await self.leases.stop()
+        self.document_processor.close()
+        self.assistant.close()
+
+    def register_metrics(self, registry: MetricsRegistry) -> None:
+        registry.register(Gauge(
+            "rag_ingestion_queue_depth", "Documents and batches waiting for an ingestion worker.",
+            lambda: self.ingestion_queue.queue.qsize()
+        ))
+        registry.register(Gauge(
+            "rag_embedding_batches_in_flight", "Ingestion embedding requests currently sent to the embedding server.",
+            lambda: self.vector_store.embedding_pipeline.in_flight
+        ))
+        registry.register(Gauge(
+            "rag_model_queue_depth", "Model requests waiting for an in-flight slot, by model and priority.",
+            lambda: {
+                (name, PRIORITY_NAMES[priority]): count
+                for name, lane in self.model_scheduler.lanes.items() for priority, count in lane.queued.items()
+            },
+            ("resource", "priority")
+        ))
+        registry.register(Gauge(
+            "rag_model_requests_in_flight", "Requests currently sent to each model server.",
+            lambda: {(name,): lane.in_flight for name, lane in self.model_scheduler.lanes.items()},
+            ("resource",)
+        ))
+        registry.register(Gauge(
+            "rag_model_requests_rejected_total", "Interactive model requests rejected because the queue was full.",
+            lambda: {(name,): lane.rejected for name, lane in self.model_scheduler.lanes.items()},
+            ("resource",),
+            metric_type="counter"
+        ))
+
+    async def stats(self) -> Dict[str, Any]:
+        cache = self.assistant.answer_cache
+        if isinstance(cache, MongoAnswerCache):
+            answer_cache = await cache.astats()
+        else:
+            answer_cache = cache.stats() if cache else None
+        return {
+            "worker": worker_id(),
+            "embedding_cache": self.vector_store.cache_stats(),
+            "embedding_pipeline": self.vector_store.embedding_pipeline.stats(),
+            "answer_cache": answer_cache,
+            "reranker": self.assistant.reranker.stats() if self.assistant.reranker else None,
+            "context": self.assistant.context_builder.stats(),
+            "model_scheduler": self.model_scheduler.stats(),
+            "reconciler": self.reconciler.to_dict()
+        }
+
+
+class StartupPhase:
+    BUILDING = "building"
+    PREPARING = "preparing"
+    WARMING_UP = "warming_up"
+    READY = "ready"
+
+
+class Startup:
+    """Builds and starts the components in the background, so the server answers health checks meanwhile.
+
+    build runs in a thread: it imports the langchain, Chroma and Ollama modules
+    and constructs the components. A failed build or start (say, Mongo not up
+    yet) is retried every retry_seconds. Requests are served from the end of
+    the preparing phase; ready also waits for the model warm-up.
+    """
+
+    def __init__(self, build: Callable[[], Components], warm_up: bool = True, retry_seconds: float = 5.0,
+                 registry: Optional[MetricsRegistry] = None):
+        self.build = build
+        self.warm_up = warm_up
+        self.retry_seconds = retry_seconds
+        self.registry = registry
+        self.phase = StartupPhase.BUILDING
+        self.components: Optional[Components] = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+        # Seconds spent in each phase; ready is the total since begin().
+        self.timings: Dict[str, float] = {}
+        self.warm_up_timings: Dict[str, float] = {}
+        self._began = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def serving(self) -> bool:
+        return self.phase in (StartupPhase.WARMING_UP, StartupPhase.READY)
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == StartupPhase.READY
+
+    def begin(self) -> None:
+        self._began = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            self.attempts += 1
+            try:
+                if self.components is None:
+                    self.phase = StartupPhase.BUILDING
+                    start = time.perf_counter()
+                    self.components = await asyncio.to_thread(self.build)
+                    self.timings["build"] = round(time.perf_counter() - start, 3)
+                    if self.registry is not None:
+                        self.components.register_metrics(self.registry)
+                self.phase = StartupPhase.PREPARING
+                start = time.perf_counter()
+                await self.components.start()
+                self.timings["prepare"] = round(time.perf_counter() - start, 3)
+                self.error = None
+                break
+            except Exception as e:
+                self.error = str(e)
+                # The traceback once; a backend that is still down would repeat it every retry.
+                log = logger.exception if self.attempts == 1 else logger.warning
+                log("startup failed, retrying", phase=self.phase, attempt=self.attempts, error=self.error,
+                    retry_in_seconds=self.retry_seconds)
+                await asyncio.sleep(self.retry_seconds)
+        if self.warm_up:
+            self.phase = StartupPhase.WARMING_UP
+            start = time.perf_counter()
+            self.warm_up_timings = await self.components.warm_up()
+            self.timings["warm_up"] = round(time.perf_counter() - start, 3)
+        self.phase = StartupPhase.READY
+        self.timings["ready"] = round(time.perf_counter() - self._began, 3)
+        logger.info("ready", **self.timings)
+
+    async def wait_ready(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.components is not None:
+            await self.components.stop()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phase": self.phase,
+            "attempts": self.attempts,
+            "error": self.error,
+            "timings": self.timings,
+            "warm_up": self.warm_up_timings,
+        }
@@ -0,0 +1,193 @@
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from src.keyword_index import tokenize
+
+# Rough characters per token of English text for Llama-style tokenizers. Good
+# enough to budget prompts without loading the model's tokenizer.
+CHARS_PER_TOKEN = 4
+# Shortest suffix/prefix match accepted as chunk overlap when start_index is unknown.
+MIN_TEXT_OVERLAP = 32
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    """Word n-grams of text, the fingerprint compared to find near-duplicate chunks."""
+    terms = tokenize(text)
+    return {tuple(terms[i:i + size]) for i in range(max(1, len(terms) - size + 1))} if terms else set()
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right (0 below MIN_TEXT_OVERLAP)."""
+    for length in range(min(len(left), len(right)), MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+class _Segment:
+    """A contiguous span of one page, made of one or more merged chunks."""
+
+    def __init__(self, doc: Document):
+        self.source = doc.metadata.get("source")
+        self.page = doc.metadata.get("page")
+        self.start = doc.metadata.get("start_index")
+        self.text = doc.page_content
+        self.chunk_ids = [doc.id]
+        self.shingles = shingles(doc.page_content)
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+    def merged_text(self, doc: Document) -> Optional[str]:
+        """Text of this segment joined with an overlapping or adjacent chunk of the same page, if it is one."""
+        if doc.metadata.get("source") != self.source or doc.metadata.get("page") != self.page or self.source is None:
+            return None
+        text, start = doc.page_content, doc.metadata.get("start_index")
+        if self.start is not None and start is not None:
+            end = start + len(text)
+            if start <= self.start <= end:
+                return text + self.text[end - self.start:] if end < self.end else text
+            if self.start <= start <= self.end:
+                return self.text + text[self.end - start:] if end > self.end else self.text
+            return None
+        # Chunks indexed before start_index was recorded: match the overlap in the text itself.
+        if text in self.text:
+            return self.text
+        overlap = _text_overlap(self.text, text)
+        if overlap:
+            return self.text + text[overlap:]
+        overlap = _text_overlap(text, self.text)
+        if overlap:
+            return text + self.text[overlap:]
+        return None
+
+    def merge(self, doc: Document, text: str) -> None:
+        start = doc.metadata.get("start_index")
+        if self.start is not None and start is not None:
+            self.start = min(self.start, start)
+        self.text = text
+        self.chunk_ids.append(doc.id)
+        self.shingles |= shingles(doc.page_content)
+
+
+class BuiltContext:
+    def __init__(self, text: str, chunk_ids: List[str], tokens: int, tokens_saved: int,
+                 merged: int, duplicates: int):
+        self.text = text
+        self.chunk_ids = chunk_ids
+        self.tokens = tokens
+        self.tokens_saved = tokens_saved
+        self.merged = merged
+        self.duplicates = duplicates
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "context_tokens": self.tokens,
+            "tokens_saved": self.tokens_saved,
+            "chunks": len(self.chunk_ids),
+            "merged_chunks": self.merged,
+            "duplicate_chunks": self.duplicates,
+        }
+
+
+class ContextBuilder:
+    """Packs ranked chunks into the prompt context within a token budget.
+
+    Chunks are taken in rank order. A chunk overlapping or adjacent to one
+    already taken from the same source and page is merged into it, so the
+    text shared through chunk_overlap appears once. A chunk whose word
+    3-grams are at least dedup_threshold contained in a taken segment is
+    dropped as a near-duplicate, e.g. the same passage in another file.
+    Segments keep the rank of their best chunk; within a segment the text is
+    in document order. Token counts are estimates (CHARS_PER_TOKEN).
+    """
+
+    def __init__(self, token_budget: int = 1500, dedup_threshold: float = 0.9, separator: str = "\n\n"):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.separator = separator
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_tokens = 0
+        self.total_tokens_saved = 0
+
+    def _is_duplicate(self, fingerprint: Set[Tuple[str, ...]], segments: List[_Segment]) -> bool:
+        if not fingerprint:
+            return False
+        for segment in segments:
+            # Containment rather than Jaccard, so a chunk already covered by a larger merged segment counts.
+            if len(fingerprint & segment.shingles) / len(fingerprint) >= self.dedup_threshold:
+                return True
+        return False
+
+    def _used_tokens(self, segments: List[_Segment]) -> int:
+        return estimate_tokens(self.separator.join(segment.text for segment in segments))
+
+    def build(self, docs: List[Document]) -> BuiltContext:
+        segments: List[_Segment] = []
+        # What the context would cost joining every chunk taken or dropped as a duplicate as-is.
+        raw_tokens = raw_chunks = merged = duplicates = 0
+        for doc in docs:
+            used = self._used_tokens(segments)
+            doc_tokens = estimate_tokens(doc.page_content)
+
+            if self._is_duplicate(shingles(doc.page_content), segments):
+                duplicates += 1
+                raw_tokens += doc_tokens
+                raw_chunks += 1
+                continue
+
+            for segment in segments:
+                text = segment.merged_text(doc)
+                if text is not None:
+                    if used + estimate_tokens(text) - estimate_tokens(segment.text) <= self.token_budget:
+                        segment.merge(doc, text)
+                        raw_tokens += doc_tokens
+                        raw_chunks += 1
+                        merged += 1
+                    break
+            else:
+                separator_tokens = estimate_tokens(self.separator) if segments else 0
+                if used + separator_tokens + doc_tokens <= self.token_budget:
+                    segments.append(_Segment(doc))
+                elif not segments:
+                    # The best chunk alone is over budget: truncate it rather than send no context.
+                    doc = Document(page_content=doc.page_content[:self.token_budget * CHARS_PER_TOKEN],
+                                   metadata=doc.metadata, id=doc.id)
+                    segments.append(_Segment(doc))
+                else:
+                    continue
+                raw_tokens += estimate_tokens(doc.page_content)
+                raw_chunks += 1
+
+        text = self.separator.join(segment.text for segment in segments)
+        tokens = estimate_tokens(text)
+        raw_tokens += max(0, raw_chunks - 1) * estimate_tokens(self.separator)
+        context = BuiltContext(
+            text=text,
+            chunk_ids=[chunk_id for segment in segments for chunk_id in segment.chunk_ids],
+            tokens=tokens,
+            tokens_saved=max(0, raw_tokens - tokens),
+            merged=merged,
+            duplicates=duplicates
+        )
+        with self._lock:
+            self.requests += 1
+            self.total_tokens += context.tokens
+            self.total_tokens_saved += context.tokens_saved
+        return context
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_context_tokens": round(self.total_tokens / self.requests, 1) if self.requests else 0.0,
+                "tokens_saved": self.total_tokens_saved,
+            }
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+from src.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def worker_id() -> str:
+    """Identifies this API process among the workers and replicas sharing the Mongo database."""
+    return _WORKER_ID
+
+
+class LeaseStore:
+    """Named locks in Mongo, each held by one worker process at a time, with an optional published status."""
+
+    def __init__(self, collection, ttl_seconds: float = 30.0, owner: Optional[str] = None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or worker_id()
+        # Held lease name -> callback returning its status, if it publishes one.
+        self._held: Dict[str, Optional[Callable[[], Dict[str, Any]]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._renew_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._held:
+            await self.release(*self._held)
+
+    async def acquire(self, name: str, status: Optional[Callable[[], Dict[str, Any]]] = None) -> bool:
+        """Take the lease unless another live worker holds it; taking one already held renews it."""
+        now = time.time()
+        fields = {"owner": self.owner, "expires_at": now + self.ttl_seconds, "status": status() if status else None}
+        for query in ({"_id": name, "owner": self.owner}, {"_id": name, "expires_at": {"$lt": now}}):
+            if (await self.collection.update_one(query, {"$set": fields})).matched_count:
+                break
+        else:
+            try:
+                await self.collection.insert_one({"_id": name, **fields})
+            except DuplicateKeyError:
+                return False
+        self._held[name] = status
+        return True
+
+    async def acquire_all(self, names: Iterable[str], poll_seconds: float = 0.5) -> None:
+        """Wait until every one of the leases is taken. Partial sets are given back, so two waiters cannot deadlock."""
+        names = sorted(set(names))
+        while True:
+            taken: List[str] = []
+            for name in names:
+                if not await self.acquire(name):
+                    break
+                taken.append(name)
+            else:
+                return
+            if taken:
+                await self.release(*taken)
+            await asyncio.sleep(poll_seconds)
+
+    async def release(self, *names: str, status: Optional[Dict[str, Any]] = None) -> None:
+        """Give the leases up. Those publishing a status keep it, replaced by status if given; the rest are removed."""
+        publishing = [name for name in names if self._held.get(name) is not None or status is not None]
+        for name in names:
+            self._held.pop(name, None)
+        if publishing:
+            fields: Dict[str, Any] = {"expires_at": 0.0}
+            if status is not None:
+                fields["status"] = status
+            await self.collection.update_many({"_id": {"$in": publishing}, "owner": self.owner}, {"$set": fields})
+        others = [name for name in names if name not in publishing]
+        if others:
+            await self.collection.delete_many({"_id": {"$in": others}, "owner": self.owner})
+
+    async def published(self, name: str) -> Optional[Dict[str, Any]]:
+        """The last status published with the lease, by whichever worker held it."""
+        lease = await self.collection.find_one({"_id": name})
+        return lease.get("status") if lease else None
+
+    async def renew(self) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        for name, status in list(self._held.items()):
+            fields: Dict[str, Any] = {"expires_at": expires_at}
+            if status is not None:
+                fields["status"] = status()
+            result = await self.collection.update_one({"_id": name, "owner": self.owner}, {"$set": fields})
+            if not result.matched_count:
+                self._held.pop(name, None)
+                logger.warning("lease lost to another worker", lease=name)
+
+    async def _renew_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            try:
+                await self.renew()
+            except Exception as e:
+                logger.warning("lease renewal failed", error=str(e))
+
+
+class JobStatusStore:
+    """Status of ingestion jobs and batches in Mongo, shared by the workers."""
+
+    def __init__(self, collection, lease_seconds: float = 30.0, retention_seconds: float = 86400.0):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("file_hashes")
+
+    async def publish(self, entries: List[Dict[str, Any]]) -> None:
+        """Store (id, kind, session_id, file_hashes, finished, status) entries, replacing earlier ones."""
+        if not entries:
+            return
+        now = time.time()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.retention_seconds)
+        await asyncio.gather(*[
+            self.collection.update_one(
+                {"_id": entry["id"]},
+                {"$set": {
+                    **{key: value for key, value in entry.items() if key != "id"},
+                    "worker": worker_id(),
+                    "lease_until": now + self.lease_seconds,
+                    "expires_at": expires_at,
+                }},
+                upsert=True
+            )
+            for entry in entries
+        ])
+
+    async def get(self, kind: str, item_id: str) -> Optional[Dict[str, Any]]:
+        entry = await self.collection.find_one({"_id": item_id, "kind": kind})
+        if entry is None:
+            return None
+        if kind == "job" and not entry["finished"] and entry["lease_until"] < time.time():
+            entry["status"] = {**entry["status"], "stage": "failed", "error": "The worker running this job stopped"}
+        return entry
+
+    async def pending_hashes(self, file_hashes: Optional[List[str]] = None) -> Set[str]:
+        """File hashes of unfinished jobs of live workers, among file_hashes or all of them."""
+        query: Dict[str, Any] = {"kind": "job", "finished": False, "lease_until": {"$gt": time.time()}}
+        if file_hashes is not None:
+            if not file_hashes:
+                return set()
+            query["file_hashes"] = {"$in": file_hashes}
+        entries = await self.collection.find(query, projection={"file_hashes": True}).to_list()
+        return {file_hash for entry in entries for file_hash in entry.get("file_hashes", [])}
@@ -1,32 +1,133 @@
+import asyncio
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+
+from src.metrics import time_stage
+
+
+def _normalize_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Lower-case keys without the leading slash, string values and ISO dates, as PyPDFLoader stores them."""
+    normalized: Dict[str, Any] = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key.lstrip("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            value = value.strip()
+        normalized[key] = value
+    return normalized
+
+
+def _read_document_metadata(file_path: str) -> Dict[str, Any]:
+    """The metadata PyPDFLoader gives every page of a PDF, page number aside. Runs inside a worker process."""
+    reader = PdfReader(file_path)
+    return _normalize_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": file_path, "total_pages": len(reader.pages)}
+    )
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str, str]]:
+    """Extract the text of pages [start, end) of a PDF. Runs inside a worker process."""
+    reader = PdfReader(file_path)
+    # page_labels computes every page's label on each access: read it once.
+    labels = reader.page_labels
+    return [
+        (page_number, reader.pages[page_number].extract_text().strip(), labels[page_number])
+        for page_number in range(start, end)
+    ]
+
 
 class DocumentProcessor:
     """Class for processing document files."""
-    
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 parse_workers: int = 1, pages_per_task: int = 8):
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, 
-            chunk_overlap=chunk_overlap
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            # Lets the context builder merge overlapping neighbour chunks by position.
+            add_start_index=True
         )
-    
-    async def process(self, file_path: Path, session_id: Optional[str] = None) -> List:
-        """Process a document file and return the processed chunks."""
+        self.parse_workers = parse_workers
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Not forked: the API process runs threads (uvicorn, to_thread, pymongo monitors) whose locks
+            # a forked child could inherit held.
+            self._executor = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    def close(self) -> None:
+        """Shut down the parsing process pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def _load_pages(self, file_path: Path) -> List[Document]:
         loader = PyPDFLoader(file_path)
         pages = []
         async for page in loader.alazy_load():
             pages.append(page)
-            
-        document_splits = self.text_splitter.split_documents(pages)
+        return pages
+
+    async def _load_pages_parallel(self, file_path: Path) -> List[Document]:
+        """Extract page ranges on separate processes and merge them back in page order.
         
+        Pages get the same metadata as from PyPDFLoader, so chunks do not depend on the number of workers.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        metadata = await loop.run_in_executor(executor, _read_document_metadata, str(file_path))
+        total_pages = metadata["total_pages"]
+
+        page_ranges = [
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        ]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, _extract_page_range, str(file_path), start, end)
+            for start, end in page_ranges
+        ])
+
+        return [
+            Document(page_content=text, metadata={**metadata, "page": page_number, "page_label": page_label})
+            for page_range in results
+            for page_number, text, page_label in page_range
+        ]
+
+    async def process(self, file_path: Path, session_id: Optional[str] = None) -> List:
+        """Process a document file and return the processed chunks."""
+        with time_stage("parse"):
+            if self.parse_workers > 1:
+                pages = await self._load_pages_parallel(file_path)
+            else:
+                pages = await self._load_pages(file_path)
+
+        with time_stage("split"):
+            document_splits = await asyncio.to_thread(self.text_splitter.split_documents, pages)
+
         for i, doc in enumerate(document_splits):
             if not isinstance(doc.metadata, dict):
                 doc.metadata = {}
-            
+
             doc.metadata["session_id"] = session_id
             doc.metadata["source"] = str(file_path)
             doc.metadata["page"] = doc.metadata.get("page", i)
-        
-        return document_splits 
\ No newline at end of file
+
+        return document_splits
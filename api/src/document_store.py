@@ -1,36 +1,161 @@
-from pymongo import MongoClient
-from typing import List, Dict, Any, Optional
+from pymongo import AsyncMongoClient
+from typing import List, Dict, Any, AsyncIterator, Optional
 from pathlib import Path
 
+from src.metrics import time_stage
+
 class DocumentStore:
     def __init__(self, mongo_uri: str, 
                  db_name: str,
-                 collection_name: str):
-        """Initialize MongoDB connection and collection"""
-        self.mongo_client = MongoClient(mongo_uri)
+                 collection_name: str,
+                 client=None):
+        """Initialize MongoDB connection and collection; client replaces the one built from mongo_uri."""
+        self.mongo_client = client if client is not None else AsyncMongoClient(mongo_uri)
         self.db = self.mongo_client[db_name]
         self.documents_collection = self.db[collection_name]
     
-    def add_document(self, file_path: Path, filename: str, splits_ids: List[str], 
-                     session_id: Optional[str] = None) -> str:
-        document_entry = {
+    async def ensure_indexes(self) -> None:
+        await self.documents_collection.create_index("file_hash")
+        await self.documents_collection.create_index("session_id")
+    
+    @staticmethod
+    def document_entry(file_path: Path, filename: str, splits_ids: List[str],
+                       session_id: Optional[str] = None, file_hash: Optional[str] = None,
+                       fingerprint: Optional[str] = None) -> Dict[str, Any]:
+        """fingerprint identifies the index generation the splits were written to."""
+        return {
             "file_path": str(file_path),
             "filename": filename,
             "document_splits": splits_ids,
-            "session_id": session_id
+            "session_id": session_id,
+            "file_hash": file_hash,
+            "fingerprint": fingerprint
         }
+    
+    @staticmethod
+    def split_ids(document: Dict[str, Any]) -> List[str]:
+        """Chunk ids of a document in the live index and, during a re-index, in the shadow index."""
+        return list(document.get("document_splits", [])) + list(document.get("shadow_splits", []))
+    
+    async def add_document(self, file_path: Path, filename: str, splits_ids: List[str], 
+                           session_id: Optional[str] = None, file_hash: Optional[str] = None,
+                           fingerprint: Optional[str] = None) -> str:
+        document_entry = self.document_entry(file_path, filename, splits_ids, session_id, file_hash, fingerprint)
         
-        document_id = self.documents_collection.insert_one(document_entry).inserted_id
+        with time_stage("mongo_write"):
+            document_id = (await self.documents_collection.insert_one(document_entry)).inserted_id
         return str(document_id)
     
-    def get_documents(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        documents = list(self.documents_collection.find({"session_id": session_id}))
+    async def add_documents(self, document_entries: List[Dict[str, Any]]) -> List[str]:
+        """Insert several document_entry() dicts in one round trip, returning their ids in order."""
+        if not document_entries:
+            return []
+        with time_stage("mongo_write"):
+            result = await self.documents_collection.insert_many(document_entries)
+        return [str(document_id) for document_id in result.inserted_ids]
+    
+    async def get_documents(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        documents = await self.documents_collection.find({"session_id": session_id}).to_list()
         return documents
     
-    def get_document_names(self, session_id: Optional[str] = None) -> List[str]:
-        documents = self.get_documents(session_id)
+    async def find_document_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Find any stored document with the given content hash."""
+        return await self.documents_collection.find_one({"file_hash": file_hash})
+    
+    async def find_documents_by_hash(self, file_hash: str) -> List[Dict[str, Any]]:
+        return await self.documents_collection.find(
+            {"file_hash": file_hash}, projection={"file_path": True, "session_id": True, "file_hash": True}
+        ).to_list()
+    
+    async def find_session_document_by_hash(self, file_hash: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Find the document with the given content hash owned by a session."""
+        return await self.documents_collection.find_one({"file_hash": file_hash, "session_id": session_id})
+    
+    async def find_other_owner(self, file_hash: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Find a document entry sharing the file hash that belongs to a different session."""
+        return await self.documents_collection.find_one(
+            {"file_hash": file_hash, "session_id": {"$ne": session_id}}
+        )
+    
+    async def find_other_owners(self, file_hashes: List[str], session_id: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """For each of the file hashes also stored by a different session, one such session, in one query."""
+        if not file_hashes:
+            return {}
+        documents = await self.documents_collection.find(
+            {"file_hash": {"$in": file_hashes}, "session_id": {"$ne": session_id}},
+            projection={"file_hash": True, "session_id": True}
+        ).to_list()
+        return {doc["file_hash"]: doc["session_id"] for doc in documents}
+    
+    async def iterate_references(self) -> AsyncIterator[Dict[str, Any]]:
+        """Every document's file path and split ids, streamed from one cursor."""
+        cursor = self.documents_collection.find(
+            {}, projection={"file_path": True, "file_hash": True, "document_splits": True, "shadow_splits": True}
+        )
+        async for document in cursor:
+            yield document
+    
+    async def get_document_names(self, session_id: Optional[str] = None) -> List[str]:
+        documents = await self.documents_collection.find(
+            {"session_id": session_id}, projection={"filename": True}
+        ).to_list()
         return [doc["filename"] for doc in documents]
     
-    def delete_documents(self, session_id: Optional[str] = None) -> int:
-        result = self.documents_collection.delete_many({"session_id": session_id})
-        return result.deleted_count 
\ No newline at end of file
+    async def delete_documents(self, session_id: Optional[str] = None) -> int:
+        result = await self.documents_collection.delete_many({"session_id": session_id})
+        return result.deleted_count 
+    
+    async def delete_documents_by_id(self, document_ids: List[Any]) -> int:
+        if not document_ids:
+            return 0
+        result = await self.documents_collection.delete_many({"_id": {"$in": document_ids}})
+        return result.deleted_count
+    
+    async def find_stale_documents(self, fingerprint: str) -> List[Dict[str, Any]]:
+        """Documents whose splits are neither live nor shadowed in the generation with this fingerprint."""
+        return await self.documents_collection.find(
+            {"fingerprint": {"$ne": fingerprint}, "shadow_fingerprint": {"$ne": fingerprint}},
+            projection={"file_path": True, "session_id": True, "file_hash": True}
+        ).to_list()
+    
+    async def set_splits(self, document_ids: List[Any], splits_ids: List[str], fingerprint: str,
+                         shadow: bool = False) -> List[Dict[str, Any]]:
+        """Point documents at re-indexed splits, returning those of them that still exist.
+        
+        The returned documents hold their session_id and the splits they pointed at before.
+        With shadow, the splits are recorded next to the live ones until promote_shadow().
+        """
+        fields = ("shadow_splits", "shadow_fingerprint") if shadow else ("document_splits", "fingerprint")
+        existing = await self.documents_collection.find(
+            {"_id": {"$in": document_ids}}, projection={"session_id": True, fields[0]: True}
+        ).to_list()
+        await self.documents_collection.update_many(
+            {"_id": {"$in": document_ids}},
+            {"$set": {fields[0]: splits_ids, fields[1]: fingerprint}}
+        )
+        return existing
+    
+    async def shadow_split_ids(self, fingerprint: str) -> List[str]:
+        documents = await self.documents_collection.find(
+            {"shadow_fingerprint": fingerprint}, projection={"shadow_splits": True}
+        ).to_list()
+        return [split_id for doc in documents for split_id in doc.get("shadow_splits", [])]
+    
+    async def clear_shadow(self, keep_fingerprint: Optional[str] = None) -> int:
+        """Forget shadow splits of abandoned re-indexes, other than those for keep_fingerprint."""
+        result = await self.documents_collection.update_many(
+            {"shadow_fingerprint": {"$exists": True, "$ne": keep_fingerprint}},
+            {"$unset": {"shadow_splits": "", "shadow_fingerprint": ""}}
+        )
+        return result.modified_count
+    
+    async def promote_shadow(self, fingerprint: str) -> int:
+        """Make the shadow splits recorded for fingerprint the live ones, in one update."""
+        result = await self.documents_collection.update_many(
+            {"shadow_fingerprint": fingerprint},
+            [
+                {"$set": {"document_splits": "$shadow_splits", "fingerprint": "$shadow_fingerprint"}},
+                {"$unset": ["shadow_splits", "shadow_fingerprint"]}
+            ]
+        )
+        return result.modified_count
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache stored in SQLite as float32 blobs.
+
+    Entries are keyed by a hash of the embedding model and the normalized text
+    and evicted least-recently-used once the cache grows past max_entries.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 200_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        payload = "\0".join((model_name, kind, normalize_text(text)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._connection.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]) -> None:
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+            )
+            self._size += max(cursor.rowcount, 0)
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        overflow = self._size - self.max_entries
+        if overflow <= 0:
+            return
+        cursor = self._connection.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (overflow,)
+        )
+        self._size -= cursor.rowcount
+        self.evictions += cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an EmbeddingCache."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def _keys(self, texts: List[str], kind: str) -> List[str]:
+        return [self.cache.make_key(self.model_name, kind, text) for text in texts]
+
+    @staticmethod
+    def _missing(texts: List[str], keys: List[str], cached: Dict[str, List[float]]) -> Dict[str, str]:
+        # Preserve order and embed each distinct missing text only once.
+        return {key: text for key, text in zip(keys, texts) if key not in cached}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys(texts, "document")
+        cached = self.cache.get_many(keys)
+        missing = self._missing(texts, keys, cached)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys(texts, "document")
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+        missing = self._missing(texts, keys, cached)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.cache.put_many, computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, "query", text)
+        cached = self.cache.get_many([key])
+        if key not in cached:
+            cached[key] = self.embeddings.embed_query(text)
+            self.cache.put_many(cached)
+        return cached[key]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, "query", text)
+        cached = await asyncio.to_thread(self.cache.get_many, [key])
+        if key not in cached:
+            cached[key] = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self.cache.put_many, cached)
+        return cached[key]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several questions, the missing ones in a single documents request."""
+        keys = self._keys(texts, "query")
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+        missing = self._missing(texts, keys, cached)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.cache.put_many, computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from src.metrics import observe_stage
+from src.model_scheduler import BACKGROUND, EMBEDDING, ModelScheduler
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+UpsertFunction = Callable[[List[str], List[List[float]], List["Document"]], Awaitable[None]]
+
+
+class EmbeddingProgress:
+    """Progress counters of one pipeline run, safe to read while it is in flight."""
+
+    def __init__(self):
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.batches_completed = 0
+        self.in_flight = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def chunks_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.chunks_embedded / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "batches_completed": self.batches_completed,
+            "batches_in_flight": self.in_flight,
+            "chunks_per_second": round(self.chunks_per_second(), 2),
+        }
+
+
+class EmbeddingPipeline:
+    """Embeds chunks in batches with several requests in flight and upserts each batch as it finishes.
+
+    The batch size adapts to the measured latency of the embedding server: it
+    grows while batches finish well under target_batch_seconds and shrinks when
+    they take longer, so the server stays busy without requests timing out.
+    With a scheduler, each batch also waits for a background embedding slot,
+    so query embeddings go first.
+    """
+
+    def __init__(self, embeddings: "Embeddings", upsert: UpsertFunction,
+                 batch_size: int = 32, min_batch_size: int = 8, max_batch_size: int = 256,
+                 max_in_flight: int = 4, target_batch_seconds: float = 2.0,
+                 scheduler: Optional[ModelScheduler] = None):
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+        self.upsert = upsert
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.target_batch_seconds = target_batch_seconds
+        self.chunks_embedded = 0
+        self.batches_completed = 0
+        self.in_flight = 0
+        self.batch_seconds = 0.0
+
+    def _adapt_batch_size(self, batch_len: int, elapsed: float) -> None:
+        # Only full batches say something about the current size.
+        if batch_len < self.batch_size:
+            return
+        if elapsed < self.target_batch_seconds / 2:
+            self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.5) + 1)
+        elif elapsed > self.target_batch_seconds:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    async def _run_batch(self, ids: List[str], documents: List["Document"],
+                         progress: EmbeddingProgress) -> None:
+        slot = self.scheduler.slot(EMBEDDING, BACKGROUND) if self.scheduler is not None else nullcontext()
+        async with slot:
+            start = time.perf_counter()
+            vectors = await self.embeddings.aembed_documents([doc.page_content for doc in documents])
+            elapsed = time.perf_counter() - start
+        observe_stage("embed", elapsed)
+        self._adapt_batch_size(len(documents), elapsed)
+
+        await self.upsert(ids, vectors, documents)
+
+        self.chunks_embedded += len(documents)
+        self.batches_completed += 1
+        self.batch_seconds += elapsed
+        progress.chunks_embedded += len(documents)
+        progress.batches_completed += 1
+
+    async def run(self, ids: List[str], documents: List["Document"],
+                  progress: Optional[EmbeddingProgress] = None) -> List[str]:
+        progress = progress or EmbeddingProgress()
+        progress.chunks_total = len(documents)
+        progress.started_at = time.time()
+
+        slots = asyncio.Semaphore(self.max_in_flight)
+        tasks = []
+
+        async def run_in_slot(batch_ids: List[str], batch: List["Document"]) -> None:
+            try:
+                await self._run_batch(batch_ids, batch, progress)
+            finally:
+                self.in_flight -= 1
+                progress.in_flight -= 1
+                slots.release()
+
+        try:
+            position = 0
+            while position < len(documents):
+                await slots.acquire()
+                # Surface a failed batch before dispatching more work.
+                for task in tasks:
+                    if task.done() and task.exception() is not None:
+                        raise task.exception()
+
+                end = position + self.batch_size
+                self.in_flight += 1
+                progress.in_flight += 1
+                tasks.append(asyncio.create_task(run_in_slot(ids[position:end], documents[position:end])))
+                position = end
+
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            progress.finished_at = time.time()
+
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "max_in_flight": self.max_in_flight,
+            "batches_in_flight": self.in_flight,
+            "batches_completed": self.batches_completed,
+            "chunks_embedded": self.chunks_embedded,
+            "avg_batch_seconds": round(self.batch_seconds / self.batches_completed, 3) if self.batches_completed else 0.0,
+        }
@@ -1,17 +1,38 @@
+from typing import Optional
+from pymongo import MongoClient
 from src.file_handler import FileHandler
 from src.vector_store import VectorStore
 from src.document_store import DocumentStore
 from src.assistant import PDFAssistant
+from src.answer_cache import AnswerCache, MongoAnswerCache
+from src.coordination import JobStatusStore, LeaseStore
+from src.reranker import Reranker, LexicalReranker, CrossEncoderReranker
+from src.context_builder import ContextBuilder
 from config.settings import settings
 from src.document_processors import DocumentProcessor
+from src.ingestion_queue import IngestionQueue
+from src.index_generation import IndexGeneration
+from src.reindexer import Reindexer
+from src.reconciler import OrphanReconciler
+from src.model_scheduler import ModelScheduler
+from src.components import Components
+from src.structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class ComponentFactory:
     """Factory class for creating application components with configurations."""
     
     @staticmethod
-    def create_file_handler(documents_dir=settings.documents_dir) -> FileHandler:
+    def create_file_handler(
+        documents_dir=settings.documents_dir,
+        chunk_size=settings.upload_chunk_size,
+        max_bytes=settings.upload_max_bytes,
+        delete_concurrency=settings.file_delete_concurrency
+    ) -> FileHandler:
         """Create a FileHandler instance with the provided configuration."""
-        return FileHandler(documents_dir)
+        return FileHandler(documents_dir, chunk_size=chunk_size, max_bytes=max_bytes,
+                           delete_concurrency=delete_concurrency)
     
     @staticmethod
     def create_vector_store(
@@ -20,7 +41,28 @@ class ComponentFactory:
         model_name=settings.embedding_model,
         chroma_client_type=settings.chroma_client_type,
         chroma_host=settings.chroma_host,
-        chroma_port=settings.chroma_port
+        chroma_port=settings.chroma_port,
+        embedding_cache_path=str(settings.embedding_cache_path) if settings.embedding_cache_enabled else None,
+        embedding_cache_max_entries=settings.embedding_cache_max_entries,
+        embedding_batch_size=settings.embedding_batch_size,
+        embedding_min_batch_size=settings.embedding_min_batch_size,
+        embedding_max_batch_size=settings.embedding_max_batch_size,
+        embedding_max_in_flight=settings.embedding_max_in_flight,
+        embedding_target_batch_seconds=settings.embedding_target_batch_seconds,
+        keyword_index_path=str(settings.keyword_index_path) if settings.hybrid_search_enabled else None,
+        retrieval_fetch_k=settings.retrieval_fetch_k,
+        rrf_k=settings.rrf_k,
+        index_backend=settings.vector_index_backend,
+        numpy_index_dir=str(settings.numpy_index_dir),
+        numpy_index_compact_ratio=settings.numpy_index_compact_ratio,
+        partitioning=settings.vector_partitioning,
+        partition_buckets=settings.vector_partition_buckets,
+        generation_path=str(settings.index_generation_path),
+        generation: Optional[IndexGeneration] = None,
+        chunk_size=settings.chunk_size,
+        chunk_overlap=settings.chunk_overlap,
+        embeddings=None,
+        scheduler: Optional[ModelScheduler] = None
     ) -> VectorStore:
         """Create a VectorStore instance with the provided configuration."""
         return VectorStore(
@@ -29,20 +71,43 @@ class ComponentFactory:
             model_name=model_name,
             chroma_client_type=chroma_client_type,
             chroma_host=chroma_host,
-            chroma_port=chroma_port
+            chroma_port=chroma_port,
+            embedding_cache_path=embedding_cache_path,
+            embedding_cache_max_entries=embedding_cache_max_entries,
+            embedding_batch_size=embedding_batch_size,
+            embedding_min_batch_size=embedding_min_batch_size,
+            embedding_max_batch_size=embedding_max_batch_size,
+            embedding_max_in_flight=embedding_max_in_flight,
+            embedding_target_batch_seconds=embedding_target_batch_seconds,
+            keyword_index_path=keyword_index_path,
+            retrieval_fetch_k=retrieval_fetch_k,
+            rrf_k=rrf_k,
+            index_backend=index_backend,
+            numpy_index_dir=numpy_index_dir,
+            numpy_index_compact_ratio=numpy_index_compact_ratio,
+            partitioning=partitioning,
+            partition_buckets=partition_buckets,
+            generation_path=generation_path,
+            generation=generation,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            embeddings=embeddings,
+            scheduler=scheduler
         )
     
     @staticmethod
     def create_document_store(
         mongo_uri=settings.mongo_uri,
         db_name=settings.mongo_db_name,
-        collection_name=settings.mongo_documents_collection
+        collection_name=settings.mongo_documents_collection,
+        client=None
     ) -> DocumentStore:
         """Create a DocumentStore instance with the provided configuration."""
         return DocumentStore(
             mongo_uri=mongo_uri,
             db_name=db_name,
-            collection_name=collection_name
+            collection_name=collection_name,
+            client=client
         )
     
     @staticmethod
@@ -51,24 +116,318 @@ class ComponentFactory:
         model_name=settings.llm_model,
         mongo_uri=settings.mongo_uri,
         mongo_db_name=settings.mongo_db_name,
-        mongo_message_history_collection=settings.mongo_message_history_collection
+        mongo_message_history_collection=settings.mongo_message_history_collection,
+        answer_cache_enabled=settings.answer_cache_enabled,
+        mongo_max_pool_size=settings.mongo_max_pool_size,
+        reranker=settings.reranker,
+        retrieval_candidates=settings.retrieval_candidates,
+        retrieval_final_k=settings.retrieval_final_k,
+        context_token_budget=settings.context_token_budget,
+        context_dedup_threshold=settings.context_dedup_threshold,
+        history_window_messages=settings.history_window_messages,
+        history_summary_enabled=settings.history_summary_enabled,
+        mongo_summary_collection=settings.mongo_summary_collection,
+        vector_store: Optional[VectorStore] = None,
+        model=None,
+        history_client=None,
+        scheduler: Optional[ModelScheduler] = None,
+        shared_state=settings.shared_state,
+        mongo_answer_cache_collection=settings.mongo_answer_cache_collection
     ) -> PDFAssistant:
-        """Create a PDFAssistant instance with the provided configuration."""
+        """Create a PDFAssistant instance with the provided configuration.
+        
+        With shared_state, answers are cached in Mongo, through the history client.
+        """
+        answer_cache = None
+        if answer_cache_enabled and shared_state:
+            history_client = history_client or MongoClient(mongo_uri, maxPoolSize=mongo_max_pool_size)
+            answer_cache = ComponentFactory.create_answer_cache(
+                collection=history_client[mongo_db_name][mongo_answer_cache_collection]
+            )
+        elif answer_cache_enabled:
+            answer_cache = ComponentFactory.create_answer_cache()
         return PDFAssistant(
             persist_directory=persist_directory,
             model_name=model_name,
             mongo_uri=mongo_uri,
             mongo_db_name=mongo_db_name,
-            mongo_message_history_collection=mongo_message_history_collection
-        ) 
+            mongo_message_history_collection=mongo_message_history_collection,
+            answer_cache=answer_cache,
+            mongo_max_pool_size=mongo_max_pool_size,
+            reranker=ComponentFactory.create_reranker(reranker),
+            retrieval_candidates=retrieval_candidates,
+            retrieval_final_k=retrieval_final_k,
+            context_builder=ComponentFactory.create_context_builder(context_token_budget, context_dedup_threshold),
+            history_window_messages=history_window_messages,
+            history_summary_enabled=history_summary_enabled,
+            mongo_summary_collection=mongo_summary_collection,
+            vector_store=vector_store,
+            model=model,
+            history_client=history_client,
+            scheduler=scheduler
+        )
+    
+    @staticmethod
+    def create_reranker(kind=settings.reranker, model_name=settings.reranker_model) -> Optional[Reranker]:
+        """Create the configured reranker, or None when reranking is disabled or unavailable."""
+        if kind == "lexical":
+            return LexicalReranker()
+        if kind == "cross-encoder":
+            if not CrossEncoderReranker.available():
+                logger.warning("sentence-transformers is not installed: reranking is disabled")
+                return None
+            return CrossEncoderReranker(model_name)
+        if kind != "none":
+            raise ValueError(f"Unknown reranker: {kind}")
+        return None
+    
+    @staticmethod
+    def create_context_builder(
+        token_budget=settings.context_token_budget,
+        dedup_threshold=settings.context_dedup_threshold
+    ) -> ContextBuilder:
+        """Create a ContextBuilder instance with the provided configuration."""
+        return ContextBuilder(token_budget=token_budget, dedup_threshold=dedup_threshold)
+    
+    @staticmethod
+    def create_answer_cache(
+        similarity_threshold=settings.answer_cache_similarity_threshold,
+        max_entries_per_session=settings.answer_cache_max_entries_per_session,
+        collection=None
+    ) -> AnswerCache:
+        """Create an AnswerCache instance with the provided configuration; with collection, kept in Mongo."""
+        if collection is not None:
+            return MongoAnswerCache(
+                collection,
+                similarity_threshold=similarity_threshold,
+                max_entries_per_session=max_entries_per_session
+            )
+        return AnswerCache(
+            similarity_threshold=similarity_threshold,
+            max_entries_per_session=max_entries_per_session
+        )
     
     @staticmethod
     def create_document_processor(
         chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap
+        chunk_overlap=settings.chunk_overlap,
+        parse_workers=settings.pdf_parse_workers,
+        pages_per_task=settings.pdf_parse_pages_per_task
     ) -> DocumentProcessor:
         """Create a DocumentProcessor instance with the provided configuration."""
         return DocumentProcessor(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
-        )
\ No newline at end of file
+            chunk_overlap=chunk_overlap,
+            parse_workers=parse_workers,
+            pages_per_task=pages_per_task
+        )
+    
+    @staticmethod
+    def create_ingestion_queue(
+        file_handler: FileHandler,
+        document_processor: DocumentProcessor,
+        vector_store: VectorStore,
+        document_store: DocumentStore,
+        workers=settings.ingestion_workers,
+        max_queue_size=settings.ingestion_queue_size,
+        max_finished_jobs=settings.ingestion_max_finished_jobs,
+        parse_concurrency=settings.ingestion_parse_concurrency,
+        chunk_batch_size=settings.ingestion_chunk_batch_size,
+        job_statuses: Optional[JobStatusStore] = None,
+        leases: Optional[LeaseStore] = None,
+        sync_interval_seconds=settings.job_sync_interval_seconds
+    ) -> IngestionQueue:
+        """Create an IngestionQueue instance with the provided configuration."""
+        return IngestionQueue(
+            file_handler=file_handler,
+            document_processor=document_processor,
+            vector_store=vector_store,
+            document_store=document_store,
+            workers=workers,
+            max_queue_size=max_queue_size,
+            max_finished_jobs=max_finished_jobs,
+            parse_concurrency=parse_concurrency,
+            chunk_batch_size=chunk_batch_size,
+            job_statuses=job_statuses,
+            leases=leases,
+            sync_interval_seconds=sync_interval_seconds
+        )
+    
+    @staticmethod
+    def create_reindexer(
+        vector_store: VectorStore,
+        document_store: DocumentStore,
+        document_processor: DocumentProcessor,
+        embedding_model=settings.embedding_model,
+        chunk_size=settings.chunk_size,
+        chunk_overlap=settings.chunk_overlap,
+        max_chunks_per_second=settings.reindex_max_chunks_per_second,
+        embedding_max_in_flight=settings.reindex_embedding_max_in_flight,
+        scheduler: Optional[ModelScheduler] = None,
+        embeddings=None,
+        leases: Optional[LeaseStore] = None
+    ) -> Reindexer:
+        """Create a Reindexer that rebuilds the index for the configured model and chunk settings."""
+        return Reindexer(
+            vector_store=vector_store,
+            document_store=document_store,
+            document_processor=document_processor,
+            create_shadow=lambda generation: ComponentFactory.create_vector_store(
+                generation=generation,
+                embedding_max_in_flight=embedding_max_in_flight,
+                embeddings=embeddings,
+                scheduler=scheduler
+            ),
+            target=IndexGeneration.for_config(embedding_model, chunk_size, chunk_overlap),
+            max_chunks_per_second=max_chunks_per_second,
+            leases=leases
+        )
+    
+    @staticmethod
+    def create_reconciler(
+        file_handler: FileHandler,
+        vector_store: VectorStore,
+        document_store: DocumentStore,
+        ingestion_queue: IngestionQueue,
+        reindexer: Reindexer,
+        interval_seconds=settings.reconcile_interval_seconds,
+        min_age_seconds=settings.reconcile_min_age_seconds,
+        max_deletes_per_second=settings.reconcile_max_deletes_per_second,
+        batch_size=settings.reconcile_batch_size,
+        leases: Optional[LeaseStore] = None
+    ) -> OrphanReconciler:
+        """Create an OrphanReconciler sweeping the given components' files, chunks and records."""
+        return OrphanReconciler(
+            file_handler=file_handler,
+            vector_store=vector_store,
+            document_store=document_store,
+            ingestion_queue=ingestion_queue,
+            reindexer=reindexer,
+            interval_seconds=interval_seconds,
+            min_age_seconds=min_age_seconds,
+            max_deletes_per_second=max_deletes_per_second,
+            batch_size=batch_size,
+            leases=leases
+        )
+    
+    @staticmethod
+    def create_model_scheduler(
+        generation_max_in_flight=settings.scheduler_generation_max_in_flight,
+        generation_max_queue=settings.scheduler_generation_max_queue,
+        embedding_max_in_flight=settings.scheduler_embedding_max_in_flight,
+        embedding_max_queue=settings.scheduler_embedding_max_queue,
+        query_batch_window_ms=settings.scheduler_query_batch_window_ms,
+        query_max_batch=settings.scheduler_query_max_batch
+    ) -> ModelScheduler:
+        """Create the ModelScheduler shared by every component that calls the models."""
+        return ModelScheduler(
+            generation_max_in_flight=generation_max_in_flight,
+            generation_max_queue=generation_max_queue,
+            embedding_max_in_flight=embedding_max_in_flight,
+            embedding_max_queue=embedding_max_queue,
+            query_batch_window=query_batch_window_ms / 1000,
+            query_max_batch=query_max_batch
+        )
+    
+    @staticmethod
+    def create_lease_store(
+        document_store: DocumentStore,
+        collection_name=settings.mongo_leases_collection,
+        ttl_seconds=settings.lease_ttl_seconds
+    ) -> LeaseStore:
+        """Create a LeaseStore in the documents database, through the document store's client."""
+        return LeaseStore(document_store.db[collection_name], ttl_seconds=ttl_seconds)
+    
+    @staticmethod
+    def create_job_status_store(
+        document_store: DocumentStore,
+        collection_name=settings.mongo_jobs_collection,
+        lease_seconds=settings.lease_ttl_seconds,
+        retention_seconds=settings.job_retention_seconds
+    ) -> JobStatusStore:
+        """Create a JobStatusStore in the documents database, through the document store's client."""
+        return JobStatusStore(
+            document_store.db[collection_name],
+            lease_seconds=lease_seconds,
+            retention_seconds=retention_seconds
+        )
+    
+    @staticmethod
+    def check_shared_state_backends(
+        index_backend=settings.vector_index_backend,
+        chroma_client_type=settings.chroma_client_type
+    ) -> None:
+        """Raise ValueError if the vector index cannot be shared by several worker processes."""
+        if index_backend != "chroma" or chroma_client_type != "http":
+            raise ValueError(
+                "Several API workers need the Chroma server: set VECTOR_INDEX_BACKEND=chroma and "
+                "CHROMA_CLIENT_TYPE=http. The numpy index and the embedded Chroma store belong to one process."
+            )
+    
+    @staticmethod
+    def create_components(
+        embeddings=None,
+        model=None,
+        document_client=None,
+        history_client=None,
+        shared_state=settings.shared_state
+    ) -> Components:
+        """Create every API component, sharing one vector store and model scheduler.
+        
+        embeddings, model, document_client and history_client replace the Ollama
+        models and Mongo clients, as in the individual factory methods. With
+        shared_state, ingestion job status, the answer cache and the locks of
+        ingestion, re-indexing and reconciliation are kept in Mongo, for
+        several worker processes.
+        """
+        if shared_state:
+            ComponentFactory.check_shared_state_backends()
+        model_scheduler = ComponentFactory.create_model_scheduler()
+        file_handler = ComponentFactory.create_file_handler()
+        document_processor = ComponentFactory.create_document_processor()
+        vector_store = ComponentFactory.create_vector_store(embeddings=embeddings, scheduler=model_scheduler)
+        document_store = ComponentFactory.create_document_store(client=document_client)
+        leases = ComponentFactory.create_lease_store(document_store) if shared_state else None
+        job_statuses = ComponentFactory.create_job_status_store(document_store) if shared_state else None
+        ingestion_queue = ComponentFactory.create_ingestion_queue(
+            file_handler=file_handler,
+            document_processor=document_processor,
+            vector_store=vector_store,
+            document_store=document_store,
+            job_statuses=job_statuses,
+            leases=leases
+        )
+        reindexer = ComponentFactory.create_reindexer(
+            vector_store=vector_store,
+            document_store=document_store,
+            document_processor=document_processor,
+            scheduler=model_scheduler,
+            embeddings=embeddings,
+            leases=leases
+        )
+        return Components(
+            file_handler=file_handler,
+            document_processor=document_processor,
+            vector_store=vector_store,
+            document_store=document_store,
+            assistant=ComponentFactory.create_assistant(
+                vector_store=vector_store,
+                model=model,
+                history_client=history_client,
+                scheduler=model_scheduler,
+                shared_state=shared_state
+            ),
+            ingestion_queue=ingestion_queue,
+            reindexer=reindexer,
+            reconciler=ComponentFactory.create_reconciler(
+                file_handler=file_handler,
+                vector_store=vector_store,
+                document_store=document_store,
+                ingestion_queue=ingestion_queue,
+                reindexer=reindexer,
+                leases=leases
+            ),
+            model_scheduler=model_scheduler,
+            leases=leases,
+            job_statuses=job_statuses
+        )
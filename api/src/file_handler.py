@@ -1,34 +1,106 @@
+import asyncio
 import uuid
 import os
+import hashlib
+import time
 import aiofiles
 from pathlib import Path
-from typing import List
+from typing import List, NamedTuple, Optional, Tuple
+
+class FileTooLargeError(Exception):
+    """Raised when an uploaded stream exceeds the configured size limit."""
+
+class StoredFile(NamedTuple):
+    path: Path
+    size: int
+    modified_at: float
 
 class FileHandler:
-    def __init__(self, documents_dir: str):
+    def __init__(self, documents_dir: str, chunk_size: int = 1024 * 1024, max_bytes: Optional[int] = None,
+                 delete_concurrency: int = 16):
         self.documents_dir = Path(documents_dir)
         self.documents_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.delete_concurrency = max(1, delete_concurrency)
     
-    async def save_file(self, file_content: bytes, extension: str = "pdf") -> Path:
-        file_path = self.documents_dir / f"{uuid.uuid4().hex}.{extension}"
+    async def save_stream(self, stream, extension: str = "pdf", chunk_size: Optional[int] = None,
+                          max_bytes: Optional[int] = None) -> Tuple[Path, str]:
+        """Write a readable stream to a content-addressed path, hashing it on the way in.
+        
+        Only one chunk_size chunk is held in memory at a time. Returns the path and
+        the SHA-256 hex digest of the content. If a file with the same content is
+        already stored, it is reused and the new copy discarded. Raises
+        FileTooLargeError as soon as more than max_bytes have been read.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        digest = hashlib.sha256()
+        temp_path = self.documents_dir / f".{uuid.uuid4().hex}.part"
+        size = 0
         
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(file_content)
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                while chunk := await stream.read(chunk_size):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise FileTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+                    digest.update(chunk)
+                    await f.write(chunk)
             
-        return file_path
+            file_hash = digest.hexdigest()
+            file_path = self.documents_dir / f"{file_hash}.{extension}"
+            if file_path.exists():
+                temp_path.unlink()
+                # Reused files count as new, so the orphan reconciler's minimum age covers them too.
+                os.utime(file_path)
+            else:
+                os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+            
+        return file_path, file_hash
+    
+    @staticmethod
+    def _unlink(file_path: Path, min_age_seconds: float = 0.0, modified_before: Optional[float] = None) -> int:
+        """Delete a file, returning its size, or -1 if it is missing, newer than min_age_seconds or
+        modified_before, or undeletable."""
+        try:
+            stat = file_path.stat()
+            if min_age_seconds > 0 and time.time() - stat.st_mtime < min_age_seconds:
+                return -1
+            if modified_before is not None and stat.st_mtime >= modified_before:
+                return -1
+            file_path.unlink()
+            return stat.st_size
+        except OSError:
+            return -1
     
     async def delete_file(self, file_path: Path) -> bool:
-        if file_path.exists():
-            try:
-                file_path.unlink()
-                return True
-            except Exception:
-                return False
-        return False
+        return await asyncio.to_thread(self._unlink, file_path) >= 0
+    
+    async def delete_files(self, file_paths: List[Path], min_age_seconds: float = 0.0,
+                           modified_before: Optional[float] = None) -> Tuple[List[Path], int]:
+        """Delete files concurrently in worker threads, returning the deleted ones and the bytes freed.
+        
+        Files modified at or after the modified_before timestamp are kept: an upload reused them since.
+        """
+        semaphore = asyncio.Semaphore(self.delete_concurrency)
+        
+        async def delete(file_path: Path) -> int:
+            async with semaphore:
+                return await asyncio.to_thread(self._unlink, file_path, min_age_seconds, modified_before)
+        
+        sizes = await asyncio.gather(*[delete(file_path) for file_path in file_paths])
+        deleted_files = [file_path for file_path, size in zip(file_paths, sizes) if size >= 0]
+        return deleted_files, sum(size for size in sizes if size > 0)
     
-    async def delete_files(self, file_paths: List[Path]) -> List[Path]:
-        deleted_files = []
-        for file_path in file_paths:
-            if await self.delete_file(file_path):
-                deleted_files.append(file_path)
-        return deleted_files 
\ No newline at end of file
+    def list_files(self) -> List[StoredFile]:
+        """Every file in documents_dir, including the temporary files of uploads in progress."""
+        stored = []
+        for entry in os.scandir(self.documents_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                stored.append(StoredFile(Path(entry.path), stat.st_size, stat.st_mtime))
+        return stored
\ No newline at end of file
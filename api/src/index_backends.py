@@ -0,0 +1,674 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+def owner_key(session_id: str) -> str:
+    """Metadata key marking a chunk as visible to a session that shares its document."""
+    return f"owner:{session_id}"
+
+def metadata_sessions(metadata: Dict[str, Any]) -> Set[str]:
+    """Sessions a chunk is visible to, according to its metadata."""
+    sessions = {key[len("owner:"):] for key, value in metadata.items() if key.startswith("owner:") and value}
+    if metadata.get("session_id"):
+        sessions.add(metadata["session_id"])
+    return sessions
+
+def session_filter(session_id: str) -> Dict[str, Any]:
+    return {"$or": [{"session_id": session_id}, {owner_key(session_id): True}]}
+
+
+class VectorIndex:
+    """Storage and nearest-neighbour search of chunk embeddings behind VectorStore.
+
+    Methods are synchronous; VectorStore calls them from worker threads. The
+    optional session arguments are routing hints: the session whose partition
+    holds the chunks. Without them, partitioned backends look in every
+    partition.
+    """
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], session_id: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def get_metadatas(self, ids: List[str], session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Metadata of the stored chunks among ids, in no particular order."""
+        raise NotImplementedError
+
+    def add_owner(self, ids: List[str], session_id: str, source_session_id: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def remove_owner(self, ids: List[str], session_id: str, remaining_owner: Optional[str]) -> None:
+        raise NotImplementedError
+
+    def search(self, embedding: List[float], k: int, session_id: Optional[str] = None) -> List[Document]:
+        raise NotImplementedError
+
+    def iterate(self, batch_size: int = 500) -> Iterator[Tuple[List[str], List[Document]]]:
+        """Yield every stored chunk in batches of (ids, documents)."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def drop(self) -> None:
+        """Delete the index and everything stored in it."""
+        raise NotImplementedError
+
+
+class ChromaIndex(VectorIndex):
+    """Chunks in Chroma collections, optionally partitioned by session.
+
+    With partitioning "none" every chunk lives in one collection and searches
+    filter on the session_id / owner metadata. With "session" each session gets
+    its own collection, so a search touches only that session's chunks and
+    needs no filter, and deleting all of a session's chunks drops the
+    collection. "bucket" hashes sessions into partition_buckets collections,
+    bounding the number of collections while still filtering by metadata.
+    Partitions are created on first write. Chunks without a session stay in
+    the base collection. Chunks shared with another session are copied into
+    that session's partition.
+
+    Session chunks written before partitioning stay in the base collection
+    until scripts.partition_vector_store moves them. While any are left, a
+    session's searches and deletes look in the base collection too, filtered
+    by metadata, so upgrading does not hide them.
+    """
+
+    def __init__(self, client, collection_name: str = "pdfs", partitioning: str = "none",
+                 partition_buckets: int = 64):
+        if partitioning not in ("none", "session", "bucket"):
+            raise ValueError(f"Unknown vector partitioning: {partitioning}")
+        # Imported here, like the client itself, so the numpy backend does not load Chroma.
+        from chromadb.errors import InvalidCollectionException, NotFoundError
+        self._missing_errors = (InvalidCollectionException, NotFoundError, ValueError)
+        self.client = client
+        self.collection_name = collection_name
+        self.partitioning = partitioning
+        self.partition_buckets = partition_buckets
+        self._collections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        # Whether the base collection holds session chunks; checked once, the migration runs with the API stopped.
+        self._unpartitioned: Optional[bool] = None
+
+    def partition_name(self, session_id: Optional[str]) -> str:
+        if self.partitioning == "none" or not session_id:
+            return self.collection_name
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        if self.partitioning == "bucket":
+            return f"{self.collection_name}-b{int(digest[:8], 16) % self.partition_buckets:03d}"
+        return f"{self.collection_name}-s{digest[:24]}"
+
+    def collection(self, name: str, create: bool = False):
+        # Held across the lookup: concurrent get_or_create calls for one name race inside Chroma.
+        with self._lock:
+            if name not in self._collections:
+                if create:
+                    self._collections[name] = self.client.get_or_create_collection(name, embedding_function=None)
+                else:
+                    try:
+                        self._collections[name] = self.client.get_collection(name, embedding_function=None)
+                    except self._missing_errors:
+                        return None
+            return self._collections[name]
+
+    def _drop(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+            try:
+                self.client.delete_collection(name)
+            except self._missing_errors:
+                pass
+
+    def partitions(self) -> List[str]:
+        """Names of the existing collections of this index, base collection first."""
+        # Chroma 0.6 lists names; older clients return Collection objects.
+        names = [item if isinstance(item, str) else item.name for item in self.client.list_collections()]
+        prefixes = (f"{self.collection_name}-s", f"{self.collection_name}-b")
+        partitioned = sorted(name for name in names if self.partitioning != "none" and name.startswith(prefixes))
+        return ([self.collection_name] if self.collection_name in names else []) + partitioned
+
+    def _candidate_partitions(self, session_id: Optional[str]) -> List[str]:
+        if self.partitioning == "none":
+            return [self.collection_name]
+        if session_id:
+            partition = self.partition_name(session_id)
+            if self._unpartitioned is None:
+                self.has_unpartitioned_chunks()
+            return [partition, self.collection_name] if self._unpartitioned else [partition]
+        return self.partitions()
+
+    def _target_partitions(self, metadata: Dict[str, Any]) -> Set[str]:
+        return {self.partition_name(session) for session in metadata_sessions(metadata)} or {self.collection_name}
+
+    @staticmethod
+    def _clean(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        # Chroma rejects None metadata values, e.g. a missing session_id.
+        return {k: v for k, v in metadata.items() if v is not None}
+
+    def has_unpartitioned_chunks(self) -> bool:
+        if self.partitioning == "none":
+            return False
+        collection = self.collection(self.collection_name)
+        self._unpartitioned = collection is not None and \
+            bool(collection.get(where={"session_id": {"$ne": ""}}, limit=1, include=[])["ids"])
+        return self._unpartitioned
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        by_partition: Dict[str, List[int]] = {}
+        for position, doc in enumerate(documents):
+            for name in self._target_partitions(doc.metadata):
+                by_partition.setdefault(name, []).append(position)
+        for name, positions in by_partition.items():
+            self.collection(name, create=True).upsert(
+                ids=[ids[p] for p in positions],
+                embeddings=[embeddings[p] for p in positions],
+                documents=[documents[p].page_content for p in positions],
+                metadatas=[self._clean(documents[p].metadata) for p in positions]
+            )
+
+    def delete(self, ids: List[str], session_id: Optional[str] = None) -> None:
+        for name in self._candidate_partitions(session_id):
+            collection = self.collection(name)
+            if collection is None:
+                continue
+            if name != self.collection_name and self.partitioning == "session":
+                stored = collection.get(ids=ids, include=[])["ids"]
+                if stored and len(stored) == collection.count():
+                    # Every chunk of the partition goes: drop it whole instead of deleting row by row.
+                    self._drop(name)
+                    continue
+            collection.delete(ids=ids)
+
+    def get_metadatas(self, ids: List[str], session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        metadatas = []
+        for name in self._candidate_partitions(session_id):
+            collection = self.collection(name)
+            if collection is not None:
+                metadatas.extend(metadata or {} for metadata in collection.get(ids=ids, include=["metadatas"])["metadatas"])
+        return metadatas
+
+    def add_owner(self, ids: List[str], session_id: str, source_session_id: Optional[str] = None) -> None:
+        if self.partitioning == "none":
+            self.collection(self.collection_name, create=True).update(
+                ids=ids, metadatas=[{owner_key(session_id): True} for _ in ids]
+            )
+            return
+
+        target_name = self.partition_name(session_id)
+        records: Dict[str, Tuple[List[float], str, Dict[str, Any]]] = {}
+        for name in self._candidate_partitions(source_session_id):
+            collection = self.collection(name)
+            if collection is None:
+                continue
+            found = collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+            for chunk_id, embedding, content, metadata in zip(
+                found["ids"], found["embeddings"], found["documents"], found["metadatas"]
+            ):
+                records.setdefault(chunk_id, (embedding, content, metadata or {}))
+            if name != target_name and found["ids"]:
+                collection.update(ids=found["ids"], metadatas=[{owner_key(session_id): True} for _ in found["ids"]])
+            if len(records) == len(ids):
+                break
+        if not records:
+            return
+
+        chunk_ids = list(records)
+        self.collection(target_name, create=True).upsert(
+            ids=chunk_ids,
+            embeddings=[records[chunk_id][0] for chunk_id in chunk_ids],
+            documents=[records[chunk_id][1] for chunk_id in chunk_ids],
+            metadatas=[self._clean({**records[chunk_id][2], owner_key(session_id): True}) for chunk_id in chunk_ids]
+        )
+
+    @staticmethod
+    def _owner_update(metadata: Dict[str, Any], session_id: str, remaining_owner: Optional[str]) -> Dict[str, Any]:
+        update = {owner_key(session_id): False}
+        if metadata.get("session_id") == session_id:
+            update["session_id"] = remaining_owner or ""
+            if remaining_owner:
+                update[owner_key(remaining_owner)] = True
+        return update
+
+    def remove_owner(self, ids: List[str], session_id: str, remaining_owner: Optional[str]) -> None:
+        names = [self.partition_name(session_id)]
+        if remaining_owner and self.partition_name(remaining_owner) not in names:
+            names.append(self.partition_name(remaining_owner))
+        if self.collection_name in self._candidate_partitions(session_id) and self.collection_name not in names:
+            names.append(self.collection_name)
+
+        for position, name in enumerate(names):
+            collection = self.collection(name)
+            if collection is None:
+                continue
+            records = collection.get(ids=ids, include=["metadatas"])
+            keep_ids, keep_updates, drop_ids = [], [], []
+            for chunk_id, metadata in zip(records["ids"], records["metadatas"]):
+                metadata = metadata or {}
+                update = self._owner_update(metadata, session_id, remaining_owner)
+                sessions = metadata_sessions({**metadata, **update})
+                # The removed session's partition keeps the chunk only while it also holds another owner.
+                if position == 0 and self.partitioning != "none" and \
+                        not any(self.partition_name(session) == name for session in sessions):
+                    drop_ids.append(chunk_id)
+                else:
+                    keep_ids.append(chunk_id)
+                    keep_updates.append(update)
+            if keep_ids:
+                collection.update(ids=keep_ids, metadatas=keep_updates)
+            if drop_ids:
+                self.delete(drop_ids, session_id)
+
+    def search(self, embedding: List[float], k: int, session_id: Optional[str] = None) -> List[Document]:
+        candidates: List[Tuple[float, str, str, Dict[str, Any]]] = []
+        for name in self._candidate_partitions(session_id):
+            collection = self.collection(name)
+            if collection is None:
+                continue
+            # A session partition holds only that session's chunks; other collections are shared.
+            shared = self.partitioning != "session" or name == self.collection_name
+            results = collection.query(
+                query_embeddings=[embedding], n_results=k,
+                where=session_filter(session_id) if session_id and shared else None,
+                include=["documents", "metadatas", "distances"]
+            )
+            candidates.extend(zip(
+                results["distances"][0], results["ids"][0], results["documents"][0], results["metadatas"][0]
+            ))
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        documents, seen = [], set()
+        for _, chunk_id, content, metadata in candidates:
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            documents.append(Document(page_content=content or "", metadata=metadata or {}, id=chunk_id))
+            if len(documents) == k:
+                break
+        return documents
+
+    def iterate(self, batch_size: int = 500) -> Iterator[Tuple[List[str], List[Document]]]:
+        seen: Set[str] = set()
+        for name in self._candidate_partitions(None):
+            collection = self.collection(name)
+            if collection is None:
+                continue
+            offset = 0
+            while True:
+                records = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+                if not records["ids"]:
+                    break
+                offset += len(records["ids"])
+                batch = [
+                    (chunk_id, Document(page_content=content or "", metadata=metadata or {}, id=chunk_id))
+                    for chunk_id, content, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+                    if chunk_id not in seen
+                ]
+                seen.update(chunk_id for chunk_id, _ in batch)
+                if batch:
+                    yield [chunk_id for chunk_id, _ in batch], [doc for _, doc in batch]
+
+    def count(self) -> int:
+        if self.partitioning == "none":
+            collection = self.collection(self.collection_name)
+            return collection.count() if collection is not None else 0
+        return sum(len(ids) for ids, _ in self.iterate())
+
+    def drop(self) -> None:
+        for name in self.partitions():
+            self._drop(name)
+
+
+class _Shard:
+    """Memory-mapped float32 rows of one shard, reopened when the shard version changes."""
+
+    def __init__(self, version: int, vectors: np.ndarray, live: np.ndarray, chunk_ids: List[str]):
+        self.version = version
+        self.vectors = vectors
+        self.live = live
+        self.chunk_ids = chunk_ids
+
+
+class NumpyIndex(VectorIndex):
+    """In-process vector index: one memory-mapped float32 matrix per session.
+
+    Each shard directory holds an append-only vectors.f32 file of L2-normalized
+    rows; chunk ids, text, metadata and tombstones live in a SQLite catalogue.
+    A search is a single matrix-vector product over the session's shard and an
+    argpartition for the top k. Chunks shared with another session are copied
+    into that session's shard. Shards are rewritten without deleted rows once
+    tombstones exceed compact_ratio of a shard, and removed once none is left.
+    """
+
+    SHARED_SHARD = "_shared"
+
+    def __init__(self, root: Path, compact_ratio: float = 0.3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._shards: Dict[str, _Shard] = {}
+        self._connection = sqlite3.connect(str(self.root / "catalog.sqlite3"), check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS shards (
+                shard TEXT PRIMARY KEY, session_id TEXT, dim INTEGER NOT NULL,
+                rows INTEGER NOT NULL, dead INTEGER NOT NULL, version INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                shard TEXT NOT NULL, row INTEGER NOT NULL, chunk_id TEXT NOT NULL,
+                content TEXT NOT NULL, metadata TEXT NOT NULL, live INTEGER NOT NULL,
+                PRIMARY KEY (shard, row)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS chunks_id ON chunks (chunk_id, live);
+        """)
+        self._connection.commit()
+
+    @classmethod
+    def shard_name(cls, session_id: Optional[str]) -> str:
+        if not session_id:
+            return cls.SHARED_SHARD
+        return hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:20]
+
+    def _vectors_path(self, shard: str) -> Path:
+        return self.root / shard / "vectors.f32"
+
+    def _load_shard(self, shard: str) -> Optional[_Shard]:
+        row = self._connection.execute(
+            "SELECT dim, rows, version FROM shards WHERE shard = ?", (shard,)
+        ).fetchone()
+        if row is None or row[1] == 0:
+            return None
+        dim, rows, version = row
+        cached = self._shards.get(shard)
+        if cached is not None and cached.version == version:
+            return cached
+
+        vectors = np.memmap(self._vectors_path(shard), dtype=np.float32, mode="r", shape=(rows, dim))
+        live = np.zeros(rows, dtype=bool)
+        chunk_ids = [""] * rows
+        for position, chunk_id, is_live in self._connection.execute(
+            "SELECT row, chunk_id, live FROM chunks WHERE shard = ?", (shard,)
+        ):
+            chunk_ids[position] = chunk_id
+            live[position] = bool(is_live)
+        loaded = self._shards[shard] = _Shard(version, vectors, live, chunk_ids)
+        return loaded
+
+    def _append(self, shard: str, session_id: Optional[str], ids: List[str],
+                vectors: np.ndarray, documents: List[Document]) -> None:
+        row = self._connection.execute("SELECT rows FROM shards WHERE shard = ?", (shard,)).fetchone()
+        if row is None:
+            self._connection.execute(
+                "INSERT INTO shards VALUES (?, ?, ?, 0, 0, 0)", (shard, session_id, vectors.shape[1])
+            )
+            start = 0
+        else:
+            start = row[0]
+        self._tombstone(shard, ids)
+
+        path = self._vectors_path(shard)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "r+b" if path.exists() else "wb") as f:
+            # Rows past the catalogue's row count are leftovers of an interrupted write.
+            f.seek(start * vectors.shape[1] * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.truncate()
+        self._connection.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, 1)",
+            [
+                (shard, start + offset, chunk_id, doc.page_content, json.dumps(doc.metadata))
+                for offset, (chunk_id, doc) in enumerate(zip(ids, documents))
+            ]
+        )
+        self._connection.execute(
+            "UPDATE shards SET rows = rows + ?, version = version + 1 WHERE shard = ?", (len(ids), shard)
+        )
+
+    def _tombstone(self, shard: Optional[str], ids: List[str]) -> Set[str]:
+        """Mark the live rows of ids as deleted, in one shard or all of them. Returns touched shards."""
+        touched: Set[str] = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            query = f"SELECT shard, row FROM chunks WHERE chunk_id IN ({placeholders}) AND live = 1"
+            params: List[Any] = list(batch)
+            if shard is not None:
+                query += " AND shard = ?"
+                params.append(shard)
+            rows = self._connection.execute(query, params).fetchall()
+            self._connection.executemany("UPDATE chunks SET live = 0 WHERE shard = ? AND row = ?", rows)
+            dead = Counter(row_shard for row_shard, _ in rows)
+            self._connection.executemany(
+                "UPDATE shards SET dead = dead + ?, version = version + 1 WHERE shard = ?",
+                [(count, row_shard) for row_shard, count in dead.items()]
+            )
+            touched.update(dead)
+        return touched
+
+    def _maybe_compact(self, shard: str) -> None:
+        dim, rows, dead = self._connection.execute(
+            "SELECT dim, rows, dead FROM shards WHERE shard = ?", (shard,)
+        ).fetchone()
+        if rows == 0 or dead / rows < self.compact_ratio:
+            return
+        if dead == rows:
+            self._drop_shard(shard)
+            return
+
+        live_rows = self._connection.execute(
+            "SELECT row FROM chunks WHERE shard = ? AND live = 1 ORDER BY row", (shard,)
+        ).fetchall()
+        path = self._vectors_path(shard)
+        source = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+        temp_path = path.with_suffix(".compact")
+        with open(temp_path, "wb") as f:
+            for start in range(0, len(live_rows), 10_000):
+                positions = [row for row, in live_rows[start:start + 10_000]]
+                f.write(np.ascontiguousarray(source[positions]).tobytes())
+        del source
+
+        self._connection.execute("DELETE FROM chunks WHERE shard = ? AND live = 0", (shard,))
+        self._connection.executemany(
+            "UPDATE chunks SET row = ? WHERE shard = ? AND row = ?",
+            [(new_row, shard, old_row) for new_row, (old_row,) in enumerate(live_rows)]
+        )
+        self._connection.execute(
+            "UPDATE shards SET rows = ?, dead = 0, version = version + 1 WHERE shard = ?", (len(live_rows), shard)
+        )
+        self._connection.commit()
+        os.replace(temp_path, path)
+        self._shards.pop(shard, None)
+
+    def _drop_shard(self, shard: str) -> None:
+        """Remove a shard with no live rows, files and all."""
+        self._connection.execute("DELETE FROM chunks WHERE shard = ?", (shard,))
+        self._connection.execute("DELETE FROM shards WHERE shard = ?", (shard,))
+        self._connection.commit()
+        self._shards.pop(shard, None)
+        shutil.rmtree(self.root / shard, ignore_errors=True)
+
+    @staticmethod
+    def _normalize(embeddings: List[List[float]]) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        vectors = self._normalize(embeddings)
+        by_shard: Dict[str, List[int]] = {}
+        for position, doc in enumerate(documents):
+            for session_id in metadata_sessions(doc.metadata) or {None}:
+                by_shard.setdefault(session_id, []).append(position)
+
+        with self._lock:
+            for session_id, positions in by_shard.items():
+                self._append(
+                    self.shard_name(session_id), session_id,
+                    [ids[p] for p in positions], vectors[positions], [documents[p] for p in positions]
+                )
+            self._connection.commit()
+
+    def delete(self, ids: List[str], session_id: Optional[str] = None) -> None:
+        with self._lock:
+            touched = self._tombstone(None, ids)
+            self._connection.commit()
+            for shard in touched:
+                self._maybe_compact(shard)
+
+    def get_metadatas(self, ids: List[str], session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        metadatas = []
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                metadatas.extend(
+                    json.loads(metadata) for metadata, in self._connection.execute(
+                        f"SELECT metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))}) AND live = 1",
+                        batch
+                    )
+                )
+        return metadatas
+
+    def add_owner(self, ids: List[str], session_id: str, source_session_id: Optional[str] = None) -> None:
+        with self._lock:
+            found: Dict[str, Tuple[str, int, str, str]] = {}
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                for chunk_id, shard, row, content, metadata in self._connection.execute(
+                    f"SELECT chunk_id, shard, row, content, metadata FROM chunks "
+                    f"WHERE chunk_id IN ({','.join('?' * len(batch))}) AND live = 1", batch
+                ):
+                    found.setdefault(chunk_id, (shard, row, content, metadata))
+            if not found:
+                return
+
+            chunk_ids, vectors, documents = [], [], []
+            for chunk_id, (shard, row, content, metadata) in found.items():
+                source = self._load_shard(shard)
+                metadata = json.loads(metadata)
+                metadata[owner_key(session_id)] = True
+                chunk_ids.append(chunk_id)
+                vectors.append(np.asarray(source.vectors[row]))
+                documents.append(Document(page_content=content, metadata=metadata))
+            self._append(self.shard_name(session_id), session_id, chunk_ids, np.stack(vectors), documents)
+            self._connection.commit()
+
+    def remove_owner(self, ids: List[str], session_id: str, remaining_owner: Optional[str]) -> None:
+        shard = self.shard_name(session_id)
+        with self._lock:
+            self._tombstone(shard, ids)
+            # Copies left in other shards keep their metadata in step with ChromaIndex.
+            updates = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                for row_shard, row, metadata in self._connection.execute(
+                    f"SELECT shard, row, metadata FROM chunks "
+                    f"WHERE chunk_id IN ({','.join('?' * len(batch))}) AND live = 1", batch
+                ):
+                    metadata = json.loads(metadata)
+                    metadata[owner_key(session_id)] = False
+                    if metadata.get("session_id") == session_id:
+                        metadata["session_id"] = remaining_owner or ""
+                        if remaining_owner:
+                            metadata[owner_key(remaining_owner)] = True
+                    updates.append((json.dumps(metadata), row_shard, row))
+            self._connection.executemany("UPDATE chunks SET metadata = ? WHERE shard = ? AND row = ?", updates)
+            self._connection.commit()
+            self._maybe_compact(shard)
+
+    def search(self, embedding: List[float], k: int, session_id: Optional[str] = None) -> List[Document]:
+        query = self._normalize([embedding])[0]
+        # A loaded shard is never modified, only replaced: score the snapshot without holding the lock.
+        with self._lock:
+            if session_id:
+                shards = [self.shard_name(session_id)]
+            else:
+                shards = [shard for shard, in self._connection.execute("SELECT shard FROM shards")]
+            loaded_shards = [(shard, self._load_shard(shard)) for shard in shards]
+
+        candidates: List[Tuple[float, str, int, str]] = []
+        for shard, loaded in loaded_shards:
+            if loaded is None:
+                continue
+            scores = loaded.vectors @ query
+            scores[~loaded.live] = -np.inf
+            top = min(k, int(loaded.live.sum()))
+            if top == 0:
+                continue
+            best = np.argpartition(-scores, top - 1)[:top]
+            candidates.extend((float(scores[row]), shard, int(row), loaded.chunk_ids[row]) for row in best)
+
+        candidates.sort(reverse=True)
+        best_rows, seen = [], set()
+        for _, shard, row, chunk_id in candidates:
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            best_rows.append((shard, row, chunk_id))
+            if len(best_rows) == k:
+                break
+        if not best_rows:
+            return []
+
+        with self._lock:
+            found = {
+                (shard, row): (content, metadata, chunk_id)
+                for shard, row, content, metadata, chunk_id in self._connection.execute(
+                    # A join, not (shard, row) IN (VALUES ...), which SQLite answers with a full scan.
+                    f"WITH wanted (shard, row) AS (VALUES {','.join(['(?, ?)'] * len(best_rows))}) "
+                    f"SELECT shard, row, content, metadata, chunk_id FROM wanted JOIN chunks USING (shard, row)",
+                    [value for shard, row, _ in best_rows for value in (shard, row)]
+                )
+            }
+        results = []
+        for shard, row, chunk_id in best_rows:
+            # A compaction since the snapshot may have moved the row: skip it rather than return another chunk.
+            content, metadata, row_chunk_id = found.get((shard, row), (None, None, None))
+            if row_chunk_id != chunk_id:
+                continue
+            results.append(Document(page_content=content, metadata=json.loads(metadata), id=chunk_id))
+        return results
+
+    def iterate(self, batch_size: int = 500) -> Iterator[Tuple[List[str], List[Document]]]:
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT chunk_id, MIN(content), MIN(metadata) FROM chunks "
+                    "WHERE live = 1 AND chunk_id > ? GROUP BY chunk_id ORDER BY chunk_id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [row[0] for row in rows], [
+                Document(page_content=content, metadata=json.loads(metadata), id=chunk_id)
+                for chunk_id, content, metadata in rows
+            ]
+            last_id = rows[-1][0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(DISTINCT chunk_id) FROM chunks WHERE live = 1"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._shards.clear()
+            self._connection.close()
+
+    def drop(self) -> None:
+        with self._lock:
+            self.close()
+            shutil.rmtree(self.root, ignore_errors=True)
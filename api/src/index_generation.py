@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def index_fingerprint(embedding_model: str, chunk_size: int, chunk_overlap: int) -> str:
+    """Short hash of the settings that decide what the stored chunks and vectors look like."""
+    key = json.dumps([embedding_model, chunk_size, chunk_overlap])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+class IndexGeneration:
+    """One build of the vector index, made with a single chunking and embedding configuration.
+
+    The generation's collections, directories and files are named after the
+    base names with a -<name> suffix. The unnamed generation uses the base
+    names themselves: it is the index as it was before generations existed.
+    """
+
+    def __init__(self, name: str, embedding_model: str, chunk_size: int, chunk_overlap: int):
+        self.name = name
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.fingerprint = index_fingerprint(embedding_model, chunk_size, chunk_overlap)
+
+    @classmethod
+    def for_config(cls, embedding_model: str, chunk_size: int, chunk_overlap: int) -> "IndexGeneration":
+        return cls(f"g{index_fingerprint(embedding_model, chunk_size, chunk_overlap)}",
+                   embedding_model, chunk_size, chunk_overlap)
+
+    def resource_name(self, base: str) -> str:
+        return f"{base}-{self.name}" if self.name else base
+
+    def resource_path(self, base: Path) -> Path:
+        base = Path(base)
+        return base.with_name(f"{self.resource_name(base.stem)}{base.suffix}")
+
+    def chunk_id(self, document_key: str, position: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.fingerprint}/{document_key}/{position}"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "embedding_model": self.embedding_model,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IndexGeneration":
+        return cls(data["name"], data["embedding_model"], data["chunk_size"], data["chunk_overlap"])
+
+
+def load_generation(path: Path) -> Optional[IndexGeneration]:
+    """The generation recorded as live at path, or None if none was recorded yet."""
+    try:
+        with open(path) as f:
+            return IndexGeneration.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def save_generation(path: Path, generation: IndexGeneration) -> None:
+    """Record the live generation. The file is replaced in one step, so readers never see it half written."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    with open(temp_path, "w") as f:
+        json.dump(generation.to_dict(), f)
+    os.replace(temp_path, path)
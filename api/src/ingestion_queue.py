@@ -0,0 +1,580 @@
+import asyncio
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from src.embedding_pipeline import EmbeddingProgress
+from src.structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from src.coordination import JobStatusStore, LeaseStore
+    from src.document_processors import DocumentProcessor
+    from src.document_store import DocumentStore
+    from src.file_handler import FileHandler
+    from src.vector_store import VectorStore
+
+logger = get_logger(__name__)
+
+
+class JobStage:
+    QUEUED = "queued"
+    LINKING = "linking"
+    PARSING = "parsing"
+    EMBEDDING = "embedding"
+    STORING = "storing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs."""
+
+
+class IngestionJob:
+    """State of a single document ingestion, as reported by GET /jobs/{id}."""
+
+    def __init__(self, file_path: Path, filename: str, session_id: Optional[str], file_hash: str):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.session_id = session_id
+        self.file_hash = file_hash
+        self.deduplicated = False
+        self.created_vectors = False
+        # Index generation the chunks were written to, taken before embedding starts.
+        self.fingerprint: Optional[str] = None
+        self.stage = JobStage.QUEUED
+        self.error: Optional[str] = None
+        self.document_id: Optional[str] = None
+        self.splits_ids: List[str] = []
+        self.progress = EmbeddingProgress()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in (JobStage.COMPLETED, JobStage.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "stage": self.stage,
+            "error": self.error,
+            "document_id": self.document_id,
+            "deduplicated": self.deduplicated,
+            **self.progress.to_dict(),
+            "queued_seconds": round((self.started_at or end) - self.created_at, 3),
+            "elapsed_seconds": round(end - self.started_at, 3) if self.started_at else 0.0,
+        }
+
+
+class IngestionBatch:
+    """Several documents of one session ingested together, as reported by GET /batches/{id}.
+
+    Each document still has its own IngestionJob; the batch only adds totals.
+    """
+
+    def __init__(self, jobs: List[IngestionJob], session_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.jobs = jobs
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        completed = [job for job in self.jobs if job.stage == JobStage.COMPLETED]
+        # Chunks this batch embedded itself; deduplicated documents reuse existing ones.
+        chunks = sum(job.progress.chunks_embedded for job in completed if not job.deduplicated)
+        return {
+            "id": self.id,
+            "job_ids": [job.id for job in self.jobs],
+            "documents": len(self.jobs),
+            "stages": dict(Counter(job.stage for job in self.jobs)),
+            "deduplicated": sum(1 for job in completed if job.deduplicated),
+            "chunks_embedded": chunks,
+            "finished": self.finished,
+            "queued_seconds": round((self.started_at or end) - self.created_at, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(len(completed) / elapsed, 2) if elapsed > 0 else 0.0,
+            "chunks_per_second": round(chunks / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class IngestionQueue:
+    """Bounded pool of workers that ingest uploaded documents in the background.
+
+    Each worker takes one job at a time through parsing, embedding and storing,
+    so with several workers different uploads progress through the stages
+    concurrently instead of holding the HTTP request open. A batch takes one
+    queue slot and is run as a pipeline: up to parse_concurrency documents are
+    parsed while the chunks of those already parsed are embedded together in
+    runs of about chunk_batch_size, and each run's documents are stored with a
+    single insert_many.
+
+    Chunk ids are derived from the session and the file hash, so ingesting a
+    file again after a crash overwrites the chunks left behind instead of
+    duplicating them, and documents already stored are skipped as duplicates.
+
+    With several API worker processes, job_statuses shares the jobs' status
+    (published every sync_interval_seconds and when they finish) and leases
+    keeps two workers from ingesting the same content at once. Each worker
+    still runs the jobs of the uploads it received.
+    """
+
+    def __init__(self, file_handler: "FileHandler", document_processor: "DocumentProcessor",
+                 vector_store: "VectorStore", document_store: "DocumentStore",
+                 workers: int = 2, max_queue_size: int = 100, max_finished_jobs: int = 1000,
+                 parse_concurrency: int = 4, chunk_batch_size: int = 512,
+                 job_statuses: Optional["JobStatusStore"] = None, leases: Optional["LeaseStore"] = None,
+                 sync_interval_seconds: float = 1.0):
+        self.file_handler = file_handler
+        self.document_processor = document_processor
+        self.vector_store = vector_store
+        self.document_store = document_store
+        self.workers = max(1, workers)
+        self.max_finished_jobs = max_finished_jobs
+        self.parse_concurrency = max(1, parse_concurrency)
+        self.chunk_batch_size = max(1, chunk_batch_size)
+        self.job_statuses = job_statuses
+        self.leases = leases
+        self.sync_interval_seconds = sync_interval_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self.batches: "OrderedDict[str, IngestionBatch]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+        # Jobs per file hash still queued or running, so a shared file is kept
+        # until the last job that may need it is done, and jobs for the same
+        # content run one after the other and can reuse each other's chunks.
+        self._pending_hashes: Counter = Counter()
+        self._in_flight: Dict[str, asyncio.Event] = {}
+
+    async def start(self) -> None:
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        if self.job_statuses is not None:
+            self._tasks.append(asyncio.create_task(self._sync_periodically()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, file_path: Path, filename: str, session_id: Optional[str] = None, *,
+               file_hash: str) -> IngestionJob:
+        """Queue a saved upload; file_hash is its content hash, as returned by FileHandler.save_stream."""
+        job = IngestionJob(file_path, filename, session_id, file_hash)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Too many documents are being processed, try again later")
+
+        self.jobs[job.id] = job
+        self._pending_hashes[file_hash] += 1
+        self._prune_finished_jobs()
+        return job
+
+    def submit_batch(self, files: List[Tuple[Path, str, str]],
+                     session_id: Optional[str] = None) -> IngestionBatch:
+        """Queue (file_path, filename, file_hash) tuples as one batch."""
+        batch = IngestionBatch(
+            [IngestionJob(file_path, filename, session_id, file_hash) for file_path, filename, file_hash in files],
+            session_id
+        )
+        try:
+            self.queue.put_nowait(batch)
+        except asyncio.QueueFull:
+            raise QueueFullError("Too many documents are being processed, try again later")
+
+        self.batches[batch.id] = batch
+        for job in batch.jobs:
+            self.jobs[job.id] = job
+            self._pending_hashes[job.file_hash] += 1
+        self._prune_finished_jobs()
+        return batch
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def get_batch(self, batch_id: str) -> Optional[IngestionBatch]:
+        return self.batches.get(batch_id)
+
+    async def find_job(self, job_id: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Status of one of the session's jobs, whichever worker runs it."""
+        return await self._find("job", self.jobs.get(job_id), job_id, session_id)
+
+    async def find_batch(self, batch_id: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._find("batch", self.batches.get(batch_id), batch_id, session_id)
+
+    async def _find(self, kind: str, item: Optional[Union[IngestionJob, IngestionBatch]], item_id: str,
+                    session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if item is not None:
+            return item.to_dict() if item.session_id == session_id else None
+        if self.job_statuses is None:
+            return None
+        entry = await self.job_statuses.get(kind, item_id)
+        return entry["status"] if entry is not None and entry["session_id"] == session_id else None
+
+    def is_pending(self, file_hash: Optional[str]) -> bool:
+        """Whether a job of this worker still uses the file; see pending_hashes for every worker's."""
+        return file_hash is not None and self._pending_hashes[file_hash] > 0
+
+    async def pending_hashes(self, file_hashes: Optional[Iterable[Optional[str]]] = None) -> Set[str]:
+        """Hashes of the files a queued or running job uses, among file_hashes or all of them."""
+        if file_hashes is None:
+            pending = set(self._pending_hashes)
+        else:
+            file_hashes = [file_hash for file_hash in file_hashes if file_hash is not None]
+            pending = {file_hash for file_hash in file_hashes if self.is_pending(file_hash)}
+        if self.job_statuses is not None:
+            pending |= await self.job_statuses.pending_hashes(None if file_hashes is None else list(file_hashes))
+        return pending
+
+    async def publish(self, *items: Union[IngestionJob, IngestionBatch]) -> None:
+        """Share the status of jobs and batches with the other workers, if there are any.
+
+        A failure is logged and left to the next periodic sync.
+        """
+        if self.job_statuses is None:
+            return
+        entries = []
+        for item in items:
+            jobs = item.jobs if isinstance(item, IngestionBatch) else [item]
+            entries.extend({
+                "id": job.id,
+                "kind": "job",
+                "session_id": job.session_id,
+                "file_hashes": [job.file_hash],
+                "finished": job.finished,
+                "status": job.to_dict(),
+            } for job in jobs)
+            if isinstance(item, IngestionBatch):
+                entries.append({
+                    "id": item.id,
+                    "kind": "batch",
+                    "session_id": item.session_id,
+                    "file_hashes": [],
+                    "finished": item.finished,
+                    "status": item.to_dict(),
+                })
+        try:
+            await self.job_statuses.publish(entries)
+        except Exception as e:
+            logger.warning("publishing ingestion job status failed", error=str(e))
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval_seconds)
+            batched = {job.id for batch in self.batches.values() if not batch.finished for job in batch.jobs}
+            await self.publish(
+                *[batch for batch in self.batches.values() if not batch.finished],
+                *[job for job in self.jobs.values() if not job.finished and job.id not in batched]
+            )
+
+    async def release_file(self, file_path: Path, file_hash: Optional[str] = None) -> None:
+        """Delete an uploaded file unless a stored document or a pending job still uses it."""
+        if file_hash is not None:
+            if await self.pending_hashes([file_hash]):
+                return
+            if await self.document_store.find_document_by_hash(file_hash) is not None:
+                return
+        await self.file_handler.delete_file(file_path)
+
+    def _prune_finished_jobs(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+        finished = [batch_id for batch_id, batch in self.batches.items() if batch.finished]
+        for batch_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.batches[batch_id]
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self.queue.get()
+            try:
+                if isinstance(item, IngestionBatch):
+                    await self._process_batch(item)
+                else:
+                    await self._process(item)
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, job: IngestionJob) -> None:
+        try:
+            await self._run_exclusive(job)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            await self._finish(job)
+
+    async def _process_batch(self, batch: IngestionBatch) -> None:
+        batch.started_at = time.time()
+        try:
+            await self._run_batch_exclusive(batch)
+        except Exception as e:
+            for job in batch.jobs:
+                if not job.finished:
+                    self._fail(job, e)
+        finally:
+            for job in batch.jobs:
+                await self._finish(job)
+            batch.finished_at = time.time()
+            batch.done.set()
+            await self.publish(batch)
+
+    def _fail(self, job: IngestionJob, error: Exception) -> None:
+        job.stage = JobStage.FAILED
+        job.error = str(error)
+        logger.warning("ingestion job failed", job_id=job.id, filename=job.filename, error=str(error))
+
+    async def _finish(self, job: IngestionJob) -> None:
+        job.finished_at = time.time()
+        self._pending_hashes[job.file_hash] -= 1
+        if self._pending_hashes[job.file_hash] <= 0:
+            del self._pending_hashes[job.file_hash]
+        await self.publish(job)
+        if job.stage == JobStage.FAILED:
+            await self._cleanup_failed(job)
+
+    async def _cleanup_failed(self, job: IngestionJob) -> None:
+        if job.created_vectors:
+            await self.vector_store.delete_documents(job.splits_ids, job.session_id)
+        elif job.deduplicated and job.document_id is None:
+            await self.vector_store.remove_owner(job.splits_ids, job.session_id, remaining_owner=None)
+        await self.release_file(job.file_path, job.file_hash)
+
+    async def _run_exclusive(self, job: IngestionJob) -> None:
+        while job.file_hash in self._in_flight:
+            await self._in_flight[job.file_hash].wait()
+        done = self._in_flight[job.file_hash] = asyncio.Event()
+        try:
+            async with self._exclusive_across_workers([job.file_hash]):
+                await self._run(job)
+        finally:
+            del self._in_flight[job.file_hash]
+            done.set()
+
+    @asynccontextmanager
+    async def _exclusive_across_workers(self, file_hashes: Iterable[str]) -> AsyncIterator[None]:
+        """Hold the leases of the file hashes, so other workers do not ingest the same content meanwhile."""
+        names = [f"ingest:{file_hash}" for file_hash in file_hashes]
+        if self.leases is None or not names:
+            yield
+            return
+        await self.leases.acquire_all(names)
+        try:
+            yield
+        finally:
+            await self.leases.release(*names)
+
+    async def _reuse_existing(self, job: IngestionJob) -> bool:
+        """Complete the job from a document already stored with the same content, if there is one."""
+        existing = await self.document_store.find_session_document_by_hash(job.file_hash, job.session_id)
+        if existing is not None:
+            job.deduplicated = True
+            job.document_id = str(existing["_id"])
+            job.progress.chunks_total = job.progress.chunks_embedded = len(existing.get("document_splits", []))
+            job.stage = JobStage.COMPLETED
+            return True
+
+        shared = await self.document_store.find_document_by_hash(job.file_hash)
+        if shared is not None:
+            await self._link(job, shared)
+            return True
+        return False
+
+    @staticmethod
+    def _chunk_ids(job: IngestionJob, count: int) -> List[str]:
+        return [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{job.session_id}/{job.file_hash}/{i}")) for i in range(count)]
+
+    async def _run(self, job: IngestionJob) -> None:
+        job.started_at = time.time()
+
+        if await self._reuse_existing(job):
+            return
+
+        job.stage = JobStage.PARSING
+        document_splits = await self.document_processor.process(job.file_path, job.session_id)
+        job.progress.chunks_total = len(document_splits)
+
+        job.stage = JobStage.EMBEDDING
+        # Ids are assigned up front so a failed job can remove the batches already upserted.
+        job.splits_ids = self._chunk_ids(job, len(document_splits))
+        job.fingerprint = self.vector_store.generation.fingerprint
+        job.created_vectors = True
+        await self.vector_store.add_document(document_splits, ids=job.splits_ids, progress=job.progress)
+
+        job.stage = JobStage.STORING
+        job.document_id = await self.document_store.add_document(
+            file_path=job.file_path,
+            filename=job.filename,
+            splits_ids=job.splits_ids,
+            session_id=job.session_id,
+            file_hash=job.file_hash,
+            fingerprint=job.fingerprint
+        )
+        job.stage = JobStage.COMPLETED
+
+    async def _link(self, job: IngestionJob, shared: Dict[str, Any]) -> None:
+        """Attach the job's session to chunks already embedded for the same file."""
+        job.stage = JobStage.LINKING
+        job.deduplicated = True
+        job.splits_ids = list(shared.get("document_splits", []))
+        job.progress.chunks_total = job.progress.chunks_embedded = len(job.splits_ids)
+        await self.vector_store.add_owner(job.splits_ids, job.session_id, source_session_id=shared.get("session_id"))
+
+        job.stage = JobStage.STORING
+        job.document_id = await self.document_store.add_document(
+            file_path=Path(shared["file_path"]),
+            filename=job.filename,
+            splits_ids=job.splits_ids,
+            session_id=job.session_id,
+            file_hash=job.file_hash,
+            fingerprint=shared.get("fingerprint")
+        )
+        job.stage = JobStage.COMPLETED
+
+    async def _run_batch_exclusive(self, batch: IngestionBatch) -> None:
+        hashes = {job.file_hash for job in batch.jobs if job.file_hash is not None}
+        while True:
+            busy = [self._in_flight[file_hash] for file_hash in hashes if file_hash in self._in_flight]
+            if not busy:
+                break
+            await busy[0].wait()
+        done = asyncio.Event()
+        for file_hash in hashes:
+            self._in_flight[file_hash] = done
+        try:
+            async with self._exclusive_across_workers(hashes):
+                await self._run_batch(batch)
+        finally:
+            for file_hash in hashes:
+                del self._in_flight[file_hash]
+            done.set()
+
+    async def _run_batch(self, batch: IngestionBatch) -> None:
+        fresh: List[IngestionJob] = []
+        copies: List[Tuple[IngestionJob, IngestionJob]] = []
+        first_by_hash: Dict[str, IngestionJob] = {}
+        for job in batch.jobs:
+            job.started_at = time.time()
+            if job.file_hash in first_by_hash:
+                copies.append((job, first_by_hash[job.file_hash]))
+                continue
+            if job.file_hash is not None:
+                first_by_hash[job.file_hash] = job
+            try:
+                if not await self._reuse_existing(job):
+                    fresh.append(job)
+            except Exception as e:
+                self._fail(job, e)
+
+        parsed: asyncio.Queue = asyncio.Queue(maxsize=self.parse_concurrency)
+        slots = asyncio.Semaphore(self.parse_concurrency)
+
+        async def parse(job: IngestionJob) -> None:
+            async with slots:
+                job.stage = JobStage.PARSING
+                try:
+                    document_splits = await self.document_processor.process(job.file_path, job.session_id)
+                except Exception as e:
+                    self._fail(job, e)
+                    document_splits = None
+            await parsed.put((job, document_splits))
+
+        parsers = [asyncio.create_task(parse(job)) for job in fresh]
+        stores: List[asyncio.Task] = []
+        try:
+            group: List[Tuple[IngestionJob, List]] = []
+            group_chunks = 0
+            for _ in fresh:
+                job, document_splits = await parsed.get()
+                if document_splits is None:
+                    continue
+                job.stage = JobStage.EMBEDDING
+                job.progress.chunks_total = len(document_splits)
+                job.splits_ids = self._chunk_ids(job, len(document_splits))
+                group.append((job, document_splits))
+                group_chunks += len(document_splits)
+                if group_chunks >= self.chunk_batch_size:
+                    stores.extend(await self._embed_group(group))
+                    group, group_chunks = [], 0
+            if group:
+                stores.extend(await self._embed_group(group))
+            await asyncio.gather(*stores)
+        finally:
+            for task in parsers + stores:
+                task.cancel()
+            await asyncio.gather(*parsers, *stores, return_exceptions=True)
+
+        for job, first in copies:
+            if first.stage == JobStage.COMPLETED:
+                job.deduplicated = True
+                job.document_id = first.document_id
+                job.splits_ids = first.splits_ids
+                job.progress.chunks_total = job.progress.chunks_embedded = len(first.splits_ids)
+                job.stage = JobStage.COMPLETED
+            else:
+                self._fail(job, Exception(first.error or "Ingestion of the same file failed"))
+
+    async def _embed_group(self, group: List[Tuple[IngestionJob, List]]) -> List[asyncio.Task]:
+        """Embed the chunks of several parsed documents in one pipeline run, then store them in the background.
+
+        Returns the storing task, if any, so the next group can be embedded meanwhile.
+        """
+        ids = [chunk_id for job, _ in group for chunk_id in job.splits_ids]
+        documents = [doc for _, document_splits in group for doc in document_splits]
+        for job, _ in group:
+            job.fingerprint = self.vector_store.generation.fingerprint
+            job.created_vectors = True
+        progress = EmbeddingProgress()
+        try:
+            await self.vector_store.add_document(documents, ids=ids, progress=progress)
+        except Exception as e:
+            for job, _ in group:
+                self._fail(job, e)
+            return []
+
+        jobs = [job for job, _ in group]
+        for job in jobs:
+            job.progress.chunks_embedded = job.progress.chunks_total
+            job.progress.batches_completed = progress.batches_completed
+            job.progress.started_at = progress.started_at
+            job.progress.finished_at = progress.finished_at
+            job.stage = JobStage.STORING
+        return [asyncio.create_task(self._store_group(jobs))]
+
+    async def _store_group(self, jobs: List[IngestionJob]) -> None:
+        try:
+            document_ids = await self.document_store.add_documents([
+                self.document_store.document_entry(
+                    file_path=job.file_path,
+                    filename=job.filename,
+                    splits_ids=job.splits_ids,
+                    session_id=job.session_id,
+                    file_hash=job.file_hash,
+                    fingerprint=job.fingerprint
+                )
+                for job in jobs
+            ])
+        except Exception as e:
+            for job in jobs:
+                self._fail(job, e)
+            return
+        for job, document_id in zip(jobs, document_ids):
+            job.document_id = document_id
+            job.stage = JobStage.COMPLETED
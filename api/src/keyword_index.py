@@ -0,0 +1,230 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+# Words plus identifiers joined by - _ . / such as "E-1042", "v2.3.1" or "PN_88/B".
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_SEPARATORS = re.compile(r"[-./_]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers are kept whole and also split into their parts."""
+    terms = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        parts = [part for part in _SEPARATORS.split(token) if len(part) > 1]
+        if len(parts) > 1 or (parts and parts[0] != token):
+            terms.extend(parts)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = 60) -> List[Document]:
+    """Fuse ranked lists by summing 1 / (k + rank) per document id."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(doc.id, doc)
+    return [documents[doc_id] for doc_id in sorted(scores, key=scores.get, reverse=True)]
+
+
+class KeywordIndex:
+    """Incremental on-disk inverted index with BM25 scoring, stored in SQLite.
+
+    Chunks are indexed with the sessions that may see them, mirroring the
+    session_id / owner metadata kept in the vector store, so searches can be
+    restricted to one session.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75, max_term_frequency_ratio: float = 0.1):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.max_term_frequency_ratio = max_term_frequency_ratio
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL,
+                content TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS owners (
+                session_id TEXT NOT NULL, chunk_id TEXT NOT NULL,
+                PRIMARY KEY (session_id, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS owners_chunk ON owners (chunk_id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0), chunks INTEGER NOT NULL, length INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+        """)
+        self._connection.commit()
+
+    def add(self, ids: List[str], documents: List[Document], owners: List[Set[str]]) -> None:
+        """Index chunks, replacing any previous entry with the same id."""
+        with self._lock:
+            self._delete(ids)
+            chunk_rows, posting_rows, owner_rows = [], [], []
+            for chunk_id, doc, sessions in zip(ids, documents, owners):
+                terms = Counter(tokenize(doc.page_content))
+                chunk_rows.append((chunk_id, sum(terms.values()), doc.page_content, json.dumps(doc.metadata)))
+                posting_rows.extend((term, chunk_id, tf) for term, tf in terms.items())
+                owner_rows.extend((session_id, chunk_id) for session_id in sessions)
+            self._connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+            self._connection.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+            self._connection.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                Counter(row[0] for row in posting_rows).items()
+            )
+            self._connection.executemany("INSERT OR IGNORE INTO owners VALUES (?, ?)", owner_rows)
+            self._connection.execute(
+                "UPDATE stats SET chunks = chunks + ?, length = length + ? WHERE id = 0",
+                (len(chunk_rows), sum(row[1] for row in chunk_rows))
+            )
+            self._connection.commit()
+
+    def _delete(self, ids: List[str]) -> None:
+        rows = [(chunk_id,) for chunk_id in ids]
+        # Keep the corpus statistics used by BM25 in step without scanning all chunks.
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            count, length = self._connection.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchone()
+            self._connection.execute(
+                "UPDATE stats SET chunks = chunks - ?, length = length - ? WHERE id = 0", (count, length)
+            )
+            removed_terms = self._connection.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE chunk_id IN ({','.join('?' * len(batch))}) GROUP BY term",
+                batch
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE terms SET df = df - ? WHERE term = ?", [(df, term) for term, df in removed_terms]
+            )
+            self._connection.executemany(
+                "DELETE FROM terms WHERE term = ? AND df <= 0", [(term,) for term, _ in removed_terms]
+            )
+        self._connection.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._connection.executemany("DELETE FROM owners WHERE chunk_id = ?", rows)
+        self._connection.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._delete(ids)
+            self._connection.commit()
+
+    def add_owner(self, ids: List[str], session_id: str) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO owners VALUES (?, ?)", [(session_id, chunk_id) for chunk_id in ids]
+            )
+            self._connection.commit()
+
+    def remove_owner(self, ids: List[str], session_id: str) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM owners WHERE session_id = ? AND chunk_id = ?", [(session_id, chunk_id) for chunk_id in ids]
+            )
+            self._connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT chunks FROM stats WHERE id = 0").fetchone()[0]
+
+    def search(self, query: str, session_id: Optional[str] = None, k: int = 10) -> List[Tuple[Document, float]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+
+        with self._lock:
+            total_chunks, total_length = self._connection.execute(
+                "SELECT chunks, length FROM stats WHERE id = 0"
+            ).fetchone()
+            if total_chunks == 0:
+                return []
+            document_frequency = dict(self._connection.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms
+            ).fetchall())
+            terms = self._selective_terms(document_frequency, total_chunks)
+            if not terms:
+                return []
+            placeholders = ",".join("?" * len(terms))
+
+            if session_id:
+                rows = self._connection.execute(
+                    # CROSS JOIN pins the join order: postings of the (rare) query
+                    # terms first, then point lookups, never a scan of a session.
+                    f"SELECT p.chunk_id, p.term, p.tf, c.length FROM postings p "
+                    f"CROSS JOIN owners o ON o.session_id = ? AND o.chunk_id = p.chunk_id "
+                    f"CROSS JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term IN ({placeholders})",
+                    [session_id, *terms]
+                ).fetchall()
+            else:
+                rows = self._connection.execute(
+                    f"SELECT p.chunk_id, p.term, p.tf, c.length FROM postings p "
+                    f"CROSS JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term IN ({placeholders})",
+                    terms
+                ).fetchall()
+
+            average_length = total_length / total_chunks
+            scores: Dict[str, float] = {}
+            for chunk_id, term, tf, length in rows:
+                df = document_frequency[term]
+                idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+                norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            found = {
+                chunk_id: (content, metadata)
+                for chunk_id, content, metadata in self._connection.execute(
+                    f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(top))})",
+                    [chunk_id for chunk_id, _ in top]
+                ).fetchall()
+            }
+
+        return [
+            (Document(page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1]), id=chunk_id), score)
+            for chunk_id, score in top
+        ]
+
+    def _selective_terms(self, document_frequency: Dict[str, int], total_chunks: int) -> List[str]:
+        """Drop terms found in a large share of chunks, keeping at least the two rarest.
+
+        Their postings lists are the longest to scan while their IDF barely
+        changes the ranking.
+        """
+        by_rarity = sorted(document_frequency, key=document_frequency.get)
+        limit = self.max_term_frequency_ratio * total_chunks
+        return by_rarity[:2] + [term for term in by_rarity[2:] if document_frequency[term] <= limit]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def drop(self) -> None:
+        """Close the index and delete its database files."""
+        with self._lock:
+            self._connection.close()
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_mongodb import MongoDBChatMessageHistory
+from pymongo import ASCENDING, DESCENDING
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[ObjectId]:
+    """Message id used as a pagination cursor; raises ValueError when malformed."""
+    if cursor is None:
+        return None
+    try:
+        return ObjectId(cursor)
+    except (InvalidId, TypeError):
+        raise ValueError(f"Invalid message cursor: {cursor}")
+
+
+class MessageHistoryStore(MongoDBChatMessageHistory):
+    """MongoDBChatMessageHistory with batched writes and cursor-paginated reads.
+
+    Documents keep the SessionId / History layout of the parent class, plus a
+    CreatedAt timestamp. Pages are ordered by _id, whose leading bytes are the
+    insertion time, and served by the (SessionId, _id) index, so a read costs
+    the page size rather than the length of the conversation. Each returned
+    message carries its _id as message.id, to be passed back as a cursor.
+    """
+
+    @staticmethod
+    def index_keys() -> List[Tuple[str, int]]:
+        return [("SessionId", ASCENDING), ("_id", ASCENDING)]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        created_at = datetime.now(timezone.utc)
+        self.collection.insert_many([
+            {
+                self.session_id_key: self.session_id,
+                self.history_key: json.dumps(message_to_dict(message)),
+                "CreatedAt": created_at,
+            }
+            for message in messages
+        ])
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def _to_messages(self, documents: List[Dict[str, Any]]) -> List[BaseMessage]:
+        messages = messages_from_dict([json.loads(document[self.history_key]) for document in documents])
+        for message, document in zip(messages, documents):
+            message.id = str(document["_id"])
+        return messages
+
+    def page(self, limit: int, before: Optional[ObjectId] = None,
+             after: Optional[ObjectId] = None) -> Tuple[List[BaseMessage], bool]:
+        """Up to limit messages in chronological order, and whether more exist in the paging direction.
+
+        With after, the oldest messages newer than it; otherwise the newest
+        messages, older than before when given.
+        """
+        query: Dict[str, Any] = {self.session_id_key: self.session_id}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        elif before is not None:
+            query["_id"] = {"$lt": before}
+        order = ASCENDING if after is not None else DESCENDING
+        documents = list(self.collection.find(query).sort("_id", order).limit(limit + 1))
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        if order == DESCENDING:
+            documents.reverse()
+        return self._to_messages(documents), has_more
+
+    def count_after(self, after: Optional[ObjectId] = None) -> int:
+        query: Dict[str, Any] = {self.session_id_key: self.session_id}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        return self.collection.count_documents(query)
+
+
+class ConversationSummaryStore:
+    """Rolling summary per session of the messages older than the history window.
+
+    through_id is the id of the last message folded into the summary.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("SessionId", unique=True)
+
+    def get(self, session_id: Optional[str]) -> Tuple[str, Optional[ObjectId]]:
+        document = self.collection.find_one({"SessionId": session_id})
+        if document is None:
+            return "", None
+        return document["Summary"], document["ThroughId"]
+
+    def set(self, session_id: Optional[str], summary: str, through_id: ObjectId) -> None:
+        self.collection.update_one(
+            {"SessionId": session_id},
+            {"$set": {"Summary": summary, "ThroughId": through_id, "UpdatedAt": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def delete(self, session_id: Optional[str]) -> None:
+        self.collection.delete_one({"SessionId": session_id})
@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from src.metrics import MODEL_QUEUE_SECONDS
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+GENERATION = "generation"
+EMBEDDING = "embedding"
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class SchedulerBusyError(Exception):
+    """Raised when a model's queue of interactive requests is full."""
+
+    def __init__(self, resource: str, retry_after: int):
+        super().__init__(f"The {resource} model is busy, try again in {retry_after} seconds")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class ModelLane:
+    """Admission to one model server: at most max_in_flight requests at a time, the rest queued by priority.
+
+    Interactive requests are served before background ones and, past
+    max_queue waiting, rejected. Background work (ingestion, re-indexing,
+    summaries) is never rejected; it waits until no interactive request does.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        # Moving average of how long a request holds its slot, for Retry-After.
+        self.hold_seconds = 1.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def retry_after(self) -> int:
+        waiting = self.in_flight + sum(self.queued.values())
+        return max(1, math.ceil(waiting / self.max_in_flight * self.hold_seconds))
+
+    def check_admission(self, priority: int = INTERACTIVE) -> None:
+        """Raise SchedulerBusyError if a request of this priority would be rejected now."""
+        if priority == INTERACTIVE and self.in_flight >= self.max_in_flight \
+                and self.queued[INTERACTIVE] >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusyError(self.name, self.retry_after())
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        start = time.perf_counter()
+        if self.in_flight < self.max_in_flight and not any(self.queued.values()):
+            self.in_flight += 1
+        else:
+            self.check_admission(priority)
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+            self.queued[priority] += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.cancelled():
+                    self.queued[priority] -= 1
+                else:
+                    # The slot was handed over just before the cancellation: pass it on.
+                    self.release()
+                raise
+        waited = time.perf_counter() - start
+        self.admitted += 1
+        self.wait_seconds += waited
+        MODEL_QUEUE_SECONDS.observe(waited, self.name, PRIORITY_NAMES[priority])
+
+    def release(self, held_seconds: Optional[float] = None) -> None:
+        if held_seconds is not None:
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * held_seconds
+        while self._waiters:
+            priority, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # Hand the slot straight to the next waiter, so in_flight stays the same.
+                self.queued[priority] -= 1
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued_interactive": self.queued[INTERACTIVE],
+            "queued_background": self.queued[BACKGROUND],
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "avg_hold_seconds": round(self.hold_seconds, 4),
+        }
+
+
+async def embed_queries(embeddings: "Embeddings", texts: List[str]) -> List[List[float]]:
+    """Embed several questions in one request.
+
+    Ollama embeds queries and documents the same way, so a documents call
+    serves them; embeddings with their own aembed_queries (like the cache
+    wrapper) are asked through it.
+    """
+    if len(texts) == 1:
+        return [await embeddings.aembed_query(texts[0])]
+    batch = getattr(embeddings, "aembed_queries", None)
+    if batch is not None:
+        return await batch(texts)
+    return await embeddings.aembed_documents(texts)
+
+
+class _QueryBatch:
+    def __init__(self, embeddings: "Embeddings"):
+        self.embeddings = embeddings
+        self.futures: Dict[str, List[asyncio.Future]] = {}
+        self.full = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.futures)
+
+
+class ModelScheduler:
+    """Single entry point for requests to the chat and embedding models.
+
+    Each model has a ModelLane capping its in-flight requests, so a traffic
+    spike queues here instead of overloading Ollama, and chat and search
+    requests go ahead of ingestion. Concurrent query embeddings are coalesced:
+    questions arriving within query_batch_window seconds, or while the
+    embedding lane is busy, are embedded together in one request of up to
+    query_max_batch texts.
+    """
+
+    def __init__(self, generation_max_in_flight: int = 2, generation_max_queue: int = 16,
+                 embedding_max_in_flight: int = 4, embedding_max_queue: int = 64,
+                 query_batch_window: float = 0.002, query_max_batch: int = 32):
+        self.lanes = {
+            GENERATION: ModelLane(GENERATION, generation_max_in_flight, generation_max_queue),
+            EMBEDDING: ModelLane(EMBEDDING, embedding_max_in_flight, embedding_max_queue),
+        }
+        self.query_batch_window = query_batch_window
+        self.query_max_batch = max(1, query_max_batch)
+        self.query_batches = 0
+        self.queries_embedded = 0
+        self._open_batches: Dict[int, _QueryBatch] = {}
+        self._flushes: Set[asyncio.Task] = set()
+
+    def check_admission(self, resource: str, priority: int = INTERACTIVE) -> None:
+        self.lanes[resource].check_admission(priority)
+
+    @asynccontextmanager
+    async def slot(self, resource: str, priority: int = INTERACTIVE) -> AsyncIterator[None]:
+        """Hold one of the model's in-flight slots; raises SchedulerBusyError when rejected."""
+        lane = self.lanes[resource]
+        await lane.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            lane.release(time.perf_counter() - start)
+
+    async def embed_query(self, embeddings: "Embeddings", text: str) -> List[float]:
+        """Embed a question, batched with the other questions for the same embeddings."""
+        batch = self._open_batches.get(id(embeddings))
+        if batch is None or batch.embeddings is not embeddings:
+            self.lanes[EMBEDDING].check_admission(INTERACTIVE)
+            batch = self._open_batches[id(embeddings)] = _QueryBatch(embeddings)
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        future = asyncio.get_running_loop().create_future()
+        batch.futures.setdefault(text, []).append(future)
+        if len(batch) >= self.query_max_batch:
+            self._close(batch)
+        return await future
+
+    def _close(self, batch: _QueryBatch) -> None:
+        if self._open_batches.get(id(batch.embeddings)) is batch:
+            del self._open_batches[id(batch.embeddings)]
+        batch.full.set()
+
+    async def _flush(self, batch: _QueryBatch) -> None:
+        try:
+            if self.query_batch_window > 0:
+                try:
+                    await asyncio.wait_for(batch.full.wait(), self.query_batch_window)
+                except asyncio.TimeoutError:
+                    pass
+            # Questions keep joining while the batch waits for a slot.
+            async with self.slot(EMBEDDING, INTERACTIVE):
+                self._close(batch)
+                texts = list(batch.futures)
+                vectors = await embed_queries(batch.embeddings, texts)
+            self.query_batches += 1
+            self.queries_embedded += len(texts)
+            for text, vector in zip(texts, vectors):
+                for future in batch.futures[text]:
+                    if not future.done():
+                        future.set_result(vector)
+        except BaseException as e:
+            self._close(batch)
+            for futures in batch.futures.values():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+            if not isinstance(e, Exception):
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **{name: lane.stats() for name, lane in self.lanes.items()},
+            "query_batches": self.query_batches,
+            "queries_embedded": self.queries_embedded,
+            "avg_query_batch_size": round(self.queries_embedded / self.query_batches, 2) if self.query_batches else 0.0,
+        }
@@ -0,0 +1,270 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Set
+
+from src.index_backends import metadata_sessions
+from src.structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from src.coordination import LeaseStore
+    from src.document_store import DocumentStore
+    from src.file_handler import FileHandler
+    from src.ingestion_queue import IngestionQueue
+    from src.reindexer import Reindexer
+    from src.vector_store import VectorStore
+
+logger = get_logger(__name__)
+
+RECONCILE_LEASE = "reconcile"
+
+
+class ReconcileState:
+    IDLE = "idle"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class OrphanReconciler:
+    """Removes what interrupted deletes and ingestions leave behind in Mongo, documents_dir and the vector index."""
+
+    def __init__(self, file_handler: "FileHandler", vector_store: "VectorStore", document_store: "DocumentStore",
+                 ingestion_queue: "IngestionQueue", reindexer: "Reindexer", interval_seconds: float = 21600.0,
+                 min_age_seconds: float = 3600.0, max_deletes_per_second: float = 200.0, batch_size: int = 500,
+                 leases: Optional["LeaseStore"] = None):
+        self.file_handler = file_handler
+        self.vector_store = vector_store
+        self.document_store = document_store
+        self.ingestion_queue = ingestion_queue
+        self.reindexer = reindexer
+        self.interval_seconds = interval_seconds
+        self.min_age_seconds = min_age_seconds
+        self.max_deletes_per_second = max_deletes_per_second
+        self.batch_size = max(1, batch_size)
+        self.leases = leases
+        self.state = ReconcileState.IDLE
+        self.dry_run = False
+        self.error: Optional[str] = None
+        self.skipped: List[str] = []
+        self.records_scanned = self.files_scanned = self.chunks_scanned = 0
+        self.records_removed = self.files_removed = self.chunks_removed = 0
+        self.bytes_reclaimed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._deletes = 0
+        self._pace_started = 0.0
+        # Records a dry run would have removed, so the later steps count as if they were gone.
+        self._dropped_records: Set[Any] = set()
+        self._pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._schedule_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, dry_run: bool = False) -> bool:
+        """Start a pass in the background; False if one is running already, here or in another worker."""
+        if self.running:
+            return False
+        if self.leases is not None and not await self.leases.acquire(RECONCILE_LEASE, self.to_dict):
+            return False
+        self._task = asyncio.create_task(self.run(dry_run))
+        return True
+
+    async def status(self) -> Dict[str, Any]:
+        """This worker's pass, or the last one published by another worker."""
+        if self.running or self.leases is None:
+            return self.to_dict()
+        return await self.leases.published(RECONCILE_LEASE) or self.to_dict()
+
+    def schedule(self) -> None:
+        """Run a pass every interval_seconds in the background; an interval of 0 disables it."""
+        if self.interval_seconds > 0 and self._schedule_task is None:
+            self._schedule_task = asyncio.create_task(self._run_periodically())
+
+    async def _run_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            last = (await self.status()).get("finished_at") if self.leases is not None else None
+            if last is not None and time.time() - last < self.interval_seconds:
+                continue
+            try:
+                await self.start()
+            except Exception as e:
+                logger.warning("starting a scheduled reconciliation failed", error=str(e))
+
+    async def stop(self) -> None:
+        for task in (self._schedule_task, self._task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._schedule_task = self._task = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "dry_run": self.dry_run,
+            "error": self.error,
+            "skipped": self.skipped,
+            "records_scanned": self.records_scanned,
+            "files_scanned": self.files_scanned,
+            "chunks_scanned": self.chunks_scanned,
+            "records_removed": self.records_removed,
+            "files_removed": self.files_removed,
+            "chunks_removed": self.chunks_removed,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "elapsed_seconds": round(end - self.started_at, 3) if self.started_at else 0.0,
+            "finished_at": self.finished_at,
+        }
+
+    async def run(self, dry_run: bool = False) -> None:
+        self.state = ReconcileState.RUNNING
+        self.dry_run = dry_run
+        self.error = None
+        self.skipped = []
+        self.records_scanned = self.files_scanned = self.chunks_scanned = 0
+        self.records_removed = self.files_removed = self.chunks_removed = 0
+        self.bytes_reclaimed = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self._deletes = 0
+        self._pace_started = time.perf_counter()
+        self._dropped_records = set()
+        try:
+            if await self._reconcile_records():
+                await self._reconcile_files()
+            if self.reindexer.running:
+                self.skipped.append("chunks: a re-index is running")
+            else:
+                await self._reconcile_chunks()
+            self.state = ReconcileState.COMPLETED
+            logger.info("orphan reconciliation completed", **self.to_dict())
+        except Exception as e:
+            self.state = ReconcileState.FAILED
+            self.error = str(e)
+            logger.exception("orphan reconciliation failed")
+        finally:
+            self.finished_at = time.time()
+            if self.leases is not None:
+                await self.leases.release(RECONCILE_LEASE, status=self.to_dict())
+
+    async def _load_pending(self) -> None:
+        """Take a snapshot of the file hashes pending ingestion in any worker."""
+        self._pending = await self.ingestion_queue.pending_hashes()
+
+    def _is_pending(self, file_name: str) -> bool:
+        # Stored files are named after their content hash.
+        return Path(file_name).stem in self._pending
+
+    async def _references(self) -> AsyncIterator[Dict[str, Any]]:
+        async for document in self.document_store.iterate_references():
+            if document["_id"] not in self._dropped_records:
+                yield document
+
+    async def _referenced_chunks(self) -> Set[str]:
+        referenced: Set[str] = set()
+        async for document in self._references():
+            referenced.update(self.document_store.split_ids(document))
+        return referenced
+
+    async def _reconcile_records(self) -> bool:
+        """Remove records whose file is gone; False if no record's file was found at all."""
+        records = [document async for document in self._references()]
+        self.records_scanned = len(records)
+        if not records:
+            return True
+        documents_dir = self.file_handler.documents_dir
+
+        def find_missing() -> List[Any]:
+            return [
+                document["_id"] for document in records
+                if not Path(document["file_path"]).exists()
+                and not (documents_dir / Path(document["file_path"]).name).exists()
+            ]
+
+        missing = await asyncio.to_thread(find_missing)
+        if len(missing) == len(records):
+            self.skipped.append(f"records and files: none of the recorded files is in {documents_dir}")
+            logger.warning("no recorded file found, not removing records or files", documents_dir=str(documents_dir))
+            return False
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            if self.dry_run:
+                self._dropped_records.update(batch)
+                self.records_removed += len(batch)
+            else:
+                self.records_removed += await self.document_store.delete_documents_by_id(batch)
+            await self._throttle(len(batch))
+        return True
+
+    async def _reconcile_files(self) -> None:
+        referenced = {Path(document["file_path"]).name async for document in self._references()}
+        files = await asyncio.to_thread(self.file_handler.list_files)
+        self.files_scanned = len(files)
+        await self._load_pending()
+        now = time.time()
+        orphans = [
+            stored for stored in files
+            if stored.path.name not in referenced and not self._is_pending(stored.path.name)
+            and now - stored.modified_at >= self.min_age_seconds
+        ]
+        for start in range(0, len(orphans), self.batch_size):
+            batch = orphans[start:start + self.batch_size]
+            if self.dry_run:
+                self.files_removed += len(batch)
+                self.bytes_reclaimed += sum(stored.size for stored in batch)
+            else:
+                # Checked again right before each unlink: a file may have been reused by an upload since.
+                await self._load_pending()
+                deleted, freed = await self.file_handler.delete_files(
+                    [stored.path for stored in batch if not self._is_pending(stored.path.name)],
+                    min_age_seconds=self.min_age_seconds
+                )
+                self.files_removed += len(deleted)
+                self.bytes_reclaimed += freed
+            await self._throttle(len(batch))
+
+    async def _reconcile_chunks(self) -> None:
+        referenced = await self._referenced_chunks()
+        # Chunk id -> the one session holding it, or None, so deletes only look in that session's partition.
+        candidates: Dict[str, Optional[str]] = {}
+        sources: Dict[str, str] = {}
+        await self._load_pending()
+        async for ids, documents in self.vector_store.iterate_chunks(self.batch_size):
+            self.chunks_scanned += len(ids)
+            for chunk_id, document in zip(ids, documents):
+                source = document.metadata.get("source") or ""
+                if chunk_id in referenced or self._is_pending(source):
+                    continue
+                sessions = metadata_sessions(document.metadata)
+                candidates[chunk_id] = next(iter(sessions)) if len(sessions) == 1 else None
+                sources[chunk_id] = source
+        if not candidates:
+            return
+        # Ingestions that finished during the scan have recorded their chunks by now; those still running are pending.
+        referenced = await self._referenced_chunks()
+        await self._load_pending()
+        for chunk_id in [chunk_id for chunk_id in candidates
+                         if chunk_id in referenced or self._is_pending(sources[chunk_id])]:
+            del candidates[chunk_id]
+        by_session: Dict[Optional[str], List[str]] = {}
+        for chunk_id, session_id in candidates.items():
+            by_session.setdefault(session_id, []).append(chunk_id)
+        for session_id, chunk_ids in by_session.items():
+            for start in range(0, len(chunk_ids), self.batch_size):
+                batch = chunk_ids[start:start + self.batch_size]
+                if not self.dry_run:
+                    await self.vector_store.delete_documents(batch, session_id)
+                self.chunks_removed += len(batch)
+                await self._throttle(len(batch))
+
+    async def _throttle(self, deleted: int) -> None:
+        self._deletes += deleted
+        if self.dry_run or self.max_deletes_per_second <= 0:
+            return
+        ahead = self._deletes / self.max_deletes_per_second - (time.perf_counter() - self._pace_started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
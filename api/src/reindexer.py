@@ -0,0 +1,251 @@
+import asyncio
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from src.coordination import LeaseStore
+from src.document_processors import DocumentProcessor
+from src.document_store import DocumentStore
+from src.index_backends import owner_key
+from src.index_generation import IndexGeneration
+from src.structured_logging import get_logger
+from src.vector_store import VectorStore
+
+logger = get_logger(__name__)
+
+REINDEX_LEASE = "reindex"
+# Chunks embedded and written per step, so pacing also holds within a large document.
+REINDEX_SLICE_CHUNKS = 32
+
+
+class ReindexState:
+    IDLE = "idle"
+    REBUILDING = "rebuilding"
+    SWAPPING = "swapping"
+    CATCHING_UP = "catching_up"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class Reindexer:
+    """Rebuilds the vector index when the chunking or embedding settings change.
+
+    The live store keeps serving searches and uploads from its generation
+    while documents stored for any other fingerprint are re-parsed with the
+    current chunk settings and embedded with the current model into a shadow
+    generation. Deletes made meanwhile are applied to the shadow as well.
+    Documents sharing a file hash share one set of chunks, so they are
+    re-indexed together. The new split ids are recorded next to the live ones
+    in Mongo. Once nothing is left, the live store adopts the shadow in one
+    step, switching every search over at once, and the recorded splits are
+    promoted; deletes in between see both sets of ids. Documents stored by
+    uploads that raced the swap are re-indexed straight into the new
+    generation afterwards, replacing the chunks they were ingested with, and
+    the old generation is dropped.
+
+    Embedding runs with its own small max_in_flight and is paced to
+    max_chunks_per_second, a slice of a document at a time, so a rebuild
+    leaves the embedding server to live traffic. A run that fails or is interrupted can be started again: shadow
+    chunks not recorded in Mongo are removed and recorded ones are kept.
+
+    With leases, only one worker process re-indexes at a time and the others
+    report its progress. Deletes made in other workers meanwhile do not reach
+    the shadow; the chunks they leave behind are removed by the orphan
+    reconciler once the shadow is live.
+    """
+
+    def __init__(self, vector_store: VectorStore, document_store: DocumentStore,
+                 document_processor: DocumentProcessor,
+                 create_shadow: Callable[[IndexGeneration], VectorStore],
+                 target: IndexGeneration, max_chunks_per_second: float = 50.0,
+                 leases: Optional[LeaseStore] = None):
+        self.vector_store = vector_store
+        self.document_store = document_store
+        self.document_processor = document_processor
+        self.create_shadow = create_shadow
+        self.target = target
+        self.max_chunks_per_second = max_chunks_per_second
+        self.leases = leases
+        self.state = ReindexState.IDLE
+        self.error: Optional[str] = None
+        self.documents_total = 0
+        self.documents_done = 0
+        self.chunks_done = 0
+        self.failed_documents: Set[Any] = set()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._shadow: Optional[VectorStore] = None
+        # Held while re-indexed splits are recorded and while generations are swapped. Document
+        # deletes hold it too, so they see either none of a document's new splits or all of them.
+        self.splits_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> bool:
+        """Start a run in the background; False if one is running already, here or in another worker."""
+        if self.running:
+            return False
+        if self.leases is not None and not await self.leases.acquire(REINDEX_LEASE, self.to_dict):
+            return False
+        self._task = asyncio.create_task(self.run())
+        return True
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def status(self) -> Dict[str, Any]:
+        """This worker's run, or the last one published by another worker."""
+        if self.running or self.leases is None:
+            return self.to_dict()
+        return await self.leases.published(REINDEX_LEASE) or self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "state": self.state,
+            "error": self.error,
+            "live_fingerprint": self.vector_store.generation.fingerprint,
+            "target_fingerprint": self.target.fingerprint,
+            "documents_total": self.documents_total,
+            "documents_done": self.documents_done,
+            "documents_failed": len(self.failed_documents),
+            "chunks_done": self.chunks_done,
+            "chunks_per_second": round(self.chunks_done / elapsed, 2) if elapsed > 0 else 0.0,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+
+    async def run(self) -> None:
+        self.state = ReindexState.REBUILDING
+        self.error = None
+        self.documents_total = self.documents_done = self.chunks_done = 0
+        self.failed_documents = set()
+        self.started_at = time.time()
+        self.finished_at = None
+        try:
+            if self.vector_store.generation.fingerprint == self.target.fingerprint:
+                # Finish a run that swapped generations but failed before promoting the splits.
+                await self.document_store.promote_shadow(self.target.fingerprint)
+                await self.document_store.clear_shadow()
+                self.state = ReindexState.COMPLETED
+                return
+
+            await self.document_store.clear_shadow(keep_fingerprint=self.target.fingerprint)
+            if self._shadow is None or self._shadow.generation.fingerprint != self.target.fingerprint:
+                self._shadow = self.create_shadow(self.target)
+                await self._remove_unrecorded_chunks(self._shadow)
+            self.vector_store.set_shadow(self._shadow)
+
+            while await self._reindex_pass(self._shadow, shadow=True):
+                pass
+
+            self.state = ReindexState.SWAPPING
+            async with self.splits_lock:
+                old_index, old_keyword_index = self.vector_store.adopt(self._shadow)
+                self._shadow = None
+                await self.document_store.promote_shadow(self.target.fingerprint)
+
+            self.state = ReindexState.CATCHING_UP
+            while await self._reindex_pass(self.vector_store, shadow=False):
+                pass
+            await asyncio.to_thread(old_index.drop)
+            if old_keyword_index is not None:
+                await asyncio.to_thread(old_keyword_index.drop)
+            self.state = ReindexState.COMPLETED
+            logger.info("re-index completed", documents=self.documents_done, chunks=self.chunks_done,
+                        generation=self.target.name)
+        except Exception as e:
+            self.state = ReindexState.FAILED
+            self.error = str(e)
+            logger.exception("re-index failed", error=str(e))
+        finally:
+            self.finished_at = time.time()
+            if self.leases is not None:
+                await self.leases.release(REINDEX_LEASE, status=self.to_dict())
+
+    async def _remove_unrecorded_chunks(self, shadow: VectorStore) -> None:
+        """Delete shadow chunks written by an interrupted run before Mongo recorded them."""
+        recorded = set(await self.document_store.shadow_split_ids(self.target.fingerprint))
+        batches = shadow.index.iterate()
+        unrecorded = []
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            unrecorded.extend(chunk_id for chunk_id in batch[0] if chunk_id not in recorded)
+        if unrecorded:
+            await shadow.delete_documents(unrecorded)
+
+    async def _reindex_pass(self, store: VectorStore, shadow: bool) -> int:
+        """Re-index every stale document into store, returning how many were done."""
+        documents = [
+            doc for doc in await self.document_store.find_stale_documents(self.target.fingerprint)
+            if doc["_id"] not in self.failed_documents
+        ]
+        groups: "OrderedDict[Any, List[Dict[str, Any]]]" = OrderedDict()
+        for doc in documents:
+            groups.setdefault(doc.get("file_hash") or doc["_id"], []).append(doc)
+        self.documents_total += len(documents)
+
+        done = 0
+        for key, group in groups.items():
+            try:
+                if group[0].get("file_hash"):
+                    # Up-to-date documents with the same content own the same chunks: keep them as owners.
+                    group = await self.document_store.find_documents_by_hash(key) or group
+                await self._reindex_group(store, str(key), group, shadow)
+                done += len(group)
+            except Exception as e:
+                self.failed_documents.update(doc["_id"] for doc in group)
+                logger.warning("re-index of a document failed", file_path=group[0]["file_path"], error=str(e))
+            self.documents_done += len(group)
+            await self._throttle()
+        return done
+
+    async def _reindex_group(self, store: VectorStore, key: str, group: List[Dict[str, Any]], shadow: bool) -> None:
+        primary = group[0]
+        sessions = [doc.get("session_id") for doc in group]
+        document_splits = await self.document_processor.process(Path(primary["file_path"]), primary.get("session_id"))
+        for doc in document_splits:
+            for session_id in sessions:
+                if session_id:
+                    doc.metadata[owner_key(session_id)] = True
+        ids = [self.target.chunk_id(key, position) for position in range(len(document_splits))]
+        for start in range(0, len(ids), REINDEX_SLICE_CHUNKS):
+            await store.add_document(document_splits[start:start + REINDEX_SLICE_CHUNKS],
+                                     ids=ids[start:start + REINDEX_SLICE_CHUNKS])
+            self.chunks_done += len(ids[start:start + REINDEX_SLICE_CHUNKS])
+            await self._throttle()
+
+        async with self.splits_lock:
+            remaining = await self.document_store.set_splits(
+                [doc["_id"] for doc in group], ids, self.target.fingerprint, shadow=shadow
+            )
+            # Documents deleted while their chunks were rebuilt must not stay visible to their sessions.
+            remaining_sessions = [doc.get("session_id") for doc in remaining]
+            if not remaining:
+                await store.delete_documents(ids)
+                return
+            for session_id in set(sessions) - set(remaining_sessions):
+                if session_id:
+                    await store.remove_owner(ids, session_id, remaining_owner=remaining_sessions[0])
+            if not shadow:
+                # Catching up, the documents' chunks from ingestion are in the live index too.
+                replaced = {split_id for doc in remaining for split_id in doc.get("document_splits", [])} - set(ids)
+                if replaced:
+                    only_session = remaining_sessions[0] if len(set(remaining_sessions)) == 1 else None
+                    await store.delete_documents(list(replaced), only_session)
+
+    async def _throttle(self) -> None:
+        if self.max_chunks_per_second <= 0 or self.started_at is None:
+            return
+        ahead = self.chunks_done / self.max_chunks_per_second - (time.time() - self.started_at)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
@@ -0,0 +1,120 @@
+import math
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+
+from src.keyword_index import tokenize
+
+
+class Reranker:
+    """Re-orders retrieved candidates by relevance to the question.
+
+    Subclasses implement score(); rerank() sorts by it and keeps timing stats.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        raise NotImplementedError
+
+    def rerank(self, query: str, documents: List[Document], top_n: int) -> List[Document]:
+        """Return the top_n documents by score; ties keep their retrieval order."""
+        if not documents:
+            return []
+        start = time.perf_counter()
+        scores = self.score(query, documents)
+        ranked = sorted(range(len(documents)), key=lambda position: -scores[position])
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        return [documents[position] for position in ranked[:top_n]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reranker": self.name,
+                "requests": self.requests,
+                "avg_ms": round(1000 * self.total_seconds / self.requests, 3) if self.requests else 0.0,
+                "max_ms": round(1000 * self.max_seconds, 3),
+            }
+
+
+class LexicalReranker(Reranker):
+    """BM25 over the candidate set alone. Dependency-free, for tests and low-end machines."""
+
+    name = "lexical"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        super().__init__()
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        query_terms = set(tokenize(query))
+        term_counts = [Counter(tokenize(doc.page_content)) for doc in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = sum(lengths) / len(lengths) or 1.0
+        document_frequency = Counter(term for counts in term_counts for term in query_terms if term in counts)
+
+        scores = []
+        for counts, length in zip(term_counts, lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term, 0)
+                if not tf:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """Local cross-encoder (sentence-transformers) scoring question/chunk pairs on CPU.
+
+    The model is loaded on first use, so creating the reranker costs nothing
+    until a question is asked. sentence-transformers is an optional dependency.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", max_length: int = 512,
+                 batch_size: int = 32):
+        super().__init__()
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import sentence_transformers  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            return self._model
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        pairs = [(query, doc.page_content) for doc in documents]
+        return [float(score) for score in self._get_model().predict(pairs, batch_size=self.batch_size)]
+
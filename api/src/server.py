@@ -1,81 +1,353 @@
-from typing import Annotated
-from fastapi import FastAPI, HTTPException, UploadFile, Header, status
+import time
+
+# Taken first, so the import time covers FastAPI and the application modules.
+_import_started = time.perf_counter()
+
+import json
+import logging
+from typing import Annotated, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request, UploadFile, Header, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
 
-from src.factories import ComponentFactory
+from src.components import Components, Startup
+from src.file_handler import FileTooLargeError
+from src.ingestion_queue import QueueFullError
+from src.model_scheduler import SchedulerBusyError
+from src.metrics import (
+    Gauge, HTTP_REQUEST_SECONDS, collect_request_timings, current_request_timings, registry, server_timing_header
+)
+from src.structured_logging import configure_logging, get_logger
 from config.settings import settings
 
+configure_logging(settings.log_level, settings.log_format, settings.log_sample_rate)
+logger = get_logger(__name__)
+
 class ChatRequest(BaseModel):
     message: str
 
-app = FastAPI(title="PDF Assistant API")
+def build_components() -> Components:
+    # Imported here: the factories pull in langchain, Chroma and Ollama, which the server loads in the background.
+    from src.factories import ComponentFactory
+    return ComponentFactory.create_components()
+
+startup = Startup(
+    build_components,
+    warm_up=settings.warm_up_enabled,
+    retry_seconds=settings.startup_retry_seconds,
+    registry=registry
+)
+startup.timings["import"] = round(time.perf_counter() - _import_started, 3)
+registry.register(Gauge(
+    "rag_startup_seconds", "Time spent in each startup phase; ready is the total from the lifespan start.",
+    lambda: {(phase,): seconds for phase, seconds in startup.timings.items()},
+    ("phase",)
+))
+registry.register(Gauge("rag_ready", "1 once the API is ready to serve requests.", lambda: int(startup.ready)))
+
+def get_components() -> Components:
+    if not startup.serving:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"The API is starting up ({startup.phase})",
+            headers={"Retry-After": str(max(1, round(startup.retry_seconds)))}
+        )
+    return startup.components
 
-file_handler = ComponentFactory.create_file_handler()
-vector_store = ComponentFactory.create_vector_store()
-document_store = ComponentFactory.create_document_store()
-assistant = ComponentFactory.create_assistant()
-document_processor = ComponentFactory.create_document_processor()
+AppComponents = Annotated[Components, Depends(get_components)]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Components are built in the background: the server accepts connections, and answers
+    # /healthz and /readyz, right away instead of after every backend connection and model load.
+    startup.begin()
+    yield
+    await startup.stop()
+
+app = FastAPI(title="PDF Assistant API", lifespan=lifespan)
 
 SUPPORTED_FILE_EXTENSION = "pdf"
+# Room for the multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def upload_limit(path: str) -> Optional[Tuple[int, str]]:
+    """The most bytes an upload to path may declare, with the error message past it; None for no limit."""
+    if path == "/documents" and startup.components is not None:
+        max_bytes = startup.components.file_handler.max_bytes
+        return (max_bytes, f"File exceeds the {max_bytes} byte upload limit") if max_bytes is not None else None
+    if path == "/documents/batch":
+        max_bytes = settings.upload_batch_max_bytes
+        return max_bytes, f"Batch exceeds the {max_bytes} byte upload limit"
+    return None
 
-@app.post("/documents", status_code=status.HTTP_201_CREATED)
-async def post_documents(file: UploadFile, session_id: Annotated[str | None, Header()] = None):
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # The form is parsed before the endpoint runs, so a declared oversized body is refused here
+    # without reading it. Files of chunked uploads without a Content-Length are capped in save_stream.
+    limit = upload_limit(request.url.path) if request.method == "POST" else None
+    if limit is not None:
+        max_bytes, detail = limit
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and \
+                int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": detail})
+    return await call_next(request)
+
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy(request: Request, e: SchedulerBusyError):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(e)},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    # Registered last, so it runs first and also times the uploads refused above.
+    timings = collect_request_timings() if settings.server_timing_enabled else None
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        # The route template, not the path, so ids in paths do not create new series.
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(elapsed, request.method, route_path, str(status_code))
+        if logger.sampled(logging.INFO):
+            logger.info("request", method=request.method, route=route_path, status=status_code,
+                        duration_ms=round(1000 * elapsed, 1))
+    if timings is not None:
+        response.headers["Server-Timing"] = server_timing_header({**timings, "total": elapsed})
+    return response
+
+@app.post("/documents", status_code=status.HTTP_202_ACCEPTED)
+async def post_documents(file: UploadFile, components: AppComponents,
+                         session_id: Annotated[str | None, Header()] = None):
     if not file.filename.endswith(SUPPORTED_FILE_EXTENSION):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
-    content = await file.read()
-    file_path = await file_handler.save_file(content, extension=SUPPORTED_FILE_EXTENSION)
-    document_splits = await document_processor.process(file_path, session_id)
-    splits_ids = await vector_store.add_document(document_splits)
-
-    document_id = document_store.add_document(
-        file_path=file_path,
-        filename=file.filename,
-        splits_ids=splits_ids,
-        session_id=session_id
-    )
+    try:
+        file_path, file_hash = await components.file_handler.save_stream(file, extension=SUPPORTED_FILE_EXTENSION)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+    try:
+        job = components.ingestion_queue.submit(file_path, file.filename, session_id, file_hash=file_hash)
+    except QueueFullError as e:
+        await components.ingestion_queue.release_file(file_path, file_hash)
+        raise HTTPException(status_code=503, detail=str(e))
+    # Before answering, so the job can be looked up through any worker.
+    await components.ingestion_queue.publish(job)
     
-    return {"message": "Document uploaded successfully", "id": document_id}
+    return {"message": "Document accepted for processing", "job_id": job.id}
+
+@app.post("/documents/batch", status_code=status.HTTP_202_ACCEPTED)
+async def post_documents_batch(files: List[UploadFile], components: AppComponents,
+                               session_id: Annotated[str | None, Header()] = None):
+    if len(files) > settings.ingestion_batch_max_files:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ingestion_batch_max_files} files per batch")
+    if not all(file.filename.endswith(SUPPORTED_FILE_EXTENSION) for file in files):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
-@app.delete("/documents")
-async def delete_documents(session_id: Annotated[str | None, Header()] = None):
-    print(f"Deleting documents for session: {session_id}")
-    documents = document_store.get_documents(session_id)
+    saved = []
+    try:
+        for file in files:
+            file_path, file_hash = await components.file_handler.save_stream(file, extension=SUPPORTED_FILE_EXTENSION)
+            saved.append((file_path, file.filename, file_hash))
+        batch = components.ingestion_queue.submit_batch(saved, session_id)
+    except (FileTooLargeError, QueueFullError) as e:
+        for file_path, _, file_hash in saved:
+            await components.ingestion_queue.release_file(file_path, file_hash)
+        if isinstance(e, FileTooLargeError):
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+    await components.ingestion_queue.publish(batch)
     
-    for doc in documents:
-        file_path = Path(doc["file_path"])
-        await file_handler.delete_file(file_path)
-        
-        if "document_splits" in doc:
-            await vector_store.delete_documents(doc["document_splits"])
+    return {
+        "message": f"{len(saved)} documents accepted for processing",
+        "batch_id": batch.id,
+        "job_ids": [job.id for job in batch.jobs]
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    job = await components.ingestion_queue.find_job(job_id, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    batch = await components.ingestion_queue.find_batch(batch_id, session_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
     
-    deleted_count = document_store.delete_documents(session_id)
+@app.delete("/documents")
+async def delete_documents(components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    logger.info("deleting session documents", session_id=session_id)
+    started = time.time()
+    # Not while a re-index records new splits for these documents, which the delete would miss.
+    async with components.reindexer.splits_lock:
+        documents = await components.document_store.get_documents(session_id)
+        file_hashes = [doc["file_hash"] for doc in documents if doc.get("file_hash")]
+        other_owners = await components.document_store.find_other_owners(file_hashes, session_id)
+        pending = await components.ingestion_queue.pending_hashes(file_hashes)
+        
+        split_ids = []
+        shared_split_ids: Dict[str, List[str]] = {}
+        # File path -> content hash, of the files no one else uses.
+        file_paths: Dict[Path, Optional[str]] = {}
+        for doc in documents:
+            other_owner = other_owners.get(doc.get("file_hash"))
+            if other_owner is not None:
+                # The file and its chunks are shared with another session: only detach this one.
+                shared_split_ids.setdefault(other_owner, []).extend(components.document_store.split_ids(doc))
+                continue
+            if doc.get("file_hash") not in pending:
+                file_paths[Path(doc["file_path"])] = doc.get("file_hash")
+            split_ids.extend(components.document_store.split_ids(doc))
+        
+        for other_owner, owner_split_ids in shared_split_ids.items():
+            await components.vector_store.remove_owner(owner_split_ids, session_id, other_owner)
+        # Records first: a crash past this point leaves only unreferenced chunks and files,
+        # which the orphan reconciler removes.
+        deleted_count = await components.document_store.delete_documents(session_id)
+        # One call for all of the session's own chunks lets a per-session partition be dropped whole.
+        await components.vector_store.delete_documents(split_ids, session_id)
     
+    # An upload of the same content may have reused a file meanwhile: check again right before unlinking.
+    # Uploads reusing a file touch it, so the ones not yet submitted are left by modified_before.
+    file_hashes = [file_hash for file_hash in file_paths.values() if file_hash]
+    reused = set(await components.document_store.find_other_owners(file_hashes, session_id))
+    reused |= await components.ingestion_queue.pending_hashes(file_hashes)
+    await components.file_handler.delete_files(
+        [file_path for file_path, file_hash in file_paths.items() if file_hash not in reused],
+        modified_before=started
+    )
     return {"message": f"Successfully deleted {deleted_count} documents"}
 
 @app.get("/documents")
-async def get_documents(session_id: Annotated[str | None, Header()] = None):
-    print(f"Getting documents for session: {session_id}")
-    document_names = document_store.get_document_names(session_id)
+async def get_documents(components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    document_names = await components.document_store.get_document_names(session_id)
     return {"documents": document_names}
 
+@app.get("/stats")
+async def get_stats(components: AppComponents):
+    return {**await components.stats(), "startup": startup.to_dict()}
+
+@app.get("/healthz")
+async def get_healthz():
+    """Liveness: the process is up and its event loop responds, whether or not startup has finished."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def get_readyz():
+    """Readiness: components started and, with warm-up enabled, the models loaded. 503 until then."""
+    body = {"status": "ready" if startup.ready else "starting", **startup.to_dict()}
+    if not startup.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+    return body
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/reindex", status_code=status.HTTP_202_ACCEPTED)
+async def post_reindex(components: AppComponents):
+    """Rebuild the vector index for the current embedding and chunk settings, in the background."""
+    if not await components.reindexer.start():
+        raise HTTPException(status_code=409, detail="A re-index is already running")
+    return components.reindexer.to_dict()
+
+@app.get("/reindex")
+async def get_reindex(components: AppComponents):
+    return await components.reindexer.status()
+
+@app.post("/reconcile", status_code=status.HTTP_202_ACCEPTED)
+async def post_reconcile(components: AppComponents, dry_run: bool = False):
+    """Remove orphaned files, chunks and records in the background; dry_run only counts them."""
+    if not await components.reconciler.start(dry_run):
+        raise HTTPException(status_code=409, detail="A reconciliation is already running")
+    return components.reconciler.to_dict()
+
+@app.get("/reconcile")
+async def get_reconcile(components: AppComponents):
+    return await components.reconciler.status()
+
 @app.get("/messages")
-async def get_messages(session_id: Annotated[str | None, Header()] = None):
-    messages = assistant.get_message_history(session_id)
-    return {"messages": messages}
+async def get_messages(
+    components: AppComponents,
+    session_id: Annotated[str | None, Header()] = None,
+    limit: Annotated[int, Query(ge=1, le=settings.history_max_page_size)] = settings.history_page_size,
+    before: str | None = None,
+    after: str | None = None
+):
+    """Page through the history: the latest messages by default, older ones with before=<oldest id>,
+    newer ones with after=<newest id>. has_more tells whether another page exists in that direction."""
+    try:
+        messages, has_more = await components.assistant.get_message_history(
+            session_id, limit=limit, before=before, after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"messages": messages, "has_more": has_more}
 
 @app.delete("/messages")
-async def delete_messages(session_id: Annotated[str | None, Header()] = None):
-    assistant.delete_message_history(session_id)
+async def delete_messages(components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    await components.assistant.delete_message_history(session_id)
     return {"message": "Messages deleted successfully"}
 
 @app.post("/chat")
-async def chat(request: ChatRequest, session_id: Annotated[str | None, Header()] = None):
-    assistant_message = await assistant.ask(request.message, session_id)
+async def chat(request: ChatRequest, components: AppComponents, session_id: Annotated[str | None, Header()] = None):
+    assistant_message = await components.assistant.ask(request.message, session_id)
     return assistant_message
+
+def _sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, components: AppComponents,
+                      session_id: Annotated[str | None, Header()] = None):
+    # Checked before the stream starts, so a full queue is a 429 rather than an error event.
+    components.assistant.check_admission()
+    
+    async def events():
+        retrieval = {}
+        try:
+            async for token in components.assistant.astream(request.message, session_id, retrieval_info=retrieval):
+                yield _sse_event({"type": "token", "content": token})
+            done = {"type": "done", "retrieval": retrieval}
+            # The Server-Timing header went out before generation started, so the stages are sent here.
+            timings = current_request_timings()
+            if timings is not None:
+                done["timings_ms"] = {stage: round(1000 * seconds, 1) for stage, seconds in timings.items()}
+            yield _sse_event(done)
+        except SchedulerBusyError as e:
+            yield _sse_event({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.warning("chat stream failed", session_id=session_id, error=str(e))
+            yield _sse_event({"type": "error", "detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=settings.api_host, port=settings.api_port)
+    if settings.api_workers > 1:
+        from src.factories import ComponentFactory
+        ComponentFactory.check_shared_state_backends()
+        # Each worker process imports the app and builds its own components when it starts.
+        uvicorn.run("src.server:app", host=settings.api_host, port=settings.api_port, workers=settings.api_workers)
+    else:
+        uvicorn.run(app, host=settings.api_host, port=settings.api_port)
@@ -0,0 +1,94 @@
+import json
+import logging
+import random
+import sys
+from typing import Any
+
+ROOT_LOGGER = "rag"
+
+# Share of per-request events that are logged, see StructuredLogger.sampled().
+_sample_rate = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines with the event's fields as key=value pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        line = f"{line} {fields}" if fields else line
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+def configure_logging(level: str = "INFO", log_format: str = "json", sample_rate: float = 1.0) -> None:
+    """Send the application's logs to stdout. Other libraries' loggers, like uvicorn's, are left alone."""
+    global _sample_rate
+    _sample_rate = min(max(sample_rate, 0.0), 1.0)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+class StructuredLogger:
+    """Logger taking an event message plus keyword fields instead of a formatted string.
+
+    Warnings and errors are always logged. Events that happen on every request
+    are guarded with sampled(), which decides before any field is computed:
+
+        if logger.sampled():
+            logger.debug("context built", chunks=len(chunks))
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def sampled(self, level: int = logging.DEBUG) -> bool:
+        """Whether to log this occurrence of a per-request event at level, according to the sample rate."""
+        if _sample_rate <= 0.0 or not self._logger.isEnabledFor(level):
+            return False
+        return _sample_rate >= 1.0 or random.random() < _sample_rate
+
+    def _log(self, level: int, message: str, fields: Any, exc_info: bool = False) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, message: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields: Any) -> None:
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields: Any) -> None:
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message: str, **fields: Any) -> None:
+        """Log an error with the traceback of the exception being handled."""
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(name)
@@ -1,52 +1,326 @@
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
 from langchain.schema import Document
-from typing import List, Optional
-from chromadb import HttpClient
+from langchain_core.embeddings import Embeddings
+import asyncio
+import inspect
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Iterable, Set, Tuple
 from config.settings import settings
+from src.embedding_cache import EmbeddingCache, CachedEmbeddings
+from src.embedding_pipeline import EmbeddingPipeline, EmbeddingProgress
+from src.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from src.index_backends import ChromaIndex, NumpyIndex, VectorIndex, owner_key, metadata_sessions
+from src.index_generation import IndexGeneration, load_generation, save_generation
+from src.metrics import time_stage
+from src.model_scheduler import ModelScheduler
+from src.structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class VectorStore:
+    """Chunk embeddings of one index generation, searched densely and, optionally, with BM25.
+
+    Which generation is live is recorded in the file at generation_path: the
+    store follows it, reopening its index when a re-index swaps generations.
+    Passing generation instead pins the store to that generation, as the
+    re-indexer does for the shadow index it builds. Until a generation is
+    recorded, the store uses the unnamed generation and records it with the
+    given model and chunk settings.
+
+    Vectors come from the Ollama embedding model of the generation, unless
+    embeddings is given, which is then used for every generation. With a
+    scheduler, query and chunk embeddings are sent through it.
+    """
+
     def __init__(self, persist_directory: str, collection_name: str = "pdfs", model_name: str = "nomic-embed-text",
-                 chroma_client_type: str = "persistent", chroma_host: str = "0.0.0.0", chroma_port: int = 3020):
-        self.embeddings = OllamaEmbeddings(
-            model=model_name,
-            base_url=f"http://{settings.ollama_host}:{settings.ollama_port}"
-        )
+                 chroma_client_type: str = "persistent", chroma_host: str = "0.0.0.0", chroma_port: int = 3020,
+                 embedding_cache_path: Optional[str] = None, embedding_cache_max_entries: int = 200_000,
+                 embedding_batch_size: int = 32, embedding_min_batch_size: int = 8, embedding_max_batch_size: int = 256,
+                 embedding_max_in_flight: int = 4, embedding_target_batch_seconds: float = 2.0,
+                 keyword_index_path: Optional[str] = None, retrieval_fetch_k: int = 20, rrf_k: int = 60,
+                 index_backend: str = "chroma", numpy_index_dir: Optional[str] = None,
+                 numpy_index_compact_ratio: float = 0.3, partitioning: str = "none", partition_buckets: int = 64,
+                 generation_path: Optional[str] = None, generation: Optional[IndexGeneration] = None,
+                 chunk_size: int = 1000, chunk_overlap: int = 200, embeddings: Optional[Embeddings] = None,
+                 scheduler: Optional[ModelScheduler] = None):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.chroma_client_type = chroma_client_type
+        self.chroma_host = chroma_host
+        self.chroma_port = chroma_port
+        self.keyword_index_path = keyword_index_path
+        self.index_backend = index_backend
+        self.numpy_index_dir = numpy_index_dir or f"{persist_directory}/numpy_index"
+        self.numpy_index_compact_ratio = numpy_index_compact_ratio
+        self.partitioning = partitioning
+        self.partition_buckets = partition_buckets
+        self.embedding_cache = None
+        self.base_embeddings = embeddings
+        self.scheduler = scheduler
+        self._change_listeners: List[Callable[[Optional[Iterable[str]]], Any]] = []
+        self._listener_tasks: Set[asyncio.Task] = set()
+        if embedding_cache_path:
+            self.embedding_cache = EmbeddingCache(embedding_cache_path, max_entries=embedding_cache_max_entries)
+        self.retrieval_fetch_k = retrieval_fetch_k
+        self.rrf_k = rrf_k
+        # Store being rebuilt by a re-index; deletes are applied to it as well.
+        self.shadow: Optional["VectorStore"] = None
         
-        if chroma_client_type == "http":
-            chroma_client = HttpClient(host=chroma_host, port=chroma_port)
-            self.vector_store = Chroma(
-                client=chroma_client,
-                collection_name=collection_name,
-                embedding_function=self.embeddings,
+        self.generation_path = None if generation is not None or not generation_path else Path(generation_path)
+        self._generation_mtime: Optional[int] = None
+        if generation is None:
+            generation = self._read_generation()
+        if generation is None:
+            generation = IndexGeneration("", model_name, chunk_size, chunk_overlap)
+            if self.generation_path is not None:
+                save_generation(self.generation_path, generation)
+                self._read_generation()
+        self.generation = generation
+        self.embeddings = self._create_embeddings(generation)
+        # With a keyword index, searches fuse BM25 and dense results (hybrid retrieval).
+        self.keyword_index = self._create_keyword_index(generation)
+        self.index = self._create_index(generation)
+    
+        self.embedding_pipeline = EmbeddingPipeline(
+            self.embeddings,
+            self._upsert,
+            batch_size=embedding_batch_size,
+            min_batch_size=embedding_min_batch_size,
+            max_batch_size=embedding_max_batch_size,
+            max_in_flight=embedding_max_in_flight,
+            target_batch_seconds=embedding_target_batch_seconds,
+            scheduler=scheduler
+        )
+    
+    def _create_embeddings(self, generation: IndexGeneration):
+        embeddings = self.base_embeddings
+        if embeddings is None:
+            # The Ollama and Chroma modules are imported on first use, keeping them out of module import time.
+            from langchain_ollama import OllamaEmbeddings
+            embeddings = OllamaEmbeddings(
+                model=generation.embedding_model,
+                base_url=f"http://{settings.ollama_host}:{settings.ollama_port}",
+                keep_alive=settings.ollama_keep_alive_seconds
             )
-        elif chroma_client_type == "persistent":
-            self.vector_store = Chroma(
-                persist_directory=persist_directory,
-                collection_name=collection_name,
-                embedding_function=self.embeddings,
+        if self.embedding_cache is not None:
+            embeddings = CachedEmbeddings(embeddings, self.embedding_cache, generation.embedding_model)
+        return embeddings
+    
+    def _create_keyword_index(self, generation: IndexGeneration) -> Optional[KeywordIndex]:
+        if not self.keyword_index_path:
+            return None
+        return KeywordIndex(generation.resource_path(Path(self.keyword_index_path)))
+    
+    def _create_index(self, generation: IndexGeneration) -> VectorIndex:
+        if self.index_backend == "numpy":
+            return NumpyIndex(generation.resource_name(self.numpy_index_dir),
+                              compact_ratio=self.numpy_index_compact_ratio)
+        if self.chroma_client_type == "http":
+            from chromadb import HttpClient
+            chroma_client = HttpClient(host=self.chroma_host, port=self.chroma_port)
+        else:
+            from chromadb import PersistentClient
+            chroma_client = PersistentClient(path=self.persist_directory)
+        return ChromaIndex(chroma_client, generation.resource_name(self.collection_name),
+                           partitioning=self.partitioning, partition_buckets=self.partition_buckets)
+    
+    def _read_generation(self) -> Optional[IndexGeneration]:
+        if self.generation_path is None:
+            return None
+        try:
+            self._generation_mtime = os.stat(self.generation_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return load_generation(self.generation_path)
+    
+    def _follow_generation(self) -> None:
+        """Switch to the live generation if another store swapped it since the last call."""
+        if self.generation_path is None:
+            return
+        try:
+            mtime = os.stat(self.generation_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._generation_mtime:
+            return
+        generation = self._read_generation()
+        if generation is None or generation.name == self.generation.name:
+            return
+        self.generation = generation
+        self.embeddings = self.embedding_pipeline.embeddings = self._create_embeddings(generation)
+        self.keyword_index = self._create_keyword_index(generation)
+        self.index = self._create_index(generation)
+        self._notify_change(None)
+    
+    def set_shadow(self, shadow: Optional["VectorStore"]) -> None:
+        self.shadow = shadow
+    
+    def adopt(self, other: "VectorStore") -> Tuple[VectorIndex, Optional[KeywordIndex]]:
+        """Make other's generation live: record it and serve from its index from now on.
+        
+        Returns the previous index and keyword index, for the caller to drop.
+        """
+        previous = self.index, self.keyword_index
+        if self.generation_path is not None:
+            save_generation(self.generation_path, other.generation)
+            self._read_generation()
+        self.generation = other.generation
+        self.embeddings = self.embedding_pipeline.embeddings = other.embeddings
+        self.keyword_index = other.keyword_index
+        self.index = other.index
+        self.shadow = None
+        self._notify_change(None)
+        return previous
+    
+    def drop(self) -> None:
+        """Delete this store's index generation."""
+        self.index.drop()
+        if self.keyword_index is not None:
+            self.keyword_index.drop()
+    
+    def add_change_listener(self, listener: Callable[[Optional[Iterable[str]]], Any]) -> None:
+        """Register a callback receiving the sessions whose searchable chunks changed.
+        
+        A coroutine function is run as a background task, for listeners doing I/O.
+        """
+        self._change_listeners.append(listener)
+    
+    def _notify_change(self, session_ids: Optional[Iterable[str]]) -> None:
+        for listener in self._change_listeners:
+            result = listener(session_ids)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._listener_tasks.add(task)
+                task.add_done_callback(self._listener_done)
+    
+    def _listener_done(self, task: asyncio.Task) -> None:
+        self._listener_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("index change listener failed", error=str(task.exception()))
+    
+    async def warm_up(self) -> None:
+        """Load the embedding model with one request, past the cache so that it reaches Ollama."""
+        embeddings = self.embeddings.embeddings if isinstance(self.embeddings, CachedEmbeddings) else self.embeddings
+        await embeddings.aembed_query("warm-up")
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.embedding_cache.stats() if self.embedding_cache else None
+
+    async def _upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        with time_stage("vector_upsert"):
+            await asyncio.to_thread(self.index.upsert, ids, embeddings, documents)
+            if self.keyword_index is not None:
+                await asyncio.to_thread(
+                    self.keyword_index.add, ids, documents, [metadata_sessions(doc.metadata) for doc in documents]
+                )
+    
+    async def backfill_keyword_index(self, batch_size: int = 500) -> int:
+        """Index chunks stored before the keyword index existed. Only runs when the index is empty."""
+        if self.keyword_index is None or await asyncio.to_thread(self.keyword_index.count) > 0:
+            return 0
+        indexed = 0
+        batches = self.index.iterate(batch_size)
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                return indexed
+            ids, documents = batch
+            await asyncio.to_thread(
+                self.keyword_index.add, ids, documents, [metadata_sessions(doc.metadata) for doc in documents]
             )
+            indexed += len(ids)
     
-    async def add_document(self, documents: List[Document]) -> List[str]:
-        split_ids = await self.vector_store.aadd_documents(documents=documents)
+    async def iterate_chunks(self, batch_size: int = 500) -> AsyncIterator[Tuple[List[str], List[Document]]]:
+        """Every chunk of the live generation, in batches read in a worker thread."""
+        self._follow_generation()
+        batches = self.index.iterate(batch_size)
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                return
+            yield batch
+    
+    def has_unpartitioned_chunks(self) -> bool:
+        """Whether session chunks written before partitioning was enabled are still in the shared collection."""
+        return isinstance(self.index, ChromaIndex) and self.index.has_unpartitioned_chunks()
+    
+    async def add_document(self, documents: List[Document], ids: Optional[List[str]] = None,
+                           progress: Optional[EmbeddingProgress] = None) -> List[str]:
+        """Embed and store chunks through the batched embedding pipeline, returning their ids."""
+        self._follow_generation()
+        for doc in documents:
+            if doc.metadata.get("session_id"):
+                doc.metadata[owner_key(doc.metadata["session_id"])] = True
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        split_ids = await self.embedding_pipeline.run(ids, documents, progress)
+        self._notify_change({session for doc in documents for session in metadata_sessions(doc.metadata)})
         return split_ids
     
-    async def delete_documents(self, document_ids: List[str]) -> None:
+    async def delete_documents(self, document_ids: List[str], session_id: Optional[str] = None) -> None:
+        """Delete chunks; session_id, when known, is the only session holding them."""
+        self._follow_generation()
+        if self.shadow is not None:
+            await self.shadow.delete_documents(document_ids, session_id)
         if document_ids:
-            self.vector_store.delete(document_ids)
+            metadatas = await asyncio.to_thread(self.index.get_metadatas, document_ids, session_id)
+            await asyncio.to_thread(self.index.delete, document_ids, session_id)
+            if self.keyword_index is not None:
+                await asyncio.to_thread(self.keyword_index.delete, document_ids)
+            self._notify_change({session for metadata in metadatas for session in metadata_sessions(metadata)})
+    
+    async def add_owner(self, document_ids: List[str], session_id: str,
+                        source_session_id: Optional[str] = None) -> None:
+        """Make existing chunks visible to another session without re-embedding them.
+
+        source_session_id is a session that already sees the chunks, if known.
+        """
+        self._follow_generation()
+        if document_ids and session_id:
+            await asyncio.to_thread(self.index.add_owner, document_ids, session_id, source_session_id)
+            if self.keyword_index is not None:
+                await asyncio.to_thread(self.keyword_index.add_owner, document_ids, session_id)
+            self._notify_change({session_id})
+    
+    async def remove_owner(self, document_ids: List[str], session_id: str, remaining_owner: Optional[str]) -> None:
+        """Hide shared chunks from a session, handing the primary session_id to another owner."""
+        if not document_ids or not session_id:
+            return
+        self._follow_generation()
+        if self.shadow is not None:
+            await self.shadow.remove_owner(document_ids, session_id, remaining_owner)
+        await asyncio.to_thread(self.index.remove_owner, document_ids, session_id, remaining_owner)
+        if self.keyword_index is not None:
+            await asyncio.to_thread(self.keyword_index.remove_owner, document_ids, session_id)
+            if remaining_owner:
+                await asyncio.to_thread(self.keyword_index.add_owner, document_ids, remaining_owner)
+        self._notify_change({session_id})
     
-    async def search_documents(self, query: str, session_id: Optional[str] = None, k: int = 2) -> List[dict]:
+    async def embed_query(self, query: str) -> List[float]:
+        self._follow_generation()
+        with time_stage("query_embed"):
+            if self.scheduler is not None:
+                return await self.scheduler.embed_query(self.embeddings, query)
+            return await self.embeddings.aembed_query(query)
+    
+    async def search_documents(self, query: str, session_id: Optional[str] = None, k: int = 2,
+                               embedding: Optional[List[float]] = None) -> List[dict]:
         try:
-            if session_id:
-                docs = self.vector_store.similarity_search(
-                    query, 
-                    k=k,
-                    filter={"session_id": session_id}
-                )
-            else:
-                docs = self.vector_store.similarity_search(query, k=k)
+            self._follow_generation()
+            fetch_k = max(k, self.retrieval_fetch_k) if self.keyword_index is not None else k
+            if embedding is None:
+                embedding = await self.embed_query(query)
+            with time_stage("search"):
+                dense_search = asyncio.to_thread(self.index.search, embedding, fetch_k, session_id)
                 
-            return docs
+                if self.keyword_index is None:
+                    return await dense_search
+                
+                docs, lexical = await asyncio.gather(
+                    dense_search,
+                    asyncio.to_thread(self.keyword_index.search, query, session_id, fetch_k)
+                )
+                return reciprocal_rank_fusion([docs, [doc for doc, _ in lexical]], k=self.rrf_k)[:k]
         except Exception as e:
-            print(f"Error in search_documents: {str(e)}")
+            logger.error("search failed", error=str(e))
             return [] 
\ No newline at end of file
@@ -0,0 +1,37 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fakes import FakeChatModel, fake_clients
+from src.assistant import PDFAssistant
+
+WINDOW = 4
+
+
+def make_assistant() -> PDFAssistant:
+    history_client, _ = fake_clients()
+    return PDFAssistant(
+        persist_directory="", model_name="fake", mongo_uri="", mongo_db_name="test",
+        mongo_message_history_collection="history", history_window_messages=WINDOW,
+        history_summary_enabled=True, vector_store=SimpleNamespace(), model=FakeChatModel(answer_tokens=5),
+        history_client=history_client
+    )
+
+
+def test_first_summary_folds_the_oldest_messages_and_keeps_the_window():
+    assistant = make_assistant()
+    store = assistant._get_message_history_store("session")
+    store.add_messages([
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"message-{i}") for i in range(2 * WINDOW)
+    ])
+    ids = [message.id for message in store.page(2 * WINDOW)[0]]
+
+    asyncio.run(assistant._summarize("session"))
+
+    summary, through_id = assistant.summaries.get("session")
+    assert summary
+    assert str(through_id) == ids[WINDOW - 1]
+    lines = assistant._get_conversation("session").splitlines()
+    assert lines[0].startswith("Summary of earlier conversation: ")
+    assert [line.split(": ", 1)[1] for line in lines[1:]] == [f"message-{i}" for i in range(WINDOW, 2 * WINDOW)]
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.upload_memory import BOUND_CHUNKS, BOUND_OVERHEAD, run_one, write_source
+from config.settings import settings
+from src import server
+from src.file_handler import FileHandler
+
+CHUNK_SIZE = 256 * 1024
+MAX_BYTES = 4 * 1024 * 1024
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # No lifespan: the components are never built, so requests passing the size check get a 503.
+    handler = FileHandler(tmp_path / "documents", chunk_size=CHUNK_SIZE, max_bytes=MAX_BYTES)
+    monkeypatch.setattr(server.startup, "components", SimpleNamespace(file_handler=handler))
+    monkeypatch.setattr(settings, "upload_batch_max_bytes", 2 * MAX_BYTES)
+    return TestClient(server.app)
+
+
+def pdf_of(size: int):
+    return ("upload.pdf", b"\0" * size, "application/pdf")
+
+
+def test_declared_oversized_upload_is_refused(client):
+    response = client.post("/documents", files={"file": pdf_of(MAX_BYTES + server.MULTIPART_OVERHEAD_BYTES + 1)})
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"File exceeds the {MAX_BYTES} byte upload limit"
+
+
+def test_upload_within_the_limit_reaches_the_endpoint(client):
+    assert client.post("/documents", files={"file": pdf_of(MAX_BYTES)}).status_code == 503
+
+
+def test_declared_oversized_batch_is_refused(client):
+    files = [("files", pdf_of(MAX_BYTES)) for _ in range(3)]
+    response = client.post("/documents/batch", files=files)
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"Batch exceeds the {2 * MAX_BYTES} byte upload limit"
+    assert client.post("/documents/batch", files=files[:2]).status_code == 503
+
+
+@pytest.mark.parametrize("max_bytes", [None, MAX_BYTES])
+def test_streaming_an_upload_keeps_memory_within_a_few_chunks(tmp_path, max_bytes):
+    source = tmp_path / "upload.pdf"
+    write_source(source, 16 * MAX_BYTES, CHUNK_SIZE)
+    handler = FileHandler(tmp_path / "documents", chunk_size=CHUNK_SIZE)
+
+    result = asyncio.run(run_one(handler, source, max_bytes))
+
+    assert result["outcome"] == ("saved" if max_bytes is None else "rejected")
+    assert result["peak_bytes"] <= BOUND_CHUNKS * CHUNK_SIZE + BOUND_OVERHEAD
+    assert list((tmp_path / "documents").iterdir()) == []
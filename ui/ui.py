@@ -1,12 +1,18 @@
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
+import json
+import time
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
 from streamlit_cookies_controller import CookieController
 from uuid import uuid4
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+MESSAGES_PAGE_SIZE = 100
 
 st.set_page_config(
     page_title="Research Assistant",
@@ -20,24 +26,49 @@ if "first_run" in st.session_state and session_id == None:
     session_id = uuid4().hex
     cookie_controller.set("session_id", session_id)
 print("session_id", session_id)
-requests_session = requests.Session()
-requests_session.headers.update(
-    { "session-id": session_id }
-)
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """One HTTP session for every user and rerun, so connections to the API are pooled and kept alive.
+
+    The session id header differs per user, so it is sent with each request instead.
+    """
+    http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+    http_session.mount("http://", adapter)
+    http_session.mount("https://", adapter)
+    return http_session
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# Id of the newest message in st.session_state.messages, from which new messages are fetched.
+if "messages_cursor" not in st.session_state:
+    st.session_state.messages_cursor = None
+if "messages_loaded" not in st.session_state:
+    st.session_state.messages_loaded = False
 if "conversation_id" not in st.session_state:
     st.session_state.conversation_id = None
+# None until fetched, and again once an upload or a refresh makes the cached list stale.
 if "documents" not in st.session_state:
-    st.session_state.documents = []
+    st.session_state.documents = None
+if "api_calls" not in st.session_state:
+    st.session_state.api_calls = 0
+# Counted per script run, that is per user interaction.
+st.session_state.api_calls_this_run = 0
+
+def api_request(method: str, path: str, **kwargs) -> requests.Response:
+    """Send a request to the API for this user's session, counting it."""
+    st.session_state.api_calls += 1
+    st.session_state.api_calls_this_run += 1
+    headers = {"session-id": session_id} if session_id else {}
+    return get_http_session().request(method, f"{API_URL}{path}", headers=headers, **kwargs)
 
 def fetch_documents() -> List[str]:
     """
     Get the list of names of the documents
     """
     try:
-        response = requests_session.get(f"{API_URL}/documents")
+        response = api_request("GET", "/documents")
         if response.status_code == 200:
             return response.json()["documents"]
         else:
@@ -47,17 +78,52 @@ def fetch_documents() -> List[str]:
         st.error(f"Error connecting to API: {str(e)}")
         return []
 
+def get_documents() -> List[str]:
+    """The document names, fetched only when the cached list is missing or stale."""
+    if st.session_state.documents is None:
+        st.session_state.documents = fetch_documents()
+    return st.session_state.documents
+
+def wait_for_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Poll an ingestion job until it completes or fails."""
+    progress = st.progress(0.0, text="Queued...")
+    while True:
+        response = api_request("GET", f"/jobs/{job_id}")
+        if response.status_code != 200:
+            st.error(f"Error fetching job status: {response.text}")
+            return None
+
+        job = response.json()
+        if job["stage"] in ("completed", "failed"):
+            progress.empty()
+            return job
+
+        fraction = job["chunks_embedded"] / job["chunks_total"] if job["chunks_total"] else 0.0
+        progress.progress(
+            fraction,
+            text=f"{job['stage'].capitalize()}... {job['chunks_embedded']}/{job['chunks_total']} chunks",
+        )
+        time.sleep(JOB_POLL_INTERVAL)
+
+
 def upload_document(file) -> bool:
-    """Upload a document to the API."""
+    """Upload a document to the API and wait for it to be processed."""
     try:
         files = {"file": (file.name, file, "application/pdf")}
-        response = requests_session.post(f"{API_URL}/documents", files=files)
-        if response.status_code == 201:
-            st.success("Document uploaded successfully!")
-            return True
-        else:
+        response = api_request("POST", "/documents", files=files)
+        if response.status_code != 202:
             st.error(f"Error uploading document: {response.text}")
             return False
+
+        job = wait_for_job(response.json()["job_id"])
+        if job is None:
+            return False
+        if job["stage"] == "failed":
+            st.error(f"Error processing document: {job['error']}")
+            return False
+
+        st.success("Document uploaded successfully!")
+        return True
     except Exception as e:
         st.error(f"Error connecting to API: {str(e)}")
         return False
@@ -66,7 +132,7 @@ def upload_document(file) -> bool:
 def delete_all_documents() -> bool:
     """Delete all documents from the collection."""
     try:
-        response = requests_session.delete(f"{API_URL}/documents")
+        response = api_request("DELETE", "/documents")
         if response.status_code == 200:
             st.success("All documents deleted successfully!")
             return True
@@ -78,32 +144,60 @@ def delete_all_documents() -> bool:
         return False
 
 
-def get_messages():
-    response = requests_session.get(f"{API_URL}/messages")
-    if response.status_code == 200:
-        data = response.json()
-        print("DATA", data)
-        return [{"content": d["content"], "type": d["type"]} for d in data["messages"]]
+def sync_messages() -> None:
+    """Append the messages stored since the cursor to st.session_state.messages.
+
+    The first call loads the latest page of the history; later ones ask only
+    for newer messages, so a rerun never fetches the whole conversation again.
+    """
+    try:
+        while True:
+            params = {"limit": MESSAGES_PAGE_SIZE}
+            if st.session_state.messages_cursor is not None:
+                params["after"] = st.session_state.messages_cursor
+            response = api_request("GET", "/messages", params=params)
+            if response.status_code != 200:
+                st.error(f"Error fetching messages: {response.text}")
+                return
+            data = response.json()
+            st.session_state.messages.extend(
+                {"id": d["id"], "content": d["content"], "type": d["type"]} for d in data["messages"]
+            )
+            if data["messages"]:
+                st.session_state.messages_cursor = data["messages"][-1]["id"]
+            st.session_state.messages_loaded = True
+            # Without a cursor, has_more refers to older messages, which are not shown.
+            if not data["has_more"] or "after" not in params:
+                return
+    except Exception as e:
+        st.error(f"Error connecting to API: {str(e)}")
 
 
-def send_message(message: str) -> Optional[Dict[str, Any]]:
-    """Send a message to the API and get a response."""
+def stream_message(message: str) -> Iterator[str]:
+    """Send a message to the API and yield the answer tokens as they arrive."""
     try:
         payload = {
             "message": message,
         }
 
-        response = requests_session.post(f"{API_URL}/chat", json=payload)
+        with api_request("POST", "/chat/stream", json=payload, stream=True) as response:
+            if response.status_code != 200:
+                st.error(f"Error sending message: {response.text}")
+                return
 
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        else:
-            st.error(f"Error sending message: {response.text}")
-            return None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "error":
+                    st.error(f"Error generating answer: {event['detail']}")
+                    return
+                elif event["type"] == "done":
+                    return
     except Exception as e:
         st.error(f"Error connecting to API: {str(e)}")
-        return None
 
 
 def display_chat_message(message: Dict[str, Any]):
@@ -116,13 +210,10 @@ def display_chat_message(message: Dict[str, Any]):
             st.write(message["content"])
 
 def clear_conversation():
-    response = requests_session.delete(f"{API_URL}/messages")
+    response = api_request("DELETE", "/messages")
     if response.status_code == 200:
         st.session_state.messages = []
-
-if not "documents_fetched" in st.session_state and "first_run" in st.session_state:
-    st.session_state.documents_fetched = True
-    st.session_state.documents = fetch_documents()
+        st.session_state.messages_cursor = None
 
 def main():
     """Main function to run the Streamlit app."""
@@ -136,24 +227,25 @@ def main():
                 with st.spinner("Uploading and processing document..."):
                     success = upload_document(uploaded_file)
                     if success:
-                        st.session_state.documents = fetch_documents()
+                        st.session_state.documents = None
                         st.session_state.upload_key = st.session_state.get('upload_key', 0) + 1
                         st.rerun()
 
         st.subheader("Available Documents")
         if st.button("Refresh Documents", use_container_width=True):
-            with st.spinner("Fetching documents..."):
-                st.session_state.documents = fetch_documents()
+            st.session_state.documents = None
 
-        if st.session_state.documents:
-            for doc in st.session_state.documents:
+        # The session id cookie is only readable from the second run on.
+        documents = get_documents() if "first_run" in st.session_state else []
+        if documents:
+            for doc in documents:
                 st.text(f"• {doc}")
         else:
             st.info("No documents available. Upload a PDF to get started.")
 
         st.subheader("Delete Documents")
         if st.button("Delete All Documents", type="primary", use_container_width=True):
-            if st.session_state.documents:
+            if documents:
                 with st.spinner("Deleting all documents..."):
                     success = delete_all_documents()
                     if success:
@@ -169,17 +261,24 @@ def main():
 
     st.header("Chat with your Documents")
 
-    for message in get_messages():
+    if not st.session_state.messages_loaded and "first_run" in st.session_state:
+        sync_messages()
+    for message in st.session_state.messages:
         display_chat_message(message)
 
     if prompt := st.chat_input("Ask a question about your documents..."):
         user_message = {"type": "human", "content": prompt}
         display_chat_message(user_message)
 
-        with st.spinner("Thinking..."):
-            response = send_message(prompt)
-            print("response", response)
-            display_chat_message(response)
+        with st.chat_message("assistant"):
+            st.write_stream(stream_message(prompt))
+        # Picks up the question and answer as stored, with their ids; both are already on screen.
+        sync_messages()
+
+    st.sidebar.caption(
+        f"API calls: {st.session_state.api_calls_this_run} for this interaction, "
+        f"{st.session_state.api_calls} this session"
+    )
 
     if not "first_run" in st.session_state:
         st.session_state.first_run = True